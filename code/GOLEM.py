@@ -13,6 +13,10 @@ Sections:
 Author: GOLEM Team (Refactored Version)
 """
 
+import os
+import glob
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -20,6 +24,16 @@ import matplotlib.gridspec as gridspec
 from matplotlib.colors import LinearSegmentedColormap
 import xarray as xr
 from typing import Dict, List, Tuple, Union, Callable, Optional, Any
+# Optional: scipy provides the KD-tree for point extraction on curvilinear grids
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None # Handle case where scipy is not installed
+# Optional: dask provides chunked arrays for lazy NetCDF reads
+try:
+    import dask
+except ImportError:
+    dask = None # Handle case where dask is not installed
 
 #####################################
 # Data Processing Functions
@@ -51,30 +65,44 @@ def calculate_exceedances(data: np.ndarray, threshold: float = 120.0) -> np.ndar
     """
     return np.where(data >= threshold, 1, 0)
 
-def read_netcdf(file_path: str, variables: List[str] = None) -> Dict[str, np.ndarray]:
+def read_netcdf(file_path: str, variables: List[str] = None, sel: Optional[Dict[str, Any]] = None,
+                isel: Optional[Dict[str, Any]] = None, lazy: bool = False,
+                chunks: Optional[Union[str, Dict[str, int]]] = None) -> Dict[str, Union[np.ndarray, xr.DataArray]]:
     """
     Read specified variables from a NetCDF file.
 
+    The file is opened lazily and the variable, sel and isel selections are
+    applied before any data is read, so only the selected hyperslab is loaded
+    from disk, e.g. one season or a small region of a multi-GB hourly file.
+    With lazy=True nothing is read at all: the variables are returned as
+    xarray DataArrays that read (and compute) on demand.
+
     Args:
         file_path: Path to the NetCDF file.
         variables: Optional list of variable names to extract. If None, extracts all data variables.
+        sel: Optional label-based selection per coordinate, e.g.
+             {'time': slice('2020-06-01', '2020-08-31'), 'lat': slice(45, 50)}.
+        isel: Optional index-based selection per dimension, e.g. {'time': slice(0, 24)}.
+              Dimensions a variable does not have are ignored.
+        lazy: If True, return unloaded xarray DataArrays instead of NumPy arrays.
+              The file stays open until the arrays are garbage collected.
+        chunks: Optional dask chunk sizes, e.g. {'time': 24}, for chunked arrays that
+                are computed in parallel and out of core. Implies lazy=True and
+                requires dask; without dask, lazily indexed arrays are returned.
 
     Returns:
         A dictionary where keys are variable names and values are the corresponding
-        NumPy arrays. Returns an empty dictionary if an error occurs.
+        NumPy arrays, or xarray DataArrays if lazy. Returns an empty dictionary if an
+        error occurs.
     """
-    try:
-        with xr.open_dataset(file_path) as ds:
-            result = {}
-            var_list = variables if variables is not None else list(ds.data_vars)
-
-            for var in var_list:
-                if var in ds:
-                    result[var] = ds[var].values
-                else:
-                     print(f"Warning: Variable '{var}' not found in {file_path}")
+    if chunks is not None:
+        lazy = True
+        if dask is None:
+            print("Warning: dask is not installed; returning lazily indexed arrays without chunks.")
+            chunks = None
 
-            return result
+    try:
+        ds = xr.open_dataset(file_path, chunks=chunks)
     except FileNotFoundError:
         print(f"Error: NetCDF file not found at {file_path}")
         return {}
@@ -82,6 +110,308 @@ def read_netcdf(file_path: str, variables: List[str] = None) -> Dict[str, np.nda
         print(f"Error reading NetCDF file '{file_path}': {e}")
         return {}
 
+    try:
+        var_list = variables if variables is not None else list(ds.data_vars)
+        for var in var_list:
+            if var not in ds:
+                 print(f"Warning: Variable '{var}' not found in {file_path}")
+
+        # Selections only index the lazy arrays; no data is read yet
+        subset = ds[[var for var in var_list if var in ds]]
+        if isel:
+            subset = subset.isel(isel, missing_dims='ignore')
+        if sel:
+            subset = subset.sel(sel)
+
+        if lazy:
+            return {var: subset[var] for var in subset.data_vars}
+
+        result = {var: subset[var].values for var in subset.data_vars}
+        ds.close()
+        return result
+    except Exception as e:
+        ds.close()
+        print(f"Error reading NetCDF file '{file_path}': {e}")
+        return {}
+
+NETCDF_INDEX_NAME = '.golem_netcdf_index.json'
+NETCDF_INDEX_VERSION = 1
+
+def _time_string(value: Any) -> str:
+    """
+    Format a time value as an ISO 8601 string.
+
+    Args:
+        value: NumPy datetime64, datetime, pandas Timestamp, cftime date or string.
+
+    Returns:
+        The time as 'YYYY-MM-DDTHH:MM:SS'; strings are returned unchanged, so
+        partial dates such as '2020-06' keep their precision.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, np.datetime64):
+        return np.datetime_as_string(value, unit='s')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return pd.Timestamp(value).isoformat()
+
+def _grid_hash(ds: xr.Dataset) -> Optional[str]:
+    """
+    Hash the horizontal coordinates of a dataset.
+
+    Args:
+        ds: xarray Dataset.
+
+    Returns:
+        A short hex digest of the latitude and longitude coordinates, or None
+        if the dataset has none.
+    """
+    digest = hashlib.sha1()
+    found = False
+    for name in ('lat', 'latitude', 'XLAT', 'lon', 'longitude', 'XLONG'):
+        if name in ds.variables:
+            values = np.ascontiguousarray(ds[name].values, dtype=np.float64)
+            digest.update(name.encode())
+            digest.update(str(values.shape).encode())
+            digest.update(values.tobytes())
+            found = True
+    return digest.hexdigest()[:16] if found else None
+
+class NetCDFArchive:
+    """
+    Indexed collection of NetCDF files forming one or several time series.
+
+    The index records for every file its size and modification time, time
+    range, variables, dimension sizes and a hash of the horizontal grid. It
+    is persisted as JSON (by default in the archive root), so opening the
+    same archive again only stats the files and rescans those that changed.
+    Time-range queries open only the files that overlap the range.
+
+    Attributes:
+        root: Absolute path of the archive folder.
+        pattern: Glob pattern of the files, relative to root.
+        index_file: Path of the JSON index.
+        time_dim: Name of the time coordinate.
+        entries: Index entries keyed by file path relative to root.
+    """
+
+    def __init__(self, root: str, pattern: str = '**/*.nc', index_file: Optional[str] = None,
+                 time_dim: str = 'time'):
+        """
+        Load the index of an archive and bring it up to date.
+
+        Args:
+            root: Folder containing the NetCDF files.
+            pattern: Glob pattern of the files relative to root; '**' matches
+                     subfolders. Defaults to '**/*.nc'.
+            index_file: Path of the JSON index. Defaults to NETCDF_INDEX_NAME in root.
+            time_dim: Name of the time coordinate. Defaults to 'time'.
+        """
+        self.root = os.path.abspath(root)
+        self.pattern = pattern
+        self.index_file = index_file or os.path.join(self.root, NETCDF_INDEX_NAME)
+        self.time_dim = time_dim
+        self.entries = {}
+
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                if index.get('version') == NETCDF_INDEX_VERSION and index.get('time_dim') == time_dim:
+                    self.entries = index['files']
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable index '{self.index_file}': {e}")
+
+        self.update()
+
+    def _scan_file(self, path: str) -> Dict[str, Any]:
+        """Read the index entry of one file from its header and time coordinate."""
+        stat = os.stat(path)
+        with xr.open_dataset(path) as ds:
+            entry = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'variables': sorted(str(var) for var in ds.data_vars),
+                'dims': {str(dim): int(size) for dim, size in ds.sizes.items()},
+                'grid': _grid_hash(ds),
+                'time_start': None,
+                'time_end': None,
+                'n_times': 0,
+            }
+            if self.time_dim in ds.coords and ds[self.time_dim].size > 0:
+                times = ds[self.time_dim].values
+                entry['time_start'] = _time_string(times.min())
+                entry['time_end'] = _time_string(times.max())
+                entry['n_times'] = int(times.size)
+        return entry
+
+    def update(self) -> List[str]:
+        """
+        Rescan new and changed files, drop removed ones and save the index.
+
+        Returns:
+            List of the files (relative to root) that were scanned.
+        """
+        scanned = []
+        entries = {}
+
+        for path in sorted(glob.glob(os.path.join(self.root, self.pattern), recursive=True)):
+            rel_path = os.path.relpath(path, self.root)
+            stat = os.stat(path)
+            entry = self.entries.get(rel_path)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                try:
+                    entry = self._scan_file(path)
+                except Exception as e:
+                    print(f"Warning: Skipping '{path}': {e}")
+                    continue
+                scanned.append(rel_path)
+            entries[rel_path] = entry
+
+        changed = bool(scanned) or entries.keys() != self.entries.keys()
+        self.entries = entries
+        if changed:
+            self.save()
+
+        return scanned
+
+    def save(self) -> None:
+        """Write the index to index_file."""
+        index = {'version': NETCDF_INDEX_VERSION, 'time_dim': self.time_dim, 'files': self.entries}
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_file, self.index_file)
+
+    def files(self, start: Any = None, end: Any = None, variables: List[str] = None,
+              grid: Optional[str] = None) -> List[str]:
+        """
+        Find the files overlapping a time range.
+
+        Args:
+            start: Start of the range, inclusive, e.g. '2020-06' or a datetime.
+                   Partial dates are compared at their own precision.
+            end: End of the range, inclusive, e.g. '2020-08' for all of August.
+            variables: Optional list of variables the files must all contain.
+            grid: Optional grid hash the files must have (see summary()).
+
+        Returns:
+            Absolute file paths sorted by their first time. Files without a time
+            coordinate are only returned if neither start nor end is given.
+        """
+        start = None if start is None else _time_string(start)
+        end = None if end is None else _time_string(end)
+        selected = []
+
+        for rel_path, entry in self.entries.items():
+            if variables and not set(variables) <= set(entry['variables']):
+                continue
+            if grid is not None and entry['grid'] != grid:
+                continue
+            if start is not None or end is not None:
+                if entry['time_start'] is None:
+                    continue
+                if start is not None and entry['time_end'][:len(start)] < start:
+                    continue
+                if end is not None and entry['time_start'][:len(end)] > end:
+                    continue
+            selected.append(rel_path)
+
+        selected.sort(key=lambda rel_path: (self.entries[rel_path]['time_start'] or '', rel_path))
+        return [os.path.join(self.root, rel_path) for rel_path in selected]
+
+    def open(self, start: Any = None, end: Any = None, variables: List[str] = None,
+             grid: Optional[str] = None, chunks: Optional[Union[str, Dict[str, int]]] = None) -> xr.Dataset:
+        """
+        Open the time series of a range as one dataset.
+
+        Only the overlapping files are opened; each is cut to the range before
+        concatenation along time, and duplicate times of overlapping files are
+        dropped (the earlier file wins).
+
+        Args:
+            start: Start of the range, inclusive (see files()).
+            end: End of the range, inclusive (see files()).
+            variables: Optional list of variables to read.
+            grid: Optional grid hash to restrict the files to.
+            chunks: Optional dask chunk sizes; the data then stay lazy. Without
+                    chunks the selected data are loaded and the files closed.
+
+        Returns:
+            An xarray Dataset with the selected variables and time range.
+
+        Raises:
+            ValueError: If no file matches or the files are on different grids.
+        """
+        files = self.files(start, end, variables, grid)
+        if not files:
+            raise ValueError(f"No files in '{self.root}' match the range {start} to {end} and variables {variables}.")
+        grids = {self.entries[os.path.relpath(path, self.root)]['grid'] for path in files}
+        if len(grids) > 1:
+            raise ValueError(f"Matching files are on {len(grids)} different grids {sorted(map(str, grids))}; select one with grid=.")
+        if chunks is not None and dask is None:
+            print("Warning: dask is not installed; loading the data without chunks.")
+            chunks = None
+
+        time_range = slice(None if start is None else _time_string(start), None if end is None else _time_string(end))
+        datasets = []
+        for path in files:
+            ds = xr.open_dataset(path, chunks=chunks)
+            if variables:
+                ds = ds[variables]
+            if self.time_dim in ds.indexes and (start is not None or end is not None):
+                ds = ds.sel({self.time_dim: time_range})
+            datasets.append(ds)
+
+        if len(datasets) == 1:
+            combined = datasets[0]
+        else:
+            combined = xr.concat(datasets, dim=self.time_dim, data_vars='minimal', coords='minimal',
+                                 compat='override', join='override')
+        if self.time_dim in combined.indexes:
+            combined = combined.drop_duplicates(self.time_dim)
+
+        if chunks is None:
+            combined = combined.load()
+            for ds in datasets:
+                ds.close()
+
+        return combined
+
+    def read(self, start: Any = None, end: Any = None, variables: List[str] = None,
+             grid: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Read the time series of a range as NumPy arrays, like read_netcdf.
+
+        Args:
+            start: Start of the range, inclusive (see files()).
+            end: End of the range, inclusive (see files()).
+            variables: Optional list of variables to read. Defaults to all.
+            grid: Optional grid hash to restrict the files to.
+
+        Returns:
+            A dictionary of variable names and NumPy arrays, concatenated along time.
+        """
+        ds = self.open(start, end, variables, grid)
+        return {str(var): ds[var].values for var in ds.data_vars}
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Tabulate the index.
+
+        Returns:
+            A Pandas DataFrame with one row per file (relative path as index) and
+            the columns 'time_start', 'time_end', 'n_times', 'grid', 'variables'
+            and 'size', sorted by time.
+        """
+        columns = ['time_start', 'time_end', 'n_times', 'grid', 'variables', 'size']
+        table = pd.DataFrame.from_dict(self.entries, orient='index', columns=columns)
+        return table.sort_values(['time_start']).rename_axis('file')
+
+    def __repr__(self) -> str:
+        return f"NetCDFArchive('{self.root}', n_files={len(self.entries)})"
+
 def filter_by_altitude(data: pd.DataFrame, alt_col: str = 'altitude', max_alt: float = 1500) -> pd.DataFrame:
     """
     Filter a Pandas DataFrame based on a maximum altitude threshold.
@@ -103,64 +433,249 @@ def filter_by_altitude(data: pd.DataFrame, alt_col: str = 'altitude', max_alt: f
 
     return data[data[alt_col] < max_alt].copy() # Return a copy to avoid SettingWithCopyWarning
 
-def filter_by_season(data: pd.DataFrame, date_col: str = 'date', season: str = 'JJA') -> pd.DataFrame:
+SEASON_MONTHS = {
+    'DJF': (12, 1, 2),
+    'MAM': (3, 4, 5),
+    'JJA': (6, 7, 8),
+    'SON': (9, 10, 11)
+}
+
+class SeasonIndex:
+    """
+    Compact season and year codes of a series of dates.
+
+    The dates are decoded once into an int8 season code and an integer year
+    per date; filtering, grouping and aggregating by season then work on
+    these arrays instead of rebuilding a DatetimeIndex and a month mask for
+    every season. Season definitions are configurable, and years can start
+    in any month, e.g. in October for hydrological years or in December so
+    that a DJF season falls into one year.
+
+    Attributes:
+        seasons: Dictionary of season names and their months.
+        names: Season names, in the order of their codes.
+        codes: int8 NumPy array of the season code of every date; -1 for dates
+               in no season and for missing dates.
+        years: int NumPy array of the (hydrological) year of every date, named
+               after the calendar year in which it ends.
+        year_start_month: First month of the year.
+    """
+
+    def __init__(self, dates: Union[pd.DatetimeIndex, pd.Series, np.ndarray],
+                 seasons: Optional[Dict[str, Tuple[int, ...]]] = None, year_start_month: int = 1):
+        """
+        Encode the season and year of every date.
+
+        Args:
+            dates: Dates as a DatetimeIndex, Series or array convertible to one.
+            seasons: Optional dictionary of season names and months, e.g.
+                     {'ONDJFM': (10, 11, 12, 1, 2, 3), 'AMJJAS': (4, 5, 6, 7, 8, 9)}.
+                     Defaults to the meteorological seasons SEASON_MONTHS.
+            year_start_month: First month of the year. Defaults to 1 (calendar years);
+                              10 gives hydrological years from October to September.
+
+        Raises:
+            ValueError: If a month is invalid or belongs to more than one season.
+            TypeError: If the dates cannot be converted to a DatetimeIndex.
+        """
+        self.seasons = dict(SEASON_MONTHS if seasons is None else seasons)
+        self.names = list(self.seasons)
+        self.year_start_month = int(year_start_month)
+        if not 1 <= self.year_start_month <= 12:
+            raise ValueError(f"year_start_month must be between 1 and 12, but got {year_start_month}.")
+
+        month_to_code = np.full(13, -1, dtype=np.int8)
+        for code, months in enumerate(self.seasons.values()):
+            for month in months:
+                if not 1 <= month <= 12:
+                    raise ValueError(f"Invalid month {month} in season '{self.names[code]}'.")
+                if month_to_code[month] != -1:
+                    raise ValueError(f"Month {month} belongs to more than one season.")
+                month_to_code[month] = code
+
+        try:
+            datetime_index = pd.DatetimeIndex(dates)
+        except Exception as e:
+            raise TypeError(f"Could not convert dates to DatetimeIndex. Error: {e}")
+
+        # Missing dates (NaT) get month 0, which belongs to no season
+        months = np.nan_to_num(np.asarray(datetime_index.month, dtype=float)).astype(np.int8)
+        years = np.nan_to_num(np.asarray(datetime_index.year, dtype=float)).astype(np.int32)
+        self.codes = month_to_code[months]
+        self.years = years + (months >= self.year_start_month) if self.year_start_month > 1 else years
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def code(self, season: str) -> int:
+        """
+        Code of a season.
+
+        Args:
+            season: Season name.
+
+        Returns:
+            The index of the season in names.
+
+        Raises:
+            ValueError: If the season is not defined.
+        """
+        if season not in self.seasons:
+            raise ValueError(f"Unknown season code: '{season}'. Valid codes are {', '.join(self.names)}.")
+        return self.names.index(season)
+
+    def mask(self, season: str) -> np.ndarray:
+        """Boolean NumPy array marking the dates of a season."""
+        return self.codes == self.code(season)
+
+    def labels(self) -> pd.Categorical:
+        """Season names of the dates as a Pandas Categorical (NaN outside all seasons)."""
+        return pd.Categorical.from_codes(self.codes, categories=self.names)
+
+# Recently built season indices, keyed by a fingerprint of their dates and settings
+_SEASON_INDEX_CACHE: Dict[Tuple, SeasonIndex] = {}
+_SEASON_INDEX_CACHE_SIZE = 8
+
+def _dates_fingerprint(raw: np.ndarray) -> Tuple:
+    """
+    Fingerprint of an array of dates for the season index cache.
+
+    Every date is hashed, so any change to the dates gives a new fingerprint;
+    this costs one pass over the dates but keeps no copy of them.
+
+    Args:
+        raw: NumPy array of dates (datetime64 or objects).
+
+    Returns:
+        A tuple of the length, the dtype and a hash of all dates.
+    """
+    # Fixed-width values are hashed as raw bytes, objects via one 64-bit hash each
+    values = pd.util.hash_array(raw) if raw.dtype == object else np.ascontiguousarray(raw).view(np.uint8)
+    return len(raw), raw.dtype.str, hashlib.sha1(values).hexdigest()
+
+def season_index(dates: Union[pd.DatetimeIndex, pd.Series, np.ndarray],
+                 seasons: Optional[Dict[str, Tuple[int, ...]]] = None, year_start_month: int = 1) -> SeasonIndex:
+    """
+    Return the SeasonIndex of a series of dates, reusing a cached one.
+
+    The last few indices are cached under a hash of all their dates, so
+    repeated filtering or aggregation of the same date column decodes the
+    dates only once without keeping copies of them. To skip even the hashing,
+    build a SeasonIndex once and pass it to the season functions as index.
+
+    Args:
+        dates: Dates as a DatetimeIndex, Series or array convertible to one.
+        seasons: Optional dictionary of season names and months (see SeasonIndex).
+        year_start_month: First month of the year (see SeasonIndex). Defaults to 1.
+
+    Returns:
+        The SeasonIndex of the dates.
+    """
+    settings = (tuple((name, tuple(months)) for name, months in (seasons or SEASON_MONTHS).items()),
+                year_start_month)
+    key = (_dates_fingerprint(np.asarray(dates)), settings)
+
+    if key in _SEASON_INDEX_CACHE:
+        _SEASON_INDEX_CACHE[key] = _SEASON_INDEX_CACHE.pop(key)
+        return _SEASON_INDEX_CACHE[key]
+
+    index = SeasonIndex(dates, seasons, year_start_month)
+    _SEASON_INDEX_CACHE[key] = index
+    if len(_SEASON_INDEX_CACHE) > _SEASON_INDEX_CACHE_SIZE:
+        del _SEASON_INDEX_CACHE[next(iter(_SEASON_INDEX_CACHE))]
+
+    return index
+
+def _frame_season_index(data: pd.DataFrame, date_col: str, seasons: Optional[Dict[str, Tuple[int, ...]]],
+                        year_start_month: int, index: Optional[SeasonIndex]) -> SeasonIndex:
+    """
+    Season index of a DataFrame's date column: the given one or the cached one.
+
+    Args:
+        data: Input Pandas DataFrame.
+        date_col: Name of the date column.
+        seasons: Optional dictionary of season names and months (see SeasonIndex).
+        year_start_month: First month of the year (see SeasonIndex).
+        index: Optional SeasonIndex given by the caller.
+
+    Returns:
+        The SeasonIndex of the date column.
+
+    Raises:
+        ValueError: If a given index does not match the length of the DataFrame.
+        TypeError: If the date column cannot be converted to DatetimeIndex.
+    """
+    if index is not None:
+        if len(index) != len(data):
+            raise ValueError(f"Length of 'index' ({len(index)}) must match the length of the DataFrame ({len(data)}).")
+        return index
+
+    try:
+        return season_index(data[date_col], seasons, year_start_month)
+    except TypeError as e:
+        raise TypeError(f"Column '{date_col}': {e}") from e
+
+def filter_by_season(data: pd.DataFrame, date_col: str = 'date', season: str = 'JJA',
+                     seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                     index: Optional[SeasonIndex] = None) -> pd.DataFrame:
     """
     Filter a Pandas DataFrame to include only data from a specific meteorological season.
 
+    The season codes of the date column are cached (see season_index), so
+    filtering the same DataFrame for several seasons decodes the dates once.
+
     Args:
         data: Input Pandas DataFrame.
         date_col: Name of the column containing date/datetime objects. Defaults to 'date'.
         season: The meteorological season code ('DJF', 'MAM', 'JJA', 'SON'). Defaults to 'JJA'.
+        seasons: Optional dictionary of season names and months replacing the
+                 meteorological seasons, e.g. {'summer': (4, 5, 6, 7, 8, 9)}.
+        index: Optional SeasonIndex of the date column to use instead of the cached one.
 
     Returns:
         A filtered Pandas DataFrame containing only rows corresponding to the specified season.
 
     Raises:
-        ValueError: If the specified date column does not exist or if the season code is invalid.
+        ValueError: If the specified date column does not exist, if the season code is invalid
+                    or if the index does not match the DataFrame.
         TypeError: If the date column cannot be converted to DatetimeIndex.
     """
     if date_col not in data.columns:
         raise ValueError(f"Date column '{date_col}' not found in DataFrame columns: {data.columns}")
 
-    season_map = {
-        'DJF': [12, 1, 2], # December, January, February
-        'MAM': [3, 4, 5],  # March, April, May
-        'JJA': [6, 7, 8],  # June, July, August
-        'SON': [9, 10, 11] # September, October, November
-    }
-
-    if season not in season_map:
-        raise ValueError(f"Unknown season code: '{season}'. Valid codes are 'DJF', 'MAM', 'JJA', 'SON'.")
+    valid_seasons = index.seasons if index is not None else SEASON_MONTHS if seasons is None else seasons
+    if season not in valid_seasons:
+        raise ValueError(f"Unknown season code: '{season}'. Valid codes are {', '.join(map(repr, valid_seasons))}.")
 
-    try:
-        # Ensure the date column is in datetime format
-        datetime_index = pd.DatetimeIndex(data[date_col])
-    except Exception as e:
-        raise TypeError(f"Could not convert column '{date_col}' to DatetimeIndex. Error: {e}")
+    index = _frame_season_index(data, date_col, seasons, 1, index)
 
-    # Extract month numbers and filter
-    months = datetime_index.month
-    filtered_data = data[months.isin(season_map[season])]
-    return filtered_data.copy() # Return a copy
+    # Boolean indexing already returns a new DataFrame
+    return data[index.mask(season)]
 
-def aggregate_by_season(data: pd.DataFrame, date_col: str = 'date', value_col: str = 'value') -> Dict[str, pd.DataFrame]:
+def aggregate_by_season(data: pd.DataFrame, date_col: str = 'date', value_col: str = 'value',
+                        seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                        index: Optional[SeasonIndex] = None) -> Dict[str, pd.DataFrame]:
     """
     Aggregate data in a DataFrame by meteorological season.
 
     Note: This function currently groups the data but doesn't perform aggregation (like mean, sum).
-          It returns subsets of the DataFrame for each season.
+          It returns subsets of the DataFrame for each season. Use season_statistics
+          for aggregated values and group_by_season for a lazy grouping.
 
     Args:
         data: Input Pandas DataFrame.
         date_col: Name of the column containing date/datetime objects. Defaults to 'date'.
         value_col: Name of the column containing the values to potentially aggregate (currently unused for aggregation). Defaults to 'value'.
+        seasons: Optional dictionary of season names and months replacing the
+                 meteorological seasons.
+        index: Optional SeasonIndex of the date column to use instead of the cached one.
 
     Returns:
         A dictionary where keys are season codes ('DJF', 'MAM', 'JJA', 'SON')
         and values are Pandas DataFrames containing the data for that season.
 
     Raises:
-        ValueError: If the specified date or value columns do not exist.
+        ValueError: If the specified date or value columns do not exist or the index does not match.
         TypeError: If the date column cannot be converted to DatetimeIndex.
     """
     if date_col not in data.columns:
@@ -168,29 +683,105 @@ def aggregate_by_season(data: pd.DataFrame, date_col: str = 'date', value_col: s
     if value_col not in data.columns:
          raise ValueError(f"Value column '{value_col}' not found in DataFrame columns: {data.columns}")
 
-    season_map = {
-        'DJF': [12, 1, 2],
-        'MAM': [3, 4, 5],
-        'JJA': [6, 7, 8],
-        'SON': [9, 10, 11]
-    }
+    index = _frame_season_index(data, date_col, seasons, 1, index)
 
-    result = {}
-    try:
-        # Ensure the date column is in datetime format
-        datetime_index = pd.DatetimeIndex(data[date_col])
-    except Exception as e:
-        raise TypeError(f"Could not convert column '{date_col}' to DatetimeIndex. Error: {e}")
+    # Row positions of every season from one pass over the codes; each subset is taken once
+    positions = pd.Series(index.codes).groupby(index.codes).indices
+    return {name: data.iloc[positions[code]] for code, name in enumerate(index.names) if code in positions}
+
+def group_by_season(data: pd.DataFrame, date_col: str = 'date', seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                    by_year: bool = False, year_start_month: int = 1, by: Optional[Union[str, List[str]]] = None,
+                    index: Optional[SeasonIndex] = None) -> 'pd.core.groupby.DataFrameGroupBy':
+    """
+    Group a DataFrame by season without copying it.
+
+    The grouping keys come from the cached season codes of the date column;
+    no subset is materialized until a group is accessed, so aggregations
+    such as .mean() or .quantile() run in one grouped pass over the data.
+
+    Args:
+        data: Input Pandas DataFrame.
+        date_col: Name of the column containing date/datetime objects. Defaults to 'date'.
+        seasons: Optional dictionary of season names and months replacing the
+                 meteorological seasons.
+        by_year: If True, group by year and season. Defaults to False.
+        year_start_month: First month of the year when by_year is True, e.g. 12 to count
+                          December in the DJF season of the following year or 10 for
+                          hydrological years. Defaults to 1.
+        by: Optional column name(s) grouped before the year and season, e.g. 'station'.
+        index: Optional SeasonIndex of the date column to use instead of the cached one;
+               its seasons and year_start_month take precedence.
+
+    Returns:
+        A Pandas DataFrameGroupBy with the group levels by, 'year' and 'season'. Dates
+        outside all seasons are dropped.
+
+    Raises:
+        ValueError: If the date column or a grouping column does not exist or the index does not match.
+        TypeError: If the date column cannot be converted to DatetimeIndex.
+    """
+    if date_col not in data.columns:
+        raise ValueError(f"Date column '{date_col}' not found in DataFrame columns: {data.columns}")
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+    for col in by:
+        if col not in data.columns:
+            raise ValueError(f"Grouping column '{col}' not found in DataFrame columns: {data.columns}")
+
+    index = _frame_season_index(data, date_col, seasons, year_start_month if by_year else 1, index)
 
-    # Extract month numbers
-    months = datetime_index.month
+    keys = [data[col] for col in by]
+    if by_year:
+        keys.append(pd.Series(index.years, index=data.index, name='year'))
+    keys.append(pd.Series(index.labels(), index=data.index, name='season'))
 
-    # Create subsets for each season
-    for season, season_months in season_map.items():
-        season_data = data[months.isin(season_months)]
-        if not season_data.empty:
-            result[season] = season_data.copy() # Store a copy
+    return data.groupby(keys, observed=True, sort=True)
 
+def season_statistics(data: pd.DataFrame, date_col: str = 'date', value_col: Union[str, List[str]] = 'value',
+                      stats: Tuple[str, ...] = ('count', 'mean', 'std', 'min', 'max'),
+                      percentiles: Tuple[float, ...] = (), seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                      by_year: bool = False, year_start_month: int = 1, by: Optional[Union[str, List[str]]] = None,
+                      index: Optional[SeasonIndex] = None) -> pd.DataFrame:
+    """
+    Calculate statistics of values per season (and optionally per year and group).
+
+    All statistics are computed from one grouping of the data (see
+    group_by_season) instead of one DataFrame copy per season.
+
+    Args:
+        data: Input Pandas DataFrame.
+        date_col: Name of the column containing date/datetime objects. Defaults to 'date'.
+        value_col: Name(s) of the column(s) to aggregate. Defaults to 'value'.
+        stats: Pandas aggregation names. Defaults to ('count', 'mean', 'std', 'min', 'max').
+        percentiles: Percentiles (0-100) to add as columns 'p<percentile>', e.g. (50, 90).
+        seasons: Optional dictionary of season names and months replacing the
+                 meteorological seasons.
+        by_year: If True, aggregate per year and season. Defaults to False.
+        year_start_month: First month of the year when by_year is True (see group_by_season).
+        by: Optional column name(s) to aggregate separately, e.g. 'station'.
+        index: Optional SeasonIndex of the date column (see group_by_season).
+
+    Returns:
+        A Pandas DataFrame indexed by by, 'year' and 'season' with one column per
+        statistic; with several value columns, the columns are (value_col, statistic).
+
+    Raises:
+        ValueError: If a column does not exist.
+        TypeError: If the date column cannot be converted to DatetimeIndex.
+    """
+    value_cols = [value_col] if isinstance(value_col, str) else list(value_col)
+    for col in value_cols:
+        if col not in data.columns:
+            raise ValueError(f"Value column '{col}' not found in DataFrame columns: {data.columns}")
+
+    grouped = group_by_season(data, date_col, seasons, by_year, year_start_month, by, index)[value_cols]
+    result = grouped.agg(list(stats))
+    for q in percentiles:
+        quantiles = grouped.quantile(q / 100)
+        for col in value_cols:
+            result[(col, f'p{q:g}')] = quantiles[col]
+
+    if isinstance(value_col, str):
+        result.columns = result.columns.droplevel(0)
     return result
 
 
@@ -526,44 +1117,719 @@ def calc_statistical_metrics(obs: np.ndarray, model: np.ndarray) -> Dict[str, Un
         'n_points': n_points
     }
 
-def compare_models(ref_data: np.ndarray, model_dict: Dict[str, np.ndarray]) -> pd.DataFrame:
+def calc_statistical_metrics_batch(obs: np.ndarray, models: Union[np.ndarray, List[np.ndarray]],
+                                   chunk_size: int = 2**19) -> Dict[str, np.ndarray]:
+    """
+    Calculate the metrics of calc_statistical_metrics for many models at once.
+
+    The models are evaluated together as a (model, n) stack with vectorized
+    reductions over the observation mask, which is computed once per chunk
+    and shared by all models. The points are processed in a single pass over
+    chunks small enough to stay in the CPU cache, so the models are never
+    copied as a whole. The observations are shifted by their mean and each
+    model by its own mean, estimated from an evenly spaced sample, so the
+    variance and covariance sums do not cancel, even for strongly biased models.
+
+    Args:
+        obs: NumPy array of observation data.
+        models: NumPy array shaped (n_models, *obs.shape) or a list of arrays
+                with the same shape as obs.
+        chunk_size: Number of model values (models x points) processed per chunk.
+                    Defaults to 2**19.
+
+    Returns:
+        A dictionary with the arrays 'bias', 'rmse', 'mae', 'correlation' and
+        'n_points', one entry per model. Metrics are NaN for models without
+        valid pairs, and the correlation is NaN for fewer than two pairs.
+
+    Raises:
+        ValueError: If any model array does not have the same shape as obs.
+    """
+    for model in models:
+        if np.shape(model) != np.shape(obs):
+            raise ValueError(f"Input arrays must have the same shape. Got {np.shape(obs)} and {np.shape(model)}.")
+
+    obs_flat = np.ravel(obs)
+    model_flats = [np.ravel(model) for model in models]
+    n_models = len(model_flats)
+    if n_models == 0:
+        return {'bias': np.empty(0), 'rmse': np.empty(0), 'mae': np.empty(0),
+                'correlation': np.empty(0), 'n_points': np.empty(0, dtype=np.int64)}
+    chunk_points = max(1, chunk_size // max(n_models, 1))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.nanmean(obs_flat) if np.any(~np.isnan(obs_flat)) else 0.0
+
+    # Each model is shifted by its own mean, estimated from an evenly spaced sample,
+    # so the sums of a biased model do not cancel either
+    step = max(1, obs_flat.size // 2**16)
+    model_shifts = np.full(n_models, shift)
+    for model_idx, model in enumerate(model_flats):
+        sample = np.asarray(model[::step], dtype=np.float64)
+        if np.any(~np.isnan(sample)):
+            model_shifts[model_idx] = np.nanmean(sample)
+    offsets = (model_shifts - shift)[:, None]
+
+    n_points = np.zeros(n_models, dtype=np.int64)
+    sums = np.zeros((7, n_models))  # obs, model, abs diff, diff^2, obs^2, model^2, obs*model
+
+    for start in range(0, obs_flat.size, chunk_points):
+        chunk = slice(start, start + chunk_points)
+        o = obs_flat[chunk] - shift
+        m = np.stack([model[chunk] for model in model_flats]).astype(np.float64, copy=False) - model_shifts[:, None]
+
+        # Observation mask shared by all models, combined with each model's own NaNs
+        invalid = np.isnan(m)
+        invalid |= np.isnan(o)
+        m[invalid] = 0.0
+        o = np.where(invalid, 0.0, o)
+        diff = m - o
+
+        n_invalid = invalid.sum(axis=1)
+        n_points += invalid.shape[1] - n_invalid
+        sums[0] += o.sum(axis=1)
+        sums[1] += m.sum(axis=1)
+        sums[3] += np.einsum('ij,ij->i', diff, diff)
+        # Absolute differences of the unshifted values; each masked pair adds exactly |offset|
+        diff += offsets
+        np.abs(diff, out=diff)
+        sums[2] += diff.sum(axis=1) - n_invalid * np.abs(offsets[:, 0])
+        sums[4] += np.einsum('ij,ij->i', o, o)
+        sums[5] += np.einsum('ij,ij->i', m, m)
+        sums[6] += np.einsum('ij,ij->i', o, m)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_obs, mean_model = sums[0] / n_points, sums[1] / n_points
+        cov = sums[6] - n_points * mean_obs * mean_model
+        var_obs = np.maximum(sums[4] - n_points * mean_obs ** 2, 0.0)
+        var_model = np.maximum(sums[5] - n_points * mean_model ** 2, 0.0)
+
+        correlation = cov / np.sqrt(var_obs * var_model)
+        correlation[n_points < 2] = np.nan
+
+        # Squared differences of the unshifted values: sum((diff + offset)^2) expanded
+        offset = offsets[:, 0]
+        sum_sq_error = np.maximum(sums[3] + 2 * offset * (sums[1] - sums[0]) + n_points * offset ** 2, 0.0)
+
+        return {
+            'bias': mean_model - mean_obs + offset,
+            'rmse': np.sqrt(sum_sq_error / n_points),
+            'mae': sums[2] / n_points,
+            'correlation': correlation,
+            'n_points': n_points
+        }
+
+def compare_models(ref_data: np.ndarray, model_dict: Dict[str, np.ndarray], chunk_size: int = 2**19) -> pd.DataFrame:
     """
     Compare multiple model datasets against a reference dataset using statistical metrics.
 
+    All models are evaluated in one batched pass with calc_statistical_metrics_batch.
+
     Args:
         ref_data: NumPy array of reference data (e.g., observations).
         model_dict: Dictionary where keys are model names (str) and values are
                     NumPy arrays of model data. Each model array must have the
                     same shape as ref_data.
+        chunk_size: Number of model values processed per chunk (see
+                    calc_statistical_metrics_batch). Defaults to 2**19.
 
     Returns:
         A Pandas DataFrame where each row represents a model and columns contain
         the statistical metrics ('bias', 'rmse', 'mae', 'correlation', 'n_points')
         comparing that model to the reference data. Includes a 'model' column
-        with the model names.
+        with the model names. Models whose shape does not match ref_data are
+        skipped with a message.
+    """
+    names = []
+    models = []
+
+    for model_name, model_data in model_dict.items():
+        if np.shape(model_data) != np.shape(ref_data):
+            print(f"Skipping model '{model_name}' due to error: Input arrays must have the same shape. "
+                  f"Got {np.shape(ref_data)} and {np.shape(model_data)}.")
+            continue
+        names.append(model_name)
+        models.append(model_data)
+
+    # Convert the metric arrays to a DataFrame
+    if not models:
+        # Return empty DataFrame with expected columns if no models were processed
+        return pd.DataFrame(columns=['model', 'bias', 'rmse', 'mae', 'correlation', 'n_points'])
+
+    metrics = calc_statistical_metrics_batch(ref_data, models, chunk_size)
+    results = pd.DataFrame(metrics)
+    results.insert(0, 'model', names)
+
+    return results[['model', 'bias', 'rmse', 'mae', 'correlation', 'n_points']] # Ensure column order
+
+def _group_codes(groups: Union[np.ndarray, Dict[str, np.ndarray]],
+                 shape: Tuple[int, ...]) -> Tuple[np.ndarray, int, List[np.ndarray], List[Optional[str]]]:
+    """
+    Encode one or several group label arrays as integer codes.
+
+    Each label array is factorized on its own (unbroadcast) shape, so labels
+    given per station or per time step are encoded only once; the codes are
+    then combined and broadcast to the data shape.
+
+    Args:
+        groups: Label array, or dictionary of label arrays keyed by group name.
+                Each array must broadcast to shape.
+        shape: Shape of the data.
+
+    Returns:
+        A tuple (codes, n_codes, levels, names): flat codes with -1 for missing
+        labels, the size of the code space, the sorted unique labels of each
+        group array and the group names.
+    """
+    if isinstance(groups, dict):
+        names, arrays = list(groups.keys()), list(groups.values())
+    else:
+        names, arrays = [getattr(groups, 'name', None)], [groups]
+
+    combined = None
+    levels = []
+    for labels in arrays:
+        labels = np.asarray(labels)
+        codes, uniques = pd.factorize(labels.ravel(), sort=True)
+        codes = codes.reshape(labels.shape)
+        levels.append(np.asarray(uniques))
+        if combined is None:
+            combined = codes
+        else:
+            combined = np.where((combined < 0) | (codes < 0), -1, combined * len(uniques) + codes)
+
+    if np.broadcast_shapes(combined.shape, shape) != tuple(shape):
+        raise ValueError(f"Group labels of shape {combined.shape} do not broadcast to the data shape {shape}.")
+
+    n_codes = int(np.prod([len(level) for level in levels]))
+    dtype = np.int32 if n_codes < 2**31 else np.int64
+    codes = np.broadcast_to(combined.astype(dtype, copy=False), shape).reshape(-1)
+
+    return codes, n_codes, levels, names
+
+def calc_grouped_metrics(obs: np.ndarray, model: np.ndarray, groups: Union[np.ndarray, Dict[str, np.ndarray]],
+                         chunk_size: int = 2**22) -> pd.DataFrame:
+    """
+    Calculate the metrics of calc_statistical_metrics for every group of data points.
+
+    All groups are evaluated together with np.bincount reductions over integer
+    group codes, without a Python loop over groups, so e.g. per-station,
+    per-month, per-season or per-hour scores of 10^8 pairs take a few passes
+    over the data. Data are processed in chunks of chunk_size points. Group
+    means are taken in a first pass and the correlation from sums centred on
+    them in a second pass.
+
+    Args:
+        obs: NumPy array of observation data.
+        model: NumPy array of model data. Must have the same shape as obs.
+        groups: Group labels broadcastable to the data shape, e.g. station ids of
+                shape (n_stations,) for (time, station) data, or months of shape
+                (n_times, 1). A dictionary of such arrays keyed by name groups by
+                all of them, e.g. {'station': ids, 'hour': hours[:, None]}.
+                Points with missing (NaN) labels are ignored.
+        chunk_size: Number of points processed per chunk. Defaults to 2**22.
+
+    Returns:
+        A Pandas DataFrame indexed by the group labels (a MultiIndex for several
+        group arrays) with the columns 'bias', 'rmse', 'mae', 'correlation' and
+        'n_points', one row per label combination present in the data.
 
     Raises:
-        ValueError: If any model array shape does not match the reference data shape.
+        ValueError: If obs and model shapes differ or the labels do not broadcast.
     """
-    results = []
+    if obs.shape != model.shape:
+        raise ValueError(f"Input arrays must have the same shape. Got {obs.shape} and {model.shape}.")
 
-    for model_name, model_data in model_dict.items():
-        try:
-            metrics = calc_statistical_metrics(ref_data, model_data)
-            metrics['model'] = model_name # Add model name to the results dict
-            results.append(metrics)
-        except ValueError as e:
-            print(f"Skipping model '{model_name}' due to error: {e}")
-        except Exception as e:
-             print(f"An unexpected error occurred while processing model '{model_name}': {e}")
+    codes, n_codes, levels, names = _group_codes(groups, obs.shape)
+    obs_flat = np.ravel(obs)
+    model_flat = np.ravel(model)
+    chunks = [slice(start, start + chunk_size) for start in range(0, obs_flat.size, chunk_size)]
+
+    def paired_chunk(chunk):
+        # Valid pairs with a group label; NaN labels were encoded as -1
+        c = codes[chunk]
+        o = obs_flat[chunk].astype(np.float64, copy=False)
+        m = model_flat[chunk].astype(np.float64, copy=False)
+        valid = ~np.isnan(o) & ~np.isnan(m) & (c >= 0)
+        return c[valid], o[valid], m[valid]
+
+    present = np.zeros(n_codes, dtype=np.int64)
+    n_points = np.zeros(n_codes, dtype=np.int64)
+    sums = np.zeros((4, n_codes))  # obs, model, abs diff, diff^2
+
+    for chunk in chunks:
+        c = codes[chunk]
+        present += np.bincount(c[c >= 0], minlength=n_codes)
+        c, o, m = paired_chunk(chunk)
+        diff = m - o
+        n_points += np.bincount(c, minlength=n_codes)
+        sums[0] += np.bincount(c, weights=o, minlength=n_codes)
+        sums[1] += np.bincount(c, weights=m, minlength=n_codes)
+        sums[2] += np.bincount(c, weights=np.abs(diff), minlength=n_codes)
+        sums[3] += np.bincount(c, weights=diff * diff, minlength=n_codes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_obs = sums[0] / n_points
+        mean_model = sums[1] / n_points
+
+        centred = np.zeros((3, n_codes))  # obs * model, obs^2, model^2
+        for chunk in chunks:
+            c, o, m = paired_chunk(chunk)
+            anom_obs = o - mean_obs[c]
+            anom_model = m - mean_model[c]
+            centred[0] += np.bincount(c, weights=anom_obs * anom_model, minlength=n_codes)
+            centred[1] += np.bincount(c, weights=anom_obs * anom_obs, minlength=n_codes)
+            centred[2] += np.bincount(c, weights=anom_model * anom_model, minlength=n_codes)
+
+        correlation = centred[0] / np.sqrt(centred[1] * centred[2])
+        correlation[n_points < 2] = np.nan
+
+        results = pd.DataFrame({
+            'bias': mean_model - mean_obs,
+            'rmse': np.sqrt(sums[3] / n_points),
+            'mae': sums[2] / n_points,
+            'correlation': correlation,
+            'n_points': n_points
+        })
 
+    # Keep the label combinations that occur in the data and label the rows
+    ids = np.flatnonzero(present)
+    positions = np.unravel_index(ids, [len(level) for level in levels])
+    if len(levels) == 1:
+        index = pd.Index(levels[0][positions[0]], name=names[0])
+    else:
+        index = pd.MultiIndex.from_arrays([level[pos] for level, pos in zip(levels, positions)], names=names)
 
-    # Convert list of dictionaries to DataFrame
-    if not results:
-        # Return empty DataFrame with expected columns if no models were processed
-        return pd.DataFrame(columns=['model', 'bias', 'rmse', 'mae', 'correlation', 'n_points'])
+    return results.iloc[ids].set_axis(index)
 
-    return pd.DataFrame(results)[['model', 'bias', 'rmse', 'mae', 'correlation', 'n_points']] # Ensure column order
+class MetricsAccumulator:
+    """
+    Mergeable online accumulator of the metrics of calc_statistical_metrics.
+
+    Paired observation and model data are added chunk by chunk with update(),
+    so a long series can be evaluated by streaming through files without ever
+    holding the full arrays. The accumulator keeps counts, Welford-style
+    running means and sums of squared deviations of obs and model, their
+    co-moment, and the sums of absolute and squared errors. Chunks and
+    accumulators are combined with the pairwise update of Chan et al., so
+    accumulators filled in separate processes can be merged exactly.
+
+    An accumulator with a non-empty shape keeps separate statistics per
+    element, e.g. shape=(n_stations,) reduces (time, station) chunks over
+    time and returns per-station metrics.
+
+    Attributes:
+        shape: Shape of the accumulated statistics.
+        n: Number of valid pairs.
+        mean_obs, mean_model: Running means.
+        m2_obs, m2_model: Sums of squared deviations from the running means.
+        comoment: Sum of the products of the obs and model deviations.
+        sum_abs_error, sum_sq_error: Sums of |model - obs| and (model - obs)^2.
+    """
+
+    def __init__(self, shape: Tuple[int, ...] = ()):
+        """
+        Create an empty accumulator.
+
+        Args:
+            shape: Shape of the statistics, i.e. the trailing dimensions of the
+                   chunks that are kept. Defaults to () for one global score.
+        """
+        self.shape = tuple(shape)
+        self.n = np.zeros(self.shape, dtype=np.int64)
+        self.mean_obs = np.zeros(self.shape)
+        self.mean_model = np.zeros(self.shape)
+        self.m2_obs = np.zeros(self.shape)
+        self.m2_model = np.zeros(self.shape)
+        self.comoment = np.zeros(self.shape)
+        self.sum_abs_error = np.zeros(self.shape)
+        self.sum_sq_error = np.zeros(self.shape)
+
+    def update(self, obs: np.ndarray, model: np.ndarray) -> 'MetricsAccumulator':
+        """
+        Add a chunk of paired data.
+
+        NaN values are removed pairwise, as in calc_statistical_metrics.
+
+        Args:
+            obs: NumPy array of observation data whose trailing dimensions equal shape.
+            model: NumPy array of model data. Must have the same shape as obs.
+
+        Returns:
+            The accumulator itself.
+
+        Raises:
+            ValueError: If the shapes of obs, model and the accumulator do not fit.
+        """
+        if obs.shape != model.shape:
+            raise ValueError(f"Input arrays must have the same shape. Got {obs.shape} and {model.shape}.")
+        n_lead = obs.ndim - len(self.shape)
+        if n_lead < 0 or obs.shape[n_lead:] != self.shape:
+            raise ValueError(f"Trailing dimensions of the data {obs.shape} do not match the accumulator shape {self.shape}.")
+        axes = tuple(range(n_lead))
+
+        # Statistics of the chunk, centred on its own means
+        valid = ~np.isnan(obs) & ~np.isnan(model)
+        o = np.where(valid, obs, 0.0)
+        m = np.where(valid, model, 0.0)
+        n = valid.sum(axis=axes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_obs = np.where(n > 0, o.sum(axis=axes) / n, 0.0)
+            mean_model = np.where(n > 0, m.sum(axis=axes) / n, 0.0)
+        anom_obs = np.where(valid, o - mean_obs, 0.0)
+        anom_model = np.where(valid, m - mean_model, 0.0)
+        diff = m - o
+
+        chunk = MetricsAccumulator(self.shape)
+        chunk.n = n.astype(np.int64)
+        chunk.mean_obs = mean_obs
+        chunk.mean_model = mean_model
+        chunk.m2_obs = (anom_obs * anom_obs).sum(axis=axes)
+        chunk.m2_model = (anom_model * anom_model).sum(axis=axes)
+        chunk.comoment = (anom_obs * anom_model).sum(axis=axes)
+        chunk.sum_abs_error = np.abs(diff).sum(axis=axes)
+        chunk.sum_sq_error = (diff * diff).sum(axis=axes)
+
+        return self.merge(chunk)
+
+    def merge(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        """
+        Merge the statistics of another accumulator into this one.
+
+        Args:
+            other: Accumulator with the same shape, e.g. filled by another process.
+
+        Returns:
+            The accumulator itself.
+
+        Raises:
+            ValueError: If the shapes of the accumulators differ.
+        """
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge accumulators of shapes {self.shape} and {other.shape}.")
+
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(n > 0, other.n / n, 0.0)
+        delta_obs = other.mean_obs - self.mean_obs
+        delta_model = other.mean_model - self.mean_model
+        cross = self.n * frac  # n_a * n_b / n
+
+        self.m2_obs = self.m2_obs + other.m2_obs + delta_obs * delta_obs * cross
+        self.m2_model = self.m2_model + other.m2_model + delta_model * delta_model * cross
+        self.comoment = self.comoment + other.comoment + delta_obs * delta_model * cross
+        self.mean_obs = self.mean_obs + delta_obs * frac
+        self.mean_model = self.mean_model + delta_model * frac
+        self.sum_abs_error = self.sum_abs_error + other.sum_abs_error
+        self.sum_sq_error = self.sum_sq_error + other.sum_sq_error
+        self.n = n
+
+        return self
+
+    def __add__(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        return self.copy().merge(other)
+
+    def __iadd__(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        return self.merge(other)
+
+    def copy(self) -> 'MetricsAccumulator':
+        """Return an independent copy of the accumulator."""
+        result = MetricsAccumulator(self.shape)
+        result.__dict__.update({key: np.copy(value) for key, value in self.__dict__.items() if key != 'shape'})
+        return result
+
+    @classmethod
+    def combine(cls, accumulators: List['MetricsAccumulator']) -> 'MetricsAccumulator':
+        """
+        Merge a list of accumulators, e.g. the results of parallel workers.
+
+        Args:
+            accumulators: Non-empty list of accumulators with the same shape.
+
+        Returns:
+            A new accumulator holding the statistics of all of them.
+        """
+        result = accumulators[0].copy()
+        for accumulator in accumulators[1:]:
+            result.merge(accumulator)
+        return result
+
+    def variance(self, ddof: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Variances of the observations and the model.
+
+        Args:
+            ddof: Delta degrees of freedom. Defaults to 0.
+
+        Returns:
+            A tuple (var_obs, var_model); NaN where fewer than ddof + 1 pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            denominator = np.where(self.n > ddof, self.n - ddof, np.nan)
+            return self.m2_obs / denominator, self.m2_model / denominator
+
+    def covariance(self, ddof: int = 0) -> np.ndarray:
+        """
+        Covariance of observations and model.
+
+        Args:
+            ddof: Delta degrees of freedom. Defaults to 0.
+
+        Returns:
+            The covariance; NaN where fewer than ddof + 1 pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.where(self.n > ddof, self.n - ddof, np.nan)
+
+    def metrics(self) -> Dict[str, Union[float, int, np.ndarray]]:
+        """
+        Metrics of all data added so far.
+
+        Returns:
+            A dictionary with 'bias', 'rmse', 'mae', 'correlation' and 'n_points',
+            as returned by calc_statistical_metrics, holding arrays of the
+            accumulator shape if it is not (). Metrics are NaN without valid
+            pairs and the correlation is NaN for fewer than two pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = np.where(self.n > 0, self.n, np.nan)
+            correlation = np.where(self.n > 1, self.comoment / np.sqrt(self.m2_obs * self.m2_model), np.nan)
+            metrics = {
+                'bias': np.where(self.n > 0, self.mean_model - self.mean_obs, np.nan),
+                'rmse': np.sqrt(self.sum_sq_error / n),
+                'mae': self.sum_abs_error / n,
+                'correlation': correlation,
+                'n_points': self.n
+            }
+
+        if self.shape == ():
+            return {key: value.item() for key, value in metrics.items()}
+        return metrics
+
+    def __repr__(self) -> str:
+        return f"MetricsAccumulator(shape={self.shape}, n_points={int(np.sum(self.n))})"
+
+# Number of set bits of every byte value, for counting bit-packed masks
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def _season_codes(dates: pd.DatetimeIndex) -> Tuple[np.ndarray, List[str]]:
+    """
+    Encode dates by meteorological season.
+
+    Args:
+        dates: Pandas DatetimeIndex (or anything convertible to one).
+
+    Returns:
+        A tuple (codes, names): an int8 NumPy array with the index of the season
+        of every date in names ('DJF', 'MAM', 'JJA', 'SON').
+    """
+    index = season_index(dates)
+    return index.codes, index.names
+
+def _count_by_group(mask: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Count the true values of a (time, ...) mask per group of time steps.
+
+    Runs of equal consecutive codes are summed with np.add.reduceat and then
+    added to their groups, so sorted codes such as seasons or years cost a
+    single pass over the mask.
+
+    Args:
+        mask: Boolean or 0/1 NumPy array with time along the first axis.
+        groups: Integer NumPy array of one code per time step; negative codes are left out.
+        n_groups: Number of groups.
+
+    Returns:
+        int64 NumPy array of counts shaped (n_groups, ...).
+    """
+    counts = np.zeros((n_groups,) + mask.shape[1:], dtype=np.int64)
+    if len(groups) == 0:
+        return counts
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    run_sums = np.add.reduceat(mask, starts, axis=0, dtype=np.int64)
+    run_codes = groups[starts]
+    keep = run_codes >= 0
+    np.add.at(counts, run_codes[keep], run_sums[keep])
+
+    return counts
+
+class ExceedanceMask:
+    """
+    Bit-packed mask of threshold exceedances along the time axis.
+
+    The mask of a (time, ...) array, e.g. (time, station) or (time, y, x), is
+    packed to one bit per value with np.packbits, 1/64 of the int64 array of
+    calculate_exceedances and 1/8 of a boolean mask. Counts per group of time
+    steps (e.g. season) and location, and run-length statistics of
+    consecutive exceedances (episodes), are computed from the packed mask in
+    chunks of locations, so the full boolean mask is never held in memory.
+
+    Attributes:
+        packed: uint8 NumPy array shaped (ceil(n_times / 8), ...) of packed bits.
+        n_times: Number of time steps.
+        threshold: Threshold the mask was built with, if known.
+    """
+
+    def __init__(self, packed: np.ndarray, n_times: int, threshold: Optional[float] = None):
+        """
+        Wrap an array packed with np.packbits along axis 0.
+
+        Args:
+            packed: uint8 NumPy array of packed bits along the first axis.
+            n_times: Number of time steps (bits) per location.
+            threshold: Optional threshold the mask was built with.
+        """
+        if packed.dtype != np.uint8 or packed.shape[0] != (n_times + 7) // 8:
+            raise ValueError(f"Packed array of {packed.dtype} and shape {packed.shape} does not hold {n_times} time steps.")
+        self.packed = packed
+        self.n_times = int(n_times)
+        self.threshold = threshold
+
+    @classmethod
+    def from_data(cls, data: Union[np.ndarray, xr.DataArray], threshold: float = 120.0,
+                  chunk_size: int = 8 * 1024) -> 'ExceedanceMask':
+        """
+        Build the mask of values exceeding a threshold (value >= threshold).
+
+        The data are compared and packed in chunks along time, so lazily read
+        arrays (e.g. from read_netcdf(lazy=True) or a netCDF4 variable) are
+        never loaded as a whole. NaN values do not exceed.
+
+        Args:
+            data: Array-like of shape (time, ...) supporting slicing along time.
+            threshold: The threshold value. Defaults to 120.0.
+            chunk_size: Number of time steps per chunk; rounded down to a multiple of 8.
+
+        Returns:
+            The ExceedanceMask of the data.
+        """
+        n_times = data.shape[0]
+        step = max(8, chunk_size - chunk_size % 8)
+        packed = np.empty(((n_times + 7) // 8,) + tuple(data.shape[1:]), dtype=np.uint8)
+
+        for start in range(0, n_times, step):
+            chunk = np.asarray(data[start:start + step])
+            packed[start // 8:(start + len(chunk) + 7) // 8] = np.packbits(chunk >= threshold, axis=0)
+
+        return cls(packed, n_times, threshold)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'ExceedanceMask':
+        """
+        Pack a boolean (time, ...) mask.
+
+        Args:
+            mask: Boolean NumPy array with time along the first axis.
+
+        Returns:
+            The packed ExceedanceMask.
+        """
+        return cls(np.packbits(np.asarray(mask, dtype=bool), axis=0), len(mask))
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape (time, ...) of the unpacked mask."""
+        return (self.n_times,) + self.packed.shape[1:]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the packed bits."""
+        return self.packed.nbytes
+
+    def _location_chunks(self, chunk_size: int) -> List[slice]:
+        """Slices over the flattened locations with about chunk_size mask values each."""
+        n_locations = int(np.prod(self.packed.shape[1:], dtype=np.int64))
+        step = max(1, chunk_size // max(self.n_times, 1))
+        return [slice(start, start + step) for start in range(0, n_locations, step)]
+
+    def unpack(self, locations: Optional[slice] = None) -> np.ndarray:
+        """
+        Unpack the mask, or the mask of a slice of the flattened locations.
+
+        Args:
+            locations: Optional slice over the flattened locations.
+
+        Returns:
+            Boolean NumPy array shaped (time, ...), or (time, n) for a slice.
+        """
+        if locations is None:
+            return np.unpackbits(self.packed, axis=0, count=self.n_times).view(bool)
+        flat = self.packed.reshape(self.packed.shape[0], -1)
+        return np.unpackbits(flat[:, locations], axis=0, count=self.n_times).view(bool)
+
+    def count(self, groups: Optional[np.ndarray] = None, n_groups: Optional[int] = None,
+              chunk_size: int = 2**24) -> np.ndarray:
+        """
+        Count exceedances per location, optionally per group of time steps.
+
+        Args:
+            groups: Optional integer NumPy array of length n_times assigning every
+                    time step to a group 0..n_groups-1 (e.g. season or year codes);
+                    negative codes are left out.
+            n_groups: Number of groups. Defaults to max(groups) + 1.
+            chunk_size: Number of mask values unpacked at a time.
+
+        Returns:
+            int64 NumPy array of counts shaped like a time step, or (n_groups, ...)
+            with groups.
+        """
+        space_shape = self.packed.shape[1:]
+        if groups is None:
+            # Counting set bits of the packed bytes needs no unpacking
+            return _POPCOUNT[self.packed].sum(axis=0, dtype=np.int64)
+
+        groups = np.asarray(groups)
+        if len(groups) != self.n_times:
+            raise ValueError(f"Length of groups ({len(groups)}) must match the number of time steps ({self.n_times}).")
+        if n_groups is None:
+            n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+        counts = np.zeros((n_groups, int(np.prod(space_shape, dtype=np.int64))), dtype=np.int64)
+        for locations in self._location_chunks(chunk_size):
+            counts[:, locations] = _count_by_group(self.unpack(locations), groups, n_groups)
+
+        return counts.reshape((n_groups,) + space_shape)
+
+    def episodes(self, min_length: int = 1, chunk_size: int = 2**24) -> Dict[str, np.ndarray]:
+        """
+        Detect episodes of consecutive exceedances with run-length encoding.
+
+        Args:
+            min_length: Minimum number of consecutive time steps of an episode. Defaults to 1.
+            chunk_size: Number of mask values unpacked at a time.
+
+        Returns:
+            A dictionary of int64 NumPy arrays shaped like a time step: 'count'
+            (number of episodes), 'max_duration' (longest episode) and
+            'total_duration' (time steps within episodes).
+        """
+        space_shape = self.packed.shape[1:]
+        n_locations = int(np.prod(space_shape, dtype=np.int64))
+        result = {key: np.zeros(n_locations, dtype=np.int64) for key in ('count', 'max_duration', 'total_duration')}
+
+        for locations in self._location_chunks(chunk_size):
+            mask = self.unpack(locations).view(np.int8)
+            # +1 where an episode starts, -1 after it ends; rows are locations
+            edges = np.diff(mask, axis=0, prepend=0, append=0).T
+            location, start = np.nonzero(edges == 1)
+            _, end = np.nonzero(edges == -1)
+            duration = end - start
+            keep = duration >= min_length
+            location, duration = location[keep], duration[keep]
+
+            offset = locations.start
+            n_chunk = edges.shape[0]
+            result['count'][offset:offset + n_chunk] = np.bincount(location, minlength=n_chunk)
+            result['total_duration'][offset:offset + n_chunk] = np.bincount(location, weights=duration, minlength=n_chunk)
+            longest = np.zeros(n_chunk, dtype=np.int64)
+            np.maximum.at(longest, location, duration)
+            result['max_duration'][offset:offset + n_chunk] = longest
+
+        return {key: value.reshape(space_shape) for key, value in result.items()}
+
+    def __repr__(self) -> str:
+        return f"ExceedanceMask(shape={self.shape}, threshold={self.threshold}, nbytes={self.nbytes})"
 
 def calc_exceedance_stats(data_dict: Dict[str, np.ndarray], threshold: float = 120,
                         by_season: bool = False, dates: Optional[pd.DatetimeIndex] = None) -> Dict[str, Union[int, Dict[str, int]]]:
@@ -598,139 +1864,590 @@ def calc_exceedance_stats(data_dict: Dict[str, np.ndarray], threshold: float = 1
         if len(dates) != len(data_dict[first_data_key]):
              raise ValueError(f"Length of 'dates' ({len(dates)}) must match the length of data arrays ({len(data_dict[first_data_key])}).")
 
-        season_map = {
-            'DJF': [12, 1, 2],
-            'MAM': [3, 4, 5],
-            'JJA': [6, 7, 8],
-            'SON': [9, 10, 11]
-        }
-        # Pre-calculate season masks for efficiency
-        month_numbers = dates.month
-        season_masks = {
-            season: np.isin(month_numbers, months)
-            for season, months in season_map.items()
-        }
+        # Encode the season of every time step once; missing dates (code -1) belong to no season
+        season_codes, season_names = _season_codes(dates)
+        in_season = season_codes >= 0
 
     for name, data in data_dict.items():
         if by_season and len(data) != len(dates):
              # Check individual array length if checking seasonally
              raise ValueError(f"Length mismatch for dataset '{name}'. Data length {len(data)}, dates length {len(dates)}.")
 
-        # Calculate exceedances for the current dataset
-        exceedances = calculate_exceedances(data, threshold) # Returns 0s and 1s
+        # Boolean mask of exceedances (NaN never exceeds)
+        exceedances = np.asarray(data) >= threshold
 
         if not by_season:
             # Sum all exceedances if not grouping by season
-            results[name] = int(np.sum(exceedances))
+            results[name] = int(np.count_nonzero(exceedances))
         else:
-            # Calculate sum for each season using pre-calculated masks
-            season_results = {}
-            for season, mask in season_masks.items():
-                # Apply mask to exceedance array and sum
-                season_results[season] = int(np.sum(exceedances[mask]))
-            results[name] = season_results
+            # Count per time step, then sum the counts of each season in one pass
+            per_step = exceedances.reshape(len(exceedances), -1).sum(axis=1)
+            counts = np.bincount(season_codes[in_season], weights=per_step[in_season], minlength=len(season_names))
+            results[name] = {season: int(counts[code]) for code, season in enumerate(season_names)}
 
     return results
 
+def calc_exceedance_maps(data: Union[np.ndarray, xr.DataArray], dates: Optional[pd.DatetimeIndex] = None,
+                         threshold: float = 120.0, by: Union[str, Tuple[str, ...]] = 'year',
+                         allowed: Optional[int] = None, chunk_size: int = 2**24) -> xr.Dataset:
+    """
+    Calculate per-cell exceedance counts of a (time, y, x) cube per year, season or month.
+
+    The cube is read and compared in chunks along time, so memory stays bounded
+    by one chunk and the count maps; lazily read arrays (e.g. from
+    read_netcdf(lazy=True) or a netCDF4 variable) are never loaded as a whole.
+    For legal threshold maps, e.g. the ozone target value of 120 µg/m³ MDA8
+    on more than 25 days per year, pass daily MDA8 values with threshold=120,
+    by='year' and allowed=25.
+
+    Args:
+        data: Array-like of shape (time, ...) supporting slicing along time, e.g. a
+              (time, y, x) NumPy array or xarray DataArray.
+        dates: Pandas DatetimeIndex of the time steps. Defaults to the 'time'
+               coordinate of a DataArray.
+        threshold: The threshold value (exceedance: value >= threshold). Defaults to 120.0.
+        by: Grouping of the time steps: 'year', 'season', 'month' or a tuple of them,
+            e.g. ('year', 'season'). With both year and season, December is counted
+            in the DJF season of the following year. Defaults to 'year'.
+        allowed: Optional number of allowed exceedances per group; adds the boolean
+                 map 'above_limit' of cells with more exceedances.
+        chunk_size: Number of values read per chunk. Defaults to 2**24.
+
+    Returns:
+        An xarray Dataset with the int64 maps 'exceedances' and 'n_valid' (number of
+        non-NaN values) with one dimension per grouping followed by the spatial
+        dimensions, plus 'above_limit' if allowed is given.
+
+    Raises:
+        ValueError: If dates are missing or do not match the data, or by is unknown.
+    """
+    if dates is None:
+        if not isinstance(data, xr.DataArray) or 'time' not in data.coords:
+            raise ValueError("Argument 'dates' must be provided unless data is a DataArray with a 'time' coordinate.")
+        dates = pd.DatetimeIndex(data['time'].values)
+    dates = pd.DatetimeIndex(dates)
+    if len(dates) != data.shape[0]:
+        raise ValueError(f"Length of 'dates' ({len(dates)}) must match the length of the time axis ({data.shape[0]}).")
+
+    keys = (by,) if isinstance(by, str) else tuple(by)
+    # With both year and season, December belongs to the DJF season of the following year
+    index = season_index(dates, year_start_month=12 if 'season' in keys and 'year' in keys else 1)
+    season_codes, season_names, years = index.codes, index.names, index.years
+
+    # Missing dates (and dates outside all seasons) belong to no group
+    valid = ~np.asarray(dates.isna())
+    if 'season' in keys:
+        valid &= season_codes >= 0
+    months = np.nan_to_num(np.asarray(dates.month, dtype=float)).astype(np.int64)
+
+    codes = np.zeros(len(dates), dtype=np.int64)
+    coords = {}
+    for key in keys:
+        if key == 'year':
+            year_codes, labels = pd.factorize(years[valid], sort=True)
+            key_codes = np.zeros(len(dates), dtype=np.int64)
+            key_codes[valid] = year_codes
+        elif key == 'season':
+            key_codes, labels = season_codes.astype(np.int64), np.array(season_names)
+        elif key == 'month':
+            key_codes, labels = months - 1, np.arange(1, 13)
+        else:
+            raise ValueError(f"Unknown grouping '{key}'. Use 'year', 'season' or 'month'.")
+        codes = codes * len(labels) + key_codes
+        coords[key] = np.asarray(labels)
+
+    codes[~valid] = -1
+
+    group_shape = tuple(len(labels) for labels in coords.values())
+    n_groups = int(np.prod(group_shape))
+    space_shape = tuple(data.shape[1:])
+    step = max(1, chunk_size // max(int(np.prod(space_shape, dtype=np.int64)), 1))
+
+    exceedances = np.zeros((n_groups,) + space_shape, dtype=np.int64)
+    n_valid = np.zeros((n_groups,) + space_shape, dtype=np.int64)
+    for start in range(0, len(dates), step):
+        chunk = np.asarray(data[start:start + step])
+        chunk_codes = codes[start:start + len(chunk)]
+        exceedances += _count_by_group(chunk >= threshold, chunk_codes, n_groups)
+        n_valid += _count_by_group(~np.isnan(chunk), chunk_codes, n_groups)
+
+    if isinstance(data, xr.DataArray):
+        space_dims = list(data.dims[1:])
+        space_coords = {dim: data[dim].values for dim in space_dims if dim in data.coords}
+    else:
+        space_dims = ['y', 'x'] if len(space_shape) == 2 else [f'dim_{i}' for i in range(1, len(space_shape) + 1)]
+        space_coords = {}
+
+    dims = list(coords) + space_dims
+    result = xr.Dataset(
+        {
+            'exceedances': (dims, exceedances.reshape(group_shape + space_shape)),
+            'n_valid': (dims, n_valid.reshape(group_shape + space_shape)),
+        },
+        coords={**coords, **space_coords},
+        attrs={'threshold': threshold}
+    )
+    if allowed is not None:
+        result['above_limit'] = result['exceedances'] > allowed
+        result.attrs['allowed'] = allowed
+
+    return result
+
 
 #####################################
 # Spatial Functions
 #####################################
 
-def extract_points(raster_data: np.ndarray, lons: np.ndarray, lats: np.ndarray,
-                 points: List[Tuple[float, float]], method: str = 'nearest') -> np.ndarray:
+def _bracket_indices(coords: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    Extract data values from a raster grid at specified point locations.
+    Locate values between the nodes of a strictly monotonic 1D coordinate, vectorized.
 
-    Currently supports only 'nearest' neighbor interpolation.
+    Args:
+        coords: 1D NumPy array of at least two increasing or decreasing coordinates.
+        values: 1D NumPy array of coordinates to locate.
+
+    Returns:
+        A tuple (lower, upper, frac, inside) of arrays with one entry per value:
+        the indices of the two enclosing nodes (nearest edge cell pair for values
+        outside the grid), the fractional distance from coords[lower] towards
+        coords[upper], and whether the value lies within the coordinate range.
+    """
+    increasing = coords[-1] > coords[0]
+    ordered = coords if increasing else coords[::-1]
+    n = len(ordered)
+
+    upper = np.clip(np.searchsorted(ordered, values, side='right'), 1, n - 1)
+    lower = upper - 1
+    frac = (values - ordered[lower]) / (ordered[upper] - ordered[lower])
+    inside = (values >= ordered[0]) & (values <= ordered[-1])
+
+    if not increasing:
+        # Map the indices back to the original (decreasing) order
+        lower, upper = n - 1 - lower, n - 1 - upper
+
+    return lower, upper, frac, inside
+
+def _point_weights(lons: np.ndarray, lats: np.ndarray, points: Union[List[Tuple[float, float]], np.ndarray],
+                   method: str = 'nearest', power: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the grid cells and weights that sample a regular grid at point locations.
 
     Args:
-        raster_data: 2D NumPy array representing the raster grid data. Assumes (latitude, longitude) dimensions.
-        lons: 1D NumPy array of longitude coordinates corresponding to the columns of raster_data.
-              Must be monotonically increasing.
-        lats: 1D NumPy array of latitude coordinates corresponding to the rows of raster_data.
-              Must be monotonically increasing or decreasing.
-        points: A list of tuples, where each tuple is a (longitude, latitude) coordinate pair.
-        method: Interpolation method. Currently only 'nearest' is implemented. Defaults to 'nearest'.
+        lons: 1D NumPy array of strictly increasing longitudes.
+        lats: 1D NumPy array of strictly increasing or decreasing latitudes.
+        points: Sequence or (n, 2) array of (longitude, latitude) pairs.
+        method: 'nearest', 'bilinear' or 'idw'.
+        power: Power of the inverse distance weighting.
 
     Returns:
-        A 1D NumPy array containing the extracted data values for each point.
-        Returns np.nan for points outside the raster bounds or if errors occur.
+        A tuple (rows, cols, weights, inside): (n, k) arrays of latitude and
+        longitude indices and their weights, with k = 1 for 'nearest' and 4
+        otherwise, and a boolean array marking points inside the grid.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    lon_points, lat_points = points[:, 0], points[:, 1]
+    n_points = len(points)
+
+    if method == 'nearest':
+        # Values outside the grid are snapped to the nearest edge cell
+        rows = np.zeros(n_points, dtype=np.intp)
+        cols = np.zeros(n_points, dtype=np.intp)
+        if len(lats) > 1:
+            lower, upper, _, _ = _bracket_indices(lats, lat_points)
+            rows = np.where(np.abs(lats[upper] - lat_points) < np.abs(lats[lower] - lat_points), upper, lower)
+        if len(lons) > 1:
+            lower, upper, _, _ = _bracket_indices(lons, lon_points)
+            cols = np.where(np.abs(lons[upper] - lon_points) < np.abs(lons[lower] - lon_points), upper, lower)
+        return rows[:, None], cols[:, None], np.ones((n_points, 1)), np.ones(n_points, dtype=bool)
+
+    if len(lats) < 2 or len(lons) < 2:
+        raise ValueError(f"Method '{method}' needs at least two latitudes and two longitudes.")
+
+    row0, row1, fy, lat_inside = _bracket_indices(lats, lat_points)
+    col0, col1, fx, lon_inside = _bracket_indices(lons, lon_points)
+
+    # Corners in the order (row0, col0), (row0, col1), (row1, col0), (row1, col1)
+    rows = np.stack([row0, row0, row1, row1], axis=1)
+    cols = np.stack([col0, col1, col0, col1], axis=1)
+
+    if method == 'bilinear':
+        weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+    else:
+        # Distances in degrees with longitudes shortened by the cosine of the latitude
+        dx = (lons[cols] - lon_points[:, None]) * np.cos(np.radians(lat_points))[:, None]
+        dy = lats[rows] - lat_points[:, None]
+        distance = np.hypot(dx, dy)
+        exact = distance == 0
+        with np.errstate(divide='ignore'):
+            weights = np.where(exact.any(axis=1)[:, None], exact.astype(float), 1.0 / distance ** power)
+
+    return rows, cols, weights, lat_inside & lon_inside
+
+def _apply_point_weights(raster_data: np.ndarray, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray,
+                         inside: np.ndarray, skip_nan: bool = False) -> np.ndarray:
+    """
+    Sample a raster (or a stack of rasters) with precomputed point weights.
 
-    Raises:
-        ValueError: If dimensions mismatch or unsupported method is requested.
+    Args:
+        raster_data: NumPy array whose last two dimensions are (latitude, longitude).
+        rows, cols, weights, inside: Sampling arrays from _point_weights.
+        skip_nan: If True, NaN cells are left out and the remaining weights renormalized.
+
+    Returns:
+        NumPy array shaped (..., n_points) with the leading dimensions of raster_data.
     """
-    if method != 'nearest':
-        raise ValueError(f"Method '{method}' not supported. Currently only 'nearest' is implemented.")
-    if raster_data.ndim != 2:
-        raise ValueError(f"raster_data must be a 2D array, but got {raster_data.ndim} dimensions.")
-    if raster_data.shape[0] != len(lats) or raster_data.shape[1] != len(lons):
-        raise ValueError(f"Raster dimensions ({raster_data.shape}) do not match coordinate lengths (lats: {len(lats)}, lons: {len(lons)}).")
+    if weights.shape[1] == 1:
+        # Nearest neighbour: plain fancy indexing keeps the dtype and the exact values
+        values = raster_data[..., rows[:, 0], cols[:, 0]]
+        if inside.all():
+            return values
+        values = values.astype(float)
+        values[..., ~inside] = np.nan
+        return values
+
+    values = raster_data[..., rows, cols]
+    if skip_nan:
+        valid = ~np.isnan(values)
+        weights = np.where(valid, weights, 0.0)
+        values = np.where(valid, values, 0.0)
+
+    total = weights.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (values * weights).sum(axis=-1) / total
+    result[..., ~inside] = np.nan
 
-    # Check monotonicity of coordinates for reliable index finding
-    if not np.all(np.diff(lons) > 0):
-        raise ValueError("Longitude coordinates must be monotonically increasing.")
-    # Latitude can be increasing or decreasing
-    lat_increasing = np.all(np.diff(lats) > 0)
-    lat_decreasing = np.all(np.diff(lats) < 0)
-    if not (lat_increasing or lat_decreasing):
-         raise ValueError("Latitude coordinates must be strictly monotonic (either increasing or decreasing).")
+    return result
 
+EARTH_RADIUS_KM = 6371.0
 
-    extracted_values = []
+def _lonlat_to_xyz(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """
+    Convert longitudes and latitudes to points on the unit sphere.
 
-    for lon_point, lat_point in points:
-        try:
-            # Find the index of the nearest longitude
-            # np.searchsorted finds where the element *would be inserted*
-            # We adjust to find the truly nearest index
-            lon_idx_insert = np.searchsorted(lons, lon_point)
-            if lon_idx_insert == 0:
-                lon_idx = 0
-            elif lon_idx_insert == len(lons):
-                lon_idx = len(lons) - 1
-            else:
-                # Check which neighbor is closer
-                if abs(lons[lon_idx_insert] - lon_point) < abs(lons[lon_idx_insert - 1] - lon_point):
-                    lon_idx = lon_idx_insert
-                else:
-                    lon_idx = lon_idx_insert - 1
-
-            # Find the index of the nearest latitude (handle increasing/decreasing)
-            lat_idx_insert = np.searchsorted(lats, lat_point) if lat_increasing else np.searchsorted(lats[::-1], lat_point)
-
-            if lat_idx_insert == 0:
-                lat_idx_raw = 0
-            elif lat_idx_insert == len(lats):
-                lat_idx_raw = len(lats) - 1
-            else:
-                 # Check which neighbor is closer (adjusting for potential reversal)
-                 lat_comp1 = lats[lat_idx_insert] if lat_increasing else lats[len(lats) - 1 - lat_idx_insert]
-                 lat_comp2 = lats[lat_idx_insert - 1] if lat_increasing else lats[len(lats) - lat_idx_insert] # index before insertion point
-
-                 if abs(lat_comp1 - lat_point) < abs(lat_comp2 - lat_point):
-                     lat_idx_raw = lat_idx_insert
-                 else:
-                     lat_idx_raw = lat_idx_insert - 1
-
-            # Convert index back if latitude was decreasing
-            lat_idx = lat_idx_raw if lat_increasing else len(lats) - 1 - lat_idx_raw
-
-
-            # Check bounds strictly (indices must be valid)
-            if 0 <= lat_idx < raster_data.shape[0] and 0 <= lon_idx < raster_data.shape[1]:
-                 extracted_values.append(raster_data[lat_idx, lon_idx])
-            else:
-                 # This case should ideally be caught by the index logic, but as a safeguard
-                 print(f"Warning: Point ({lon_point}, {lat_point}) resulted in out-of-bounds indices ({lat_idx}, {lon_idx}). Appending NaN.")
-                 extracted_values.append(np.nan)
+    Args:
+        lons: NumPy array of longitudes in degrees.
+        lats: NumPy array of latitudes in degrees, same shape as lons.
 
-        except Exception as e:
-             print(f"Error processing point ({lon_point}, {lat_point}): {e}. Appending NaN.")
-             extracted_values.append(np.nan)
+    Returns:
+        A NumPy array shaped (..., 3) of Cartesian (x, y, z) coordinates.
+    """
+    lon = np.radians(lons)
+    lat = np.radians(lats)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
 
+class CurvilinearGridIndex:
+    """
+    Spatial index for nearest-cell queries on a curvilinear grid.
+
+    Curvilinear grids such as WRF output have 2D latitude and longitude
+    arrays (XLAT/XLONG), so cells cannot be located with a per-axis search.
+    The index builds a KD-tree on the unit-sphere coordinates of all cells
+    once and then answers nearest and k-nearest queries for many points in
+    bulk. Distances on the unit sphere are free of the distortion of degree
+    distances and of the dateline. Requires scipy.
+
+    Attributes:
+        shape: Shape (south_north, west_east) of the grid.
+        tree: The scipy cKDTree over the flattened grid cells.
+    """
+
+    def __init__(self, lons: np.ndarray, lats: np.ndarray):
+        """
+        Build the KD-tree of a curvilinear grid.
+
+        Args:
+            lons: 2D NumPy array of cell longitudes in degrees.
+            lats: 2D NumPy array of cell latitudes in degrees, same shape as lons.
+
+        Raises:
+            ImportError: If scipy is not installed.
+            ValueError: If the coordinate arrays are not 2D arrays of one shape.
+        """
+        if cKDTree is None:
+            raise ImportError("scipy is required for point extraction on curvilinear grids (pip install scipy).")
+
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        if lons.ndim != 2 or lons.shape != lats.shape:
+            raise ValueError(f"Curvilinear coordinates must be 2D arrays of the same shape, but got lons {lons.shape} and lats {lats.shape}.")
+
+        self.shape = lons.shape
+        self.tree = cKDTree(_lonlat_to_xyz(lons, lats).reshape(-1, 3))
+
+    def query(self, points: Union[List[Tuple[float, float]], np.ndarray],
+              k: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the k nearest grid cells of every point.
+
+        Args:
+            points: A list of (longitude, latitude) tuples or an (n, 2) array of them.
+            k: Number of neighbours per point. Defaults to 1.
+
+        Returns:
+            A tuple (rows, cols, distances) of (n, k) NumPy arrays: the grid indices
+            of the neighbours, nearest first, and their great-circle distances in km.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k = min(k, self.tree.n)
+
+        chord, flat = self.tree.query(_lonlat_to_xyz(points[:, 0], points[:, 1]), k=k)
+        chord = np.reshape(chord, (len(points), k))
+        rows, cols = np.unravel_index(np.reshape(flat, (len(points), k)), self.shape)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+        return rows, cols, distances
+
+def _curvilinear_point_weights(index: CurvilinearGridIndex, points: Union[List[Tuple[float, float]], np.ndarray],
+                               method: str = 'nearest', k: int = 4, power: float = 2.0,
+                               max_distance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the grid cells and weights that sample a curvilinear grid at point locations.
+
+    Args:
+        index: CurvilinearGridIndex of the grid.
+        points: Sequence or (n, 2) array of (longitude, latitude) pairs.
+        method: 'nearest' or 'idw' (inverse distance weighting of the k nearest cells).
+        k: Number of neighbours for 'idw'.
+        power: Power of the inverse distance weighting.
+        max_distance: Points farther than this from the nearest cell, in km, are
+                      outside the grid. None keeps all points.
+
+    Returns:
+        A tuple (rows, cols, weights, inside) as returned by _point_weights.
+    """
+    if method not in ('nearest', 'idw'):
+        raise ValueError(f"Method '{method}' not supported on curvilinear grids. Use 'nearest' or 'idw'.")
+
+    rows, cols, distances = index.query(points, k=1 if method == 'nearest' else k)
+
+    if method == 'nearest':
+        weights = np.ones(distances.shape)
+    else:
+        exact = distances == 0
+        with np.errstate(divide='ignore'):
+            weights = np.where(exact.any(axis=1)[:, None], exact.astype(float), 1.0 / distances ** power)
+
+    inside = np.ones(len(distances), dtype=bool) if max_distance is None else distances[:, 0] <= max_distance
+
+    return rows, cols, weights, inside
+
+class PointSampler:
+    """
+    Precomputed sampling of a grid at a fixed set of point locations.
+
+    The grid cells and weights are located once; every call afterwards is a
+    single fancy-indexing operation, so the same stations can be sampled from
+    many files on the same grid cheaply. Samplers can be pickled or saved to
+    and loaded from a .npz file.
+
+    Regular grids are given by 1D coordinates. Curvilinear grids, e.g. WRF
+    XLONG/XLAT, are given by 2D coordinates and located with a
+    CurvilinearGridIndex (KD-tree); they support 'nearest' and 'idw'.
+
+    Attributes:
+        lons: 1D (regular) or 2D (curvilinear) NumPy array of grid longitudes.
+        lats: 1D (regular) or 2D (curvilinear) NumPy array of grid latitudes.
+        points: (n, 2) NumPy array of (longitude, latitude) pairs.
+        method: Sampling method, 'nearest', 'bilinear' or 'idw'.
+        power: Power of the inverse distance weighting.
+        rows, cols, weights: (n, k) NumPy arrays of grid indices and weights.
+        inside: Boolean NumPy array marking points inside the grid.
+    """
+
+    METHODS = ('nearest', 'bilinear', 'idw')
+
+    def __init__(self, lons: np.ndarray, lats: np.ndarray, points: Union[List[Tuple[float, float]], np.ndarray],
+                 method: str = 'nearest', power: float = 2.0, k: int = 4, max_distance: Optional[float] = None,
+                 index: Optional[CurvilinearGridIndex] = None):
+        """
+        Locate the points on the grid and compute their sampling weights.
+
+        Args:
+            lons: 1D NumPy array of longitudes, monotonically increasing, or 2D array
+                  of curvilinear cell longitudes.
+            lats: 1D NumPy array of latitudes, monotonically increasing or decreasing,
+                  or 2D array of curvilinear cell latitudes.
+            points: A list of (longitude, latitude) tuples or an (n, 2) array of them.
+            method: 'nearest', 'bilinear' or 'idw' (see extract_points). Defaults to 'nearest'.
+            power: Power of the inverse distance weighting. Defaults to 2.0.
+            k: Curvilinear grids only: number of nearest cells weighted by 'idw'. Defaults to 4.
+            max_distance: Curvilinear grids only: points farther than this from the nearest
+                          cell, in km, are outside the grid and sampled as np.nan.
+            index: Curvilinear grids only: prebuilt CurvilinearGridIndex of the grid, to
+                   share one KD-tree between several station sets.
+
+        Raises:
+            ValueError: If the coordinates are not monotonic or the method is unsupported.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Method '{method}' not supported. Use 'nearest', 'bilinear' or 'idw'.")
+
+        self.lons = np.asarray(lons, dtype=float)
+        self.lats = np.asarray(lats, dtype=float)
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.method = method
+        self.power = float(power)
+
+        if self.lons.ndim == 2:
+            if index is None:
+                index = CurvilinearGridIndex(self.lons, self.lats)
+            elif index.shape != self.lons.shape:
+                raise ValueError(f"Index shape {index.shape} does not match the coordinate shape {self.lons.shape}.")
+            self.rows, self.cols, self.weights, self.inside = _curvilinear_point_weights(
+                index, self.points, method, k, self.power, max_distance)
+            return
+
+        # Check monotonicity of coordinates for reliable index finding
+        if not np.all(np.diff(self.lons) > 0):
+            raise ValueError("Longitude coordinates must be monotonically increasing.")
+        # Latitude can be increasing or decreasing
+        lat_increasing = np.all(np.diff(self.lats) > 0)
+        lat_decreasing = np.all(np.diff(self.lats) < 0)
+        if not (lat_increasing or lat_decreasing):
+             raise ValueError("Latitude coordinates must be strictly monotonic (either increasing or decreasing).")
+
+        self.rows, self.cols, self.weights, self.inside = _point_weights(self.lons, self.lats, self.points,
+                                                                         method, self.power)
+
+    @property
+    def grid_shape(self) -> Tuple[int, int]:
+        """Shape (n_lats, n_lons) of the grid the sampler was built for."""
+        if self.lons.ndim == 2:
+            return self.lons.shape
+        return (len(self.lats), len(self.lons))
+
+    @property
+    def n_points(self) -> int:
+        """Number of sampled points."""
+        return len(self.points)
+
+    def matches(self, lons: np.ndarray, lats: np.ndarray) -> bool:
+        """
+        Check whether the sampler was built for the given grid coordinates.
+
+        Args:
+            lons: 1D NumPy array of longitudes.
+            lats: 1D NumPy array of latitudes.
+
+        Returns:
+            True if both coordinate arrays equal those of the sampler.
+        """
+        return np.array_equal(self.lons, np.asarray(lons, dtype=float)) and \
+            np.array_equal(self.lats, np.asarray(lats, dtype=float))
+
+    def sample(self, raster_data: np.ndarray) -> np.ndarray:
+        """
+        Sample a raster, or a stack of rasters, at the points.
+
+        Args:
+            raster_data: NumPy array whose last two dimensions are (latitude, longitude).
+
+        Returns:
+            A NumPy array shaped (..., n_points), as returned by extract_points.
+
+        Raises:
+            ValueError: If the raster does not match the grid of the sampler.
+        """
+        if raster_data.ndim < 2:
+            raise ValueError(f"raster_data must have at least 2 dimensions, but got {raster_data.ndim}.")
+        if raster_data.shape[-2:] != self.grid_shape:
+            raise ValueError(f"Raster dimensions ({raster_data.shape}) do not match the grid shape {self.grid_shape}.")
+
+        return _apply_point_weights(raster_data, self.rows, self.cols, self.weights, self.inside,
+                                    skip_nan=(self.method == 'idw'))
+
+    __call__ = sample
+
+    def save(self, file_path: str) -> None:
+        """
+        Save the sampler to a NumPy .npz file.
+
+        Args:
+            file_path: Output path. NumPy appends '.npz' if missing.
+        """
+        np.savez(file_path, lons=self.lons, lats=self.lats, points=self.points, method=self.method,
+                 power=self.power, rows=self.rows, cols=self.cols, weights=self.weights, inside=self.inside)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'PointSampler':
+        """
+        Load a sampler saved with save() without recomputing the weights.
+
+        Args:
+            file_path: Path to the .npz file.
+
+        Returns:
+            The restored PointSampler.
+        """
+        sampler = cls.__new__(cls)
+        with np.load(file_path) as data:
+            sampler.lons = data['lons']
+            sampler.lats = data['lats']
+            sampler.points = data['points']
+            sampler.method = str(data['method'])
+            sampler.power = float(data['power'])
+            sampler.rows = data['rows']
+            sampler.cols = data['cols']
+            sampler.weights = data['weights']
+            sampler.inside = data['inside']
+        return sampler
+
+    def __repr__(self) -> str:
+        return f"PointSampler(n_points={self.n_points}, grid_shape={self.grid_shape}, method='{self.method}')"
+
+def extract_points(raster_data: np.ndarray, lons: np.ndarray, lats: np.ndarray,
+                 points: Union[List[Tuple[float, float]], np.ndarray], method: str = 'nearest',
+                 power: float = 2.0, k: int = 4, max_distance: Optional[float] = None) -> np.ndarray:
+    """
+    Extract data values from a raster grid at specified point locations.
+
+    All points are located with one vectorized search per axis, so thousands
+    of stations are sampled in a single array operation. A stack of rasters,
+    e.g. (time, latitude, longitude), is sampled at once, giving the time
+    series of every point. To sample the same points from many rasters on one
+    grid, build a PointSampler once and call it for each raster instead.
+
+    Curvilinear grids with 2D coordinates, e.g. WRF XLONG/XLAT, are located
+    with a KD-tree on the unit sphere (requires scipy) and support 'nearest'
+    and 'idw' over the k nearest cells.
+
+    Args:
+        raster_data: NumPy array whose last two dimensions are (latitude, longitude),
+                     e.g. a 2D raster or a 3D (time, latitude, longitude) cube.
+        lons: 1D NumPy array of longitude coordinates corresponding to the columns of raster_data,
+              monotonically increasing, or a 2D array of curvilinear cell longitudes.
+        lats: 1D NumPy array of latitude coordinates corresponding to the rows of raster_data,
+              monotonically increasing or decreasing, or a 2D array of curvilinear cell latitudes.
+        points: A list of (longitude, latitude) tuples or an (n, 2) array of them.
+        method: 'nearest' (nearest grid cell), 'bilinear' (bilinear interpolation between
+                the four surrounding cells) or 'idw' (inverse distance weighting of the four
+                surrounding cells, ignoring NaN cells). Defaults to 'nearest'.
+        power: Power of the inverse distance weighting. Defaults to 2.0.
+        k: Curvilinear grids only: number of nearest cells weighted by 'idw'. Defaults to 4.
+        max_distance: Curvilinear grids only: points farther than this from the nearest cell,
+                      in km, are np.nan. Defaults to None (no limit).
+
+    Returns:
+        A NumPy array shaped (..., n_points) holding the values at each point for every
+        leading dimension of raster_data; 1D for a 2D raster. With 'nearest', points
+        outside a regular grid take the value of the nearest edge cell; with 'bilinear'
+        and 'idw' they are np.nan.
+
+    Raises:
+        ValueError: If dimensions mismatch or unsupported method is requested.
+    """
+    if method not in PointSampler.METHODS:
+        raise ValueError(f"Method '{method}' not supported. Use 'nearest', 'bilinear' or 'idw'.")
+    if raster_data.ndim < 2:
+        raise ValueError(f"raster_data must have at least 2 dimensions, but got {raster_data.ndim}.")
+    if np.ndim(lons) == 2:
+        if raster_data.shape[-2:] != np.shape(lons):
+            raise ValueError(f"Raster dimensions ({raster_data.shape}) do not match the coordinate shape {np.shape(lons)}.")
+    elif raster_data.shape[-2] != len(lats) or raster_data.shape[-1] != len(lons):
+        raise ValueError(f"Raster dimensions ({raster_data.shape}) do not match coordinate lengths (lats: {len(lats)}, lons: {len(lons)}).")
 
-    return np.array(extracted_values)
+    return PointSampler(lons, lats, points, method, power, k, max_distance).sample(raster_data)
 
 def raster_difference(raster1: np.ndarray, raster2: np.ndarray) -> np.ndarray:
     """
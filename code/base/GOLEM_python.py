@@ -13,6 +13,10 @@ The library is structured into modules:
 Author: GOLEM Team
 """
 
+import os
+import glob
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -20,6 +24,16 @@ import matplotlib.gridspec as gridspec
 from matplotlib.colors import LinearSegmentedColormap
 import xarray as xr
 from typing import Dict, List, Tuple, Union, Callable, Optional, Any
+# Optional: scipy provides the KD-tree for point extraction on curvilinear grids
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+# Optional: dask provides chunked arrays for lazy NetCDF reads
+try:
+    import dask
+except ImportError:
+    dask = None
 
 #####################################
 # Data Processing Module
@@ -56,31 +70,57 @@ class DataProcessing:
         return np.where(data >= threshold, 1, 0)
     
     @staticmethod
-    def read_netcdf(file_path: str, variables: List[str] = None) -> Dict[str, np.ndarray]:
+    def read_netcdf(file_path: str, variables: List[str] = None, sel: Optional[Dict[str, Any]] = None,
+                    isel: Optional[Dict[str, Any]] = None, lazy: bool = False,
+                    chunks: Optional[Union[str, Dict[str, int]]] = None) -> Dict[str, Union[np.ndarray, xr.DataArray]]:
         """
         Read data from NetCDF file.
         
+        Selections are applied before any data is read, so only the selected
+        part of the file is loaded. With lazy=True the variables are returned
+        as unloaded DataArrays that compute on demand.
+        
         Args:
             file_path: Path to NetCDF file
             variables: List of variable names to extract
+            sel: Label-based selection, e.g. {'time': slice('2020-06', '2020-08')}
+            isel: Index-based selection, e.g. {'time': slice(0, 24)}
+            lazy: Return unloaded xarray DataArrays instead of arrays
+            chunks: Dask chunk sizes, e.g. {'time': 24} (implies lazy, requires dask)
             
         Returns:
             Dictionary with variable names as keys and arrays as values
         """
+        if chunks is not None:
+            lazy = True
+            if dask is None:
+                print("Warning: dask is not installed, reading without chunks")
+                chunks = None
+                
         try:
-            ds = xr.open_dataset(file_path)
-            result = {}
+            ds = xr.open_dataset(file_path, chunks=chunks)
+        except Exception as e:
+            print(f"Error reading NetCDF file: {e}")
+            return {}
             
+        try:
             if variables is None:
                 variables = list(ds.data_vars)
                 
-            for var in variables:
-                if var in ds:
-                    result[var] = ds[var].values
-                    
+            subset = ds[[var for var in variables if var in ds]]
+            if isel:
+                subset = subset.isel(isel, missing_dims='ignore')
+            if sel:
+                subset = subset.sel(sel)
+                
+            if lazy:
+                return {var: subset[var] for var in subset.data_vars}
+                
+            result = {var: subset[var].values for var in subset.data_vars}
             ds.close()
             return result
         except Exception as e:
+            ds.close()
             print(f"Error reading NetCDF file: {e}")
             return {}
     
@@ -103,7 +143,9 @@ class DataProcessing:
         return data[data[alt_col] < max_alt]
     
     @staticmethod
-    def filter_by_season(data: pd.DataFrame, date_col: str = 'date', season: str = 'JJA') -> pd.DataFrame:
+    def filter_by_season(data: pd.DataFrame, date_col: str = 'date', season: str = 'JJA',
+                         seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                         index: Optional['SeasonIndex'] = None) -> pd.DataFrame:
         """
         Filter dataframe by meteorological season.
         
@@ -111,29 +153,27 @@ class DataProcessing:
             data: Input dataframe
             date_col: Name of date column
             season: Season code (DJF, MAM, JJA, SON)
-            
+            seasons: Optional dictionary of season names and months replacing DJF, MAM, JJA, SON
+            index: Optional SeasonIndex of the date column instead of the cached one
+        
         Returns:
             Filtered dataframe
         """
         if date_col not in data.columns:
             raise ValueError(f"Column {date_col} not found in dataframe")
         
-        season_map = {
-            'DJF': [12, 1, 2],
-            'MAM': [3, 4, 5],
-            'JJA': [6, 7, 8],
-            'SON': [9, 10, 11]
-        }
-        
-        if season not in season_map:
-            raise ValueError(f"Unknown season: {season}. Use DJF, MAM, JJA, or SON.")
+        valid_seasons = index.seasons if index is not None else DataProcessing.SEASON_MONTHS if seasons is None else seasons
+        if season not in valid_seasons:
+            raise ValueError(f"Unknown season: {season}. Use {', '.join(valid_seasons)}.")
         
-        # Extract month and filter
-        months = pd.DatetimeIndex(data[date_col]).month
-        return data[months.isin(season_map[season])]
+        # Season codes of the date column are cached across calls
+        index = DataProcessing._frame_season_index(data, date_col, seasons, 1, index)
+        return data[index.mask(season)]
     
     @staticmethod
-    def aggregate_by_season(data: pd.DataFrame, date_col: str = 'date', value_col: str = 'value') -> Dict[str, pd.DataFrame]:
+    def aggregate_by_season(data: pd.DataFrame, date_col: str = 'date', value_col: str = 'value',
+                            seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                            index: Optional['SeasonIndex'] = None) -> Dict[str, pd.DataFrame]:
         """
         Aggregate data by season.
         
@@ -141,31 +181,523 @@ class DataProcessing:
             data: Input dataframe
             date_col: Name of date column
             value_col: Name of value column
-            
+            seasons: Optional dictionary of season names and months replacing DJF, MAM, JJA, SON
+            index: Optional SeasonIndex of the date column instead of the cached one
+        
         Returns:
             Dictionary with season codes as keys and aggregated data as values
         """
         if date_col not in data.columns or value_col not in data.columns:
             raise ValueError(f"Columns {date_col} or {value_col} not found in dataframe")
         
-        season_map = {
-            'DJF': [12, 1, 2],
-            'MAM': [3, 4, 5],
-            'JJA': [6, 7, 8],
-            'SON': [9, 10, 11]
-        }
+        index = DataProcessing._frame_season_index(data, date_col, seasons, 1, index)
+        
+        # Row positions of every season from one pass over the codes
+        positions = pd.Series(index.codes).groupby(index.codes).indices
+        return {name: data.iloc[positions[code]] for code, name in enumerate(index.names) if code in positions}
+    
+    @staticmethod
+    def group_by_season(data: pd.DataFrame, date_col: str = 'date', seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                        by_year: bool = False, year_start_month: int = 1, by: Optional[Union[str, List[str]]] = None,
+                        index: Optional['SeasonIndex'] = None) -> 'pd.core.groupby.DataFrameGroupBy':
+        """
+        Group dataframe by season without copying it.
+        
+        Args:
+            data: Input dataframe
+            date_col: Name of date column
+            seasons: Optional dictionary of season names and months replacing DJF, MAM, JJA, SON
+            by_year: Whether to group by year and season
+            year_start_month: First month of the year when by_year is set
+                              (12 puts December into the following DJF, 10 gives hydrological years)
+            by: Optional column name(s) grouped before year and season
+            index: Optional SeasonIndex of the date column (its seasons and year start take precedence)
+        
+        Returns:
+            DataFrameGroupBy with the levels by, 'year' and 'season'
+        """
+        if date_col not in data.columns:
+            raise ValueError(f"Column {date_col} not found in dataframe")
+        by = [] if by is None else [by] if isinstance(by, str) else list(by)
+        for col in by:
+            if col not in data.columns:
+                raise ValueError(f"Column {col} not found in dataframe")
+        
+        index = DataProcessing._frame_season_index(data, date_col, seasons, year_start_month if by_year else 1, index)
+        
+        keys = [data[col] for col in by]
+        if by_year:
+            keys.append(pd.Series(index.years, index=data.index, name='year'))
+        keys.append(pd.Series(index.labels(), index=data.index, name='season'))
+        
+        return data.groupby(keys, observed=True, sort=True)
+    
+    @staticmethod
+    def season_statistics(data: pd.DataFrame, date_col: str = 'date', value_col: Union[str, List[str]] = 'value',
+                          stats: Tuple[str, ...] = ('count', 'mean', 'std', 'min', 'max'),
+                          percentiles: Tuple[float, ...] = (), seasons: Optional[Dict[str, Tuple[int, ...]]] = None,
+                          by_year: bool = False, year_start_month: int = 1, by: Optional[Union[str, List[str]]] = None,
+                          index: Optional['SeasonIndex'] = None) -> pd.DataFrame:
+        """
+        Calculate statistics per season from one grouping of the data.
         
-        result = {}
+        Args:
+            data: Input dataframe
+            date_col: Name of date column
+            value_col: Name(s) of value column(s)
+            stats: Pandas aggregation names
+            percentiles: Percentiles (0-100) added as columns 'p<percentile>'
+            seasons: Optional dictionary of season names and months replacing DJF, MAM, JJA, SON
+            by_year: Whether to aggregate per year and season
+            year_start_month: First month of the year when by_year is set
+            by: Optional column name(s) to aggregate separately
+            index: Optional SeasonIndex of the date column
         
-        # Extract month
-        months = pd.DatetimeIndex(data[date_col]).month
+        Returns:
+            Dataframe indexed by by, 'year' and 'season' with one column per statistic
+        """
+        value_cols = [value_col] if isinstance(value_col, str) else list(value_col)
+        for col in value_cols:
+            if col not in data.columns:
+                raise ValueError(f"Column {col} not found in dataframe")
         
-        for season, season_months in season_map.items():
-            season_data = data[months.isin(season_months)]
-            if not season_data.empty:
-                result[season] = season_data
+        grouped = DataProcessing.group_by_season(data, date_col, seasons, by_year, year_start_month, by, index)[value_cols]
+        result = grouped.agg(list(stats))
+        for q in percentiles:
+            quantiles = grouped.quantile(q / 100)
+            for col in value_cols:
+                result[(col, f'p{q:g}')] = quantiles[col]
         
+        if isinstance(value_col, str):
+            result.columns = result.columns.droplevel(0)
         return result
+    
+    SEASON_MONTHS = {
+        'DJF': (12, 1, 2),
+        'MAM': (3, 4, 5),
+        'JJA': (6, 7, 8),
+        'SON': (9, 10, 11)
+    }
+    
+    # Recently built season indices, keyed by a fingerprint of their dates and settings
+    _SEASON_INDEX_CACHE: Dict[Tuple, 'SeasonIndex'] = {}
+    _SEASON_INDEX_CACHE_SIZE = 8
+    
+    @staticmethod
+    def _dates_fingerprint(raw: np.ndarray) -> Tuple:
+        """
+        Fingerprint of an array of dates: length, dtype and hash of all dates.
+        
+        Args:
+            raw: Array of dates
+        
+        Returns:
+            Hashable fingerprint tuple
+        """
+        # Fixed-width values are hashed as raw bytes, objects via one 64-bit hash each
+        values = pd.util.hash_array(raw) if raw.dtype == object else np.ascontiguousarray(raw).view(np.uint8)
+        return len(raw), raw.dtype.str, hashlib.sha1(values).hexdigest()
+    
+    @staticmethod
+    def season_index(dates: Union[pd.DatetimeIndex, pd.Series, np.ndarray],
+                     seasons: Optional[Dict[str, Tuple[int, ...]]] = None, year_start_month: int = 1) -> 'SeasonIndex':
+        """
+        Return the SeasonIndex of dates, reusing a cached one.
+        
+        The cache is keyed by a hash of all dates and keeps no copies of them;
+        pass an explicit SeasonIndex to the season functions to skip the hashing.
+        
+        Args:
+            dates: DatetimeIndex, Series or array of dates
+            seasons: Optional dictionary of season names and months
+            year_start_month: First month of the year
+        
+        Returns:
+            SeasonIndex of the dates
+        """
+        settings = (tuple((name, tuple(months)) for name, months in (seasons or DataProcessing.SEASON_MONTHS).items()),
+                    year_start_month)
+        key = (DataProcessing._dates_fingerprint(np.asarray(dates)), settings)
+        cache = DataProcessing._SEASON_INDEX_CACHE
+        
+        if key in cache:
+            cache[key] = cache.pop(key)
+            return cache[key]
+        
+        index = SeasonIndex(dates, seasons, year_start_month)
+        cache[key] = index
+        if len(cache) > DataProcessing._SEASON_INDEX_CACHE_SIZE:
+            del cache[next(iter(cache))]
+        
+        return index
+    
+    @staticmethod
+    def _frame_season_index(data: pd.DataFrame, date_col: str, seasons: Optional[Dict[str, Tuple[int, ...]]],
+                            year_start_month: int, index: Optional['SeasonIndex']) -> 'SeasonIndex':
+        """
+        Season index of a dataframe's date column: the given one or the cached one.
+        
+        Args:
+            data: Input dataframe
+            date_col: Name of date column
+            seasons: Optional dictionary of season names and months
+            year_start_month: First month of the year
+            index: Optional SeasonIndex given by the caller
+        
+        Returns:
+            SeasonIndex of the date column
+        """
+        if index is None:
+            return DataProcessing.season_index(data[date_col], seasons, year_start_month)
+        if len(index) != len(data):
+            raise ValueError(f"Index length {len(index)} does not match dataframe length {len(data)}")
+        return index
+    
+    @staticmethod
+    def _season_codes(dates: pd.DatetimeIndex) -> Tuple[np.ndarray, List[str]]:
+        """
+        Encode dates by meteorological season.
+        
+        Args:
+            dates: DatetimeIndex
+        
+        Returns:
+            int8 array of season indices and list of season names
+        """
+        index = DataProcessing.season_index(dates)
+        return index.codes, index.names
+
+
+class SeasonIndex:
+    """
+    Compact season and year codes of a series of dates.
+    
+    The dates are decoded once into an int8 season code (-1 outside all
+    seasons) and a year per date. Years can start in any month, e.g. in
+    October for hydrological years, and are named after the calendar year
+    in which they end.
+    """
+    
+    def __init__(self, dates: Union[pd.DatetimeIndex, pd.Series, np.ndarray],
+                 seasons: Optional[Dict[str, Tuple[int, ...]]] = None, year_start_month: int = 1):
+        """
+        Encode the season and year of every date.
+        
+        Args:
+            dates: DatetimeIndex, Series or array of dates
+            seasons: Optional dictionary of season names and months (default: DJF, MAM, JJA, SON)
+            year_start_month: First month of the year (1 for calendar years)
+        """
+        self.seasons = dict(DataProcessing.SEASON_MONTHS if seasons is None else seasons)
+        self.names = list(self.seasons)
+        self.year_start_month = int(year_start_month)
+        if not 1 <= self.year_start_month <= 12:
+            raise ValueError(f"year_start_month must be between 1 and 12, got {year_start_month}")
+        
+        month_to_code = np.full(13, -1, dtype=np.int8)
+        for code, months in enumerate(self.seasons.values()):
+            for month in months:
+                if not 1 <= month <= 12:
+                    raise ValueError(f"Invalid month {month} in season {self.names[code]}")
+                if month_to_code[month] != -1:
+                    raise ValueError(f"Month {month} belongs to more than one season")
+                month_to_code[month] = code
+        
+        # Missing dates get month 0, which belongs to no season
+        datetime_index = pd.DatetimeIndex(dates)
+        months = np.nan_to_num(np.asarray(datetime_index.month, dtype=float)).astype(np.int8)
+        years = np.nan_to_num(np.asarray(datetime_index.year, dtype=float)).astype(np.int32)
+        self.codes = month_to_code[months]
+        self.years = years + (months >= self.year_start_month) if self.year_start_month > 1 else years
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def code(self, season: str) -> int:
+        """Index of a season in names."""
+        if season not in self.seasons:
+            raise ValueError(f"Unknown season: {season}. Use {', '.join(self.names)}.")
+        return self.names.index(season)
+    
+    def mask(self, season: str) -> np.ndarray:
+        """Boolean array marking the dates of a season."""
+        return self.codes == self.code(season)
+    
+    def labels(self) -> pd.Categorical:
+        """Season names of the dates as a Categorical (NaN outside all seasons)."""
+        return pd.Categorical.from_codes(self.codes, categories=self.names)
+
+
+class NetCDFArchive:
+    """
+    Indexed collection of NetCDF files for fast time-range queries.
+    
+    A JSON index of every file's size, modification time, time range,
+    variables, dimensions and grid hash is kept in the archive root, so
+    reopening an archive only stats the files and time-range queries open
+    only the overlapping files.
+    """
+    
+    INDEX_NAME = '.golem_netcdf_index.json'
+    INDEX_VERSION = 1
+    
+    @staticmethod
+    def _time_string(value: Any) -> str:
+        """
+        Format a time value as ISO 8601 string (strings are returned unchanged).
+        
+        Args:
+            value: datetime64, datetime, Timestamp, cftime date or string
+        
+        Returns:
+            Time string 'YYYY-MM-DDTHH:MM:SS'
+        """
+        if isinstance(value, str):
+            return value
+        if isinstance(value, np.datetime64):
+            return np.datetime_as_string(value, unit='s')
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return pd.Timestamp(value).isoformat()
+    
+    @staticmethod
+    def _grid_hash(ds: xr.Dataset) -> Optional[str]:
+        """
+        Hash the horizontal coordinates of a dataset.
+        
+        Args:
+            ds: xarray Dataset
+        
+        Returns:
+            Hex digest of the lat/lon coordinates, or None without coordinates
+        """
+        digest = hashlib.sha1()
+        found = False
+        for name in ('lat', 'latitude', 'XLAT', 'lon', 'longitude', 'XLONG'):
+            if name in ds.variables:
+                values = np.ascontiguousarray(ds[name].values, dtype=np.float64)
+                digest.update(name.encode())
+                digest.update(str(values.shape).encode())
+                digest.update(values.tobytes())
+                found = True
+        return digest.hexdigest()[:16] if found else None
+    
+    def __init__(self, root: str, pattern: str = '**/*.nc', index_file: Optional[str] = None,
+                 time_dim: str = 'time'):
+        """
+        Load the index of an archive and bring it up to date.
+        
+        Args:
+            root: Folder containing the NetCDF files.
+            pattern: Glob pattern of the files relative to root; '**' matches
+                     subfolders. Defaults to '**/*.nc'.
+            index_file: Path of the JSON index. Defaults to INDEX_NAME in root.
+            time_dim: Name of the time coordinate. Defaults to 'time'.
+        """
+        self.root = os.path.abspath(root)
+        self.pattern = pattern
+        self.index_file = index_file or os.path.join(self.root, self.INDEX_NAME)
+        self.time_dim = time_dim
+        self.entries = {}
+        
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                if index.get('version') == self.INDEX_VERSION and index.get('time_dim') == time_dim:
+                    self.entries = index['files']
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable index '{self.index_file}': {e}")
+        
+        self.update()
+    
+    def _scan_file(self, path: str) -> Dict[str, Any]:
+        """Read the index entry of one file from its header and time coordinate."""
+        stat = os.stat(path)
+        with xr.open_dataset(path) as ds:
+            entry = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'variables': sorted(str(var) for var in ds.data_vars),
+                'dims': {str(dim): int(size) for dim, size in ds.sizes.items()},
+                'grid': self._grid_hash(ds),
+                'time_start': None,
+                'time_end': None,
+                'n_times': 0,
+            }
+            if self.time_dim in ds.coords and ds[self.time_dim].size > 0:
+                times = ds[self.time_dim].values
+                entry['time_start'] = self._time_string(times.min())
+                entry['time_end'] = self._time_string(times.max())
+                entry['n_times'] = int(times.size)
+        return entry
+    
+    def update(self) -> List[str]:
+        """
+        Rescan new and changed files, drop removed ones and save the index.
+        
+        Returns:
+            List of the files (relative to root) that were scanned.
+        """
+        scanned = []
+        entries = {}
+        
+        for path in sorted(glob.glob(os.path.join(self.root, self.pattern), recursive=True)):
+            rel_path = os.path.relpath(path, self.root)
+            stat = os.stat(path)
+            entry = self.entries.get(rel_path)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                try:
+                    entry = self._scan_file(path)
+                except Exception as e:
+                    print(f"Warning: Skipping '{path}': {e}")
+                    continue
+                scanned.append(rel_path)
+            entries[rel_path] = entry
+        
+        changed = bool(scanned) or entries.keys() != self.entries.keys()
+        self.entries = entries
+        if changed:
+            self.save()
+        
+        return scanned
+    
+    def save(self) -> None:
+        """Write the index to index_file."""
+        index = {'version': self.INDEX_VERSION, 'time_dim': self.time_dim, 'files': self.entries}
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_file, self.index_file)
+    
+    def files(self, start: Any = None, end: Any = None, variables: List[str] = None,
+              grid: Optional[str] = None) -> List[str]:
+        """
+        Find the files overlapping a time range.
+        
+        Args:
+            start: Start of the range, inclusive, e.g. '2020-06' or a datetime.
+                   Partial dates are compared at their own precision.
+            end: End of the range, inclusive, e.g. '2020-08' for all of August.
+            variables: Optional list of variables the files must all contain.
+            grid: Optional grid hash the files must have (see summary()).
+        
+        Returns:
+            Absolute file paths sorted by their first time. Files without a time
+            coordinate are only returned if neither start nor end is given.
+        """
+        start = None if start is None else self._time_string(start)
+        end = None if end is None else self._time_string(end)
+        selected = []
+        
+        for rel_path, entry in self.entries.items():
+            if variables and not set(variables) <= set(entry['variables']):
+                continue
+            if grid is not None and entry['grid'] != grid:
+                continue
+            if start is not None or end is not None:
+                if entry['time_start'] is None:
+                    continue
+                if start is not None and entry['time_end'][:len(start)] < start:
+                    continue
+                if end is not None and entry['time_start'][:len(end)] > end:
+                    continue
+            selected.append(rel_path)
+        
+        selected.sort(key=lambda rel_path: (self.entries[rel_path]['time_start'] or '', rel_path))
+        return [os.path.join(self.root, rel_path) for rel_path in selected]
+    
+    def open(self, start: Any = None, end: Any = None, variables: List[str] = None,
+             grid: Optional[str] = None, chunks: Optional[Union[str, Dict[str, int]]] = None) -> xr.Dataset:
+        """
+        Open the time series of a range as one dataset.
+        
+        Only the overlapping files are opened; each is cut to the range before
+        concatenation along time, and duplicate times of overlapping files are
+        dropped (the earlier file wins).
+        
+        Args:
+            start: Start of the range, inclusive (see files()).
+            end: End of the range, inclusive (see files()).
+            variables: Optional list of variables to read.
+            grid: Optional grid hash to restrict the files to.
+            chunks: Optional dask chunk sizes; the data then stay lazy. Without
+                    chunks the selected data are loaded and the files closed.
+        
+        Returns:
+            An xarray Dataset with the selected variables and time range.
+        
+        Raises:
+            ValueError: If no file matches or the files are on different grids.
+        """
+        files = self.files(start, end, variables, grid)
+        if not files:
+            raise ValueError(f"No files in '{self.root}' match the range {start} to {end} and variables {variables}.")
+        grids = {self.entries[os.path.relpath(path, self.root)]['grid'] for path in files}
+        if len(grids) > 1:
+            raise ValueError(f"Matching files are on {len(grids)} different grids {sorted(map(str, grids))}; select one with grid=.")
+        if chunks is not None and dask is None:
+            print("Warning: dask is not installed; loading the data without chunks.")
+            chunks = None
+        
+        time_range = slice(None if start is None else self._time_string(start), None if end is None else self._time_string(end))
+        datasets = []
+        for path in files:
+            ds = xr.open_dataset(path, chunks=chunks)
+            if variables:
+                ds = ds[variables]
+            if self.time_dim in ds.indexes and (start is not None or end is not None):
+                ds = ds.sel({self.time_dim: time_range})
+            datasets.append(ds)
+        
+        if len(datasets) == 1:
+            combined = datasets[0]
+        else:
+            combined = xr.concat(datasets, dim=self.time_dim, data_vars='minimal', coords='minimal',
+                                 compat='override', join='override')
+        if self.time_dim in combined.indexes:
+            combined = combined.drop_duplicates(self.time_dim)
+        
+        if chunks is None:
+            combined = combined.load()
+            for ds in datasets:
+                ds.close()
+        
+        return combined
+    
+    def read(self, start: Any = None, end: Any = None, variables: List[str] = None,
+             grid: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Read the time series of a range as NumPy arrays, like DataProcessing.read_netcdf.
+        
+        Args:
+            start: Start of the range, inclusive (see files()).
+            end: End of the range, inclusive (see files()).
+            variables: Optional list of variables to read. Defaults to all.
+            grid: Optional grid hash to restrict the files to.
+        
+        Returns:
+            A dictionary of variable names and NumPy arrays, concatenated along time.
+        """
+        ds = self.open(start, end, variables, grid)
+        return {str(var): ds[var].values for var in ds.data_vars}
+    
+    def summary(self) -> pd.DataFrame:
+        """
+        Tabulate the index.
+        
+        Returns:
+            A Pandas DataFrame with one row per file (relative path as index) and
+            the columns 'time_start', 'time_end', 'n_times', 'grid', 'variables'
+            and 'size', sorted by time.
+        """
+        columns = ['time_start', 'time_end', 'n_times', 'grid', 'variables', 'size']
+        table = pd.DataFrame.from_dict(self.entries, orient='index', columns=columns)
+        return table.sort_values(['time_start']).rename_axis('file')
+    
+    def __repr__(self) -> str:
+        return f"NetCDFArchive('{self.root}', n_files={len(self.entries)})"
+
 
 #####################################
 # Visualization Module
@@ -389,6 +921,99 @@ class Statistics:
             'n_points': len(clean_obs)
         }
     
+    @staticmethod
+    def calc_statistical_metrics_batch(obs: np.ndarray, models: Union[np.ndarray, List[np.ndarray]],
+                                       chunk_size: int = 2**19) -> Dict[str, np.ndarray]:
+        """
+        Calculate statistical metrics for many models at once.
+        
+        The models are reduced together as a (model, n) stack over the shared
+        observation mask, in a single pass over cache-sized chunks. Sums are
+        taken about the observation mean and each model's sampled mean to
+        avoid cancellation.
+        
+        Args:
+            obs: Observation data
+            models: Array shaped (n_models, *obs.shape) or list of model arrays
+            chunk_size: Number of model values (models x points) per chunk
+            
+        Returns:
+            Dictionary with arrays of metrics, one entry per model
+        """
+        for model in models:
+            if np.shape(model) != np.shape(obs):
+                raise ValueError(f"Model shape {np.shape(model)} does not match observation shape {np.shape(obs)}")
+                
+        obs_flat = np.ravel(obs)
+        model_flats = [np.ravel(model) for model in models]
+        n_models = len(model_flats)
+        if n_models == 0:
+            return {'bias': np.empty(0), 'rmse': np.empty(0), 'mae': np.empty(0),
+                    'correlation': np.empty(0), 'n_points': np.empty(0, dtype=np.int64)}
+        chunk_points = max(1, chunk_size // max(n_models, 1))
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shift = np.nanmean(obs_flat) if np.any(~np.isnan(obs_flat)) else 0.0
+        
+        # Each model is shifted by its own mean, estimated from an evenly spaced sample,
+        # so the sums of a biased model do not cancel either
+        step = max(1, obs_flat.size // 2**16)
+        model_shifts = np.full(n_models, shift)
+        for model_idx, model in enumerate(model_flats):
+            sample = np.asarray(model[::step], dtype=np.float64)
+            if np.any(~np.isnan(sample)):
+                model_shifts[model_idx] = np.nanmean(sample)
+        offsets = (model_shifts - shift)[:, None]
+            
+        n_points = np.zeros(n_models, dtype=np.int64)
+        sums = np.zeros((7, n_models))  # obs, model, abs diff, diff^2, obs^2, model^2, obs*model
+        
+        for start in range(0, obs_flat.size, chunk_points):
+            chunk = slice(start, start + chunk_points)
+            o = obs_flat[chunk] - shift
+            m = np.stack([model[chunk] for model in model_flats]).astype(np.float64, copy=False) - model_shifts[:, None]
+            
+            # Remove NaN values, sharing the observation mask between models
+            invalid = np.isnan(m)
+            invalid |= np.isnan(o)
+            m[invalid] = 0.0
+            o = np.where(invalid, 0.0, o)
+            diff = m - o
+            
+            n_invalid = invalid.sum(axis=1)
+            n_points += invalid.shape[1] - n_invalid
+            sums[0] += o.sum(axis=1)
+            sums[1] += m.sum(axis=1)
+            sums[3] += np.einsum('ij,ij->i', diff, diff)
+            # Absolute differences of the unshifted values; each masked pair adds exactly |offset|
+            diff += offsets
+            np.abs(diff, out=diff)
+            sums[2] += diff.sum(axis=1) - n_invalid * np.abs(offsets[:, 0])
+            sums[4] += np.einsum('ij,ij->i', o, o)
+            sums[5] += np.einsum('ij,ij->i', m, m)
+            sums[6] += np.einsum('ij,ij->i', o, m)
+            
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_obs, mean_model = sums[0] / n_points, sums[1] / n_points
+            cov = sums[6] - n_points * mean_obs * mean_model
+            var_obs = np.maximum(sums[4] - n_points * mean_obs ** 2, 0.0)
+            var_model = np.maximum(sums[5] - n_points * mean_model ** 2, 0.0)
+            
+            correlation = cov / np.sqrt(var_obs * var_model)
+            correlation[n_points < 2] = np.nan
+            
+            # Squared differences of the unshifted values: sum((diff + offset)^2) expanded
+            offset = offsets[:, 0]
+            sum_sq_error = np.maximum(sums[3] + 2 * offset * (sums[1] - sums[0]) + n_points * offset ** 2, 0.0)
+            
+            return {
+                'bias': mean_model - mean_obs + offset,
+                'rmse': np.sqrt(sum_sq_error / n_points),
+                'mae': sums[2] / n_points,
+                'correlation': correlation,
+                'n_points': n_points
+            }
+    
     @staticmethod
     def compare_models(ref_data: np.ndarray, model_dict: Dict[str, np.ndarray]) -> pd.DataFrame:
         """
@@ -401,14 +1026,134 @@ class Statistics:
         Returns:
             DataFrame with statistical metrics for each model
         """
-        results = []
+        results = pd.DataFrame(Statistics.calc_statistical_metrics_batch(ref_data, list(model_dict.values())))
+        results['model'] = list(model_dict.keys())
         
-        for model_name, model_data in model_dict.items():
-            metrics = Statistics.calc_statistical_metrics(ref_data, model_data)
-            metrics['model'] = model_name
-            results.append(metrics)
-            
-        return pd.DataFrame(results)
+        return results
+    
+    @staticmethod
+    def _group_codes(groups: Union[np.ndarray, Dict[str, np.ndarray]],
+                     shape: Tuple[int, ...]) -> Tuple[np.ndarray, int, List[np.ndarray], List[Optional[str]]]:
+        """
+        Encode one or several group label arrays as integer codes.
+        
+        Args:
+            groups: Label array or dictionary of label arrays, broadcastable to shape
+            shape: Data shape
+        
+        Returns:
+            Flat codes (-1 for missing labels), size of the code space, unique
+            labels of each group array and group names
+        """
+        if isinstance(groups, dict):
+            names, arrays = list(groups.keys()), list(groups.values())
+        else:
+            names, arrays = [getattr(groups, 'name', None)], [groups]
+        
+        combined = None
+        levels = []
+        for labels in arrays:
+            labels = np.asarray(labels)
+            codes, uniques = pd.factorize(labels.ravel(), sort=True)
+            codes = codes.reshape(labels.shape)
+            levels.append(np.asarray(uniques))
+            if combined is None:
+                combined = codes
+            else:
+                combined = np.where((combined < 0) | (codes < 0), -1, combined * len(uniques) + codes)
+        
+        if np.broadcast_shapes(combined.shape, shape) != tuple(shape):
+            raise ValueError(f"Group labels of shape {combined.shape} do not broadcast to data shape {shape}")
+        
+        n_codes = int(np.prod([len(level) for level in levels]))
+        dtype = np.int32 if n_codes < 2**31 else np.int64
+        codes = np.broadcast_to(combined.astype(dtype, copy=False), shape).reshape(-1)
+        
+        return codes, n_codes, levels, names
+    
+    @staticmethod
+    def calc_grouped_metrics(obs: np.ndarray, model: np.ndarray, groups: Union[np.ndarray, Dict[str, np.ndarray]],
+                             chunk_size: int = 2**22) -> pd.DataFrame:
+        """
+        Calculate statistical metrics for every group of data points.
+        
+        All groups are reduced at once with np.bincount over integer group codes,
+        in chunks and without a Python loop over groups.
+        
+        Args:
+            obs: Observation data
+            model: Model data
+            groups: Group labels broadcastable to the data shape (e.g. station ids
+                (n_stations,) or months (n_times, 1)), or a dictionary of them
+            chunk_size: Number of points per chunk
+        
+        Returns:
+            DataFrame of metrics indexed by group label(s)
+        """
+        if obs.shape != model.shape:
+            raise ValueError(f"Shapes do not match: {obs.shape} vs {model.shape}")
+        
+        codes, n_codes, levels, names = Statistics._group_codes(groups, obs.shape)
+        obs_flat = np.ravel(obs)
+        model_flat = np.ravel(model)
+        chunks = [slice(start, start + chunk_size) for start in range(0, obs_flat.size, chunk_size)]
+        
+        def paired_chunk(chunk):
+            # Valid pairs with a group label; NaN labels were encoded as -1
+            c = codes[chunk]
+            o = obs_flat[chunk].astype(np.float64, copy=False)
+            m = model_flat[chunk].astype(np.float64, copy=False)
+            valid = ~np.isnan(o) & ~np.isnan(m) & (c >= 0)
+            return c[valid], o[valid], m[valid]
+        
+        present = np.zeros(n_codes, dtype=np.int64)
+        n_points = np.zeros(n_codes, dtype=np.int64)
+        sums = np.zeros((4, n_codes))  # obs, model, abs diff, diff^2
+        
+        for chunk in chunks:
+            c = codes[chunk]
+            present += np.bincount(c[c >= 0], minlength=n_codes)
+            c, o, m = paired_chunk(chunk)
+            diff = m - o
+            n_points += np.bincount(c, minlength=n_codes)
+            sums[0] += np.bincount(c, weights=o, minlength=n_codes)
+            sums[1] += np.bincount(c, weights=m, minlength=n_codes)
+            sums[2] += np.bincount(c, weights=np.abs(diff), minlength=n_codes)
+            sums[3] += np.bincount(c, weights=diff * diff, minlength=n_codes)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_obs = sums[0] / n_points
+            mean_model = sums[1] / n_points
+        
+            centred = np.zeros((3, n_codes))  # obs * model, obs^2, model^2
+            for chunk in chunks:
+                c, o, m = paired_chunk(chunk)
+                anom_obs = o - mean_obs[c]
+                anom_model = m - mean_model[c]
+                centred[0] += np.bincount(c, weights=anom_obs * anom_model, minlength=n_codes)
+                centred[1] += np.bincount(c, weights=anom_obs * anom_obs, minlength=n_codes)
+                centred[2] += np.bincount(c, weights=anom_model * anom_model, minlength=n_codes)
+        
+            correlation = centred[0] / np.sqrt(centred[1] * centred[2])
+            correlation[n_points < 2] = np.nan
+        
+            results = pd.DataFrame({
+                'bias': mean_model - mean_obs,
+                'rmse': np.sqrt(sums[3] / n_points),
+                'mae': sums[2] / n_points,
+                'correlation': correlation,
+                'n_points': n_points
+            })
+        
+        # Keep the label combinations that occur in the data and label the rows
+        ids = np.flatnonzero(present)
+        positions = np.unravel_index(ids, [len(level) for level in levels])
+        if len(levels) == 1:
+            index = pd.Index(levels[0][positions[0]], name=names[0])
+        else:
+            index = pd.MultiIndex.from_arrays([level[pos] for level, pos in zip(levels, positions)], names=names)
+        
+        return results.iloc[ids].set_axis(index)
     
     @staticmethod
     def calc_exceedance_stats(data_dict: Dict[str, np.ndarray], threshold: float = 120, 
@@ -430,78 +1175,937 @@ class Statistics:
         if by_season and dates is None:
             raise ValueError("Dates must be provided when calculating by season")
             
+        if by_season:
+            season_codes, season_names = DataProcessing._season_codes(dates)
+            in_season = season_codes >= 0  # Missing dates belong to no season
+            
         for name, data in data_dict.items():
-            exceedances = DataProcessing.calculate_exceedances(data, threshold)
+            exceedances = np.asarray(data) >= threshold
             
             if not by_season:
-                results[name] = np.sum(exceedances)
+                results[name] = int(np.count_nonzero(exceedances))
             else:
-                season_results = {}
-                season_map = {
-                    'DJF': [12, 1, 2],
-                    'MAM': [3, 4, 5],
-                    'JJA': [6, 7, 8],
-                    'SON': [9, 10, 11]
-                }
-                
-                for season, months in season_map.items():
-                    season_mask = np.array([m in months for m in dates.month])
-                    season_results[season] = np.sum(exceedances[season_mask])
-                    
-                results[name] = season_results
+                # Count per time step, then sum each season in one pass
+                per_step = exceedances.reshape(len(exceedances), -1).sum(axis=1)
+                counts = np.bincount(season_codes[in_season], weights=per_step[in_season], minlength=len(season_names))
+                results[name] = {season: int(counts[code]) for code, season in enumerate(season_names)}
                 
         return results
-
-#####################################
-# Spatial Module
-#####################################
-
-class Spatial:
-    """Geospatial functions."""
     
     @staticmethod
-    def extract_points(raster_data: np.ndarray, lons: np.ndarray, lats: np.ndarray, 
-                     points: List[Tuple[float, float]]) -> np.ndarray:
+    def _count_by_group(mask: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
         """
-        Extract values at specific points from a raster grid.
+        Count true values of a (time, ...) mask per group of time steps.
+        
+        Runs of equal consecutive codes are summed with np.add.reduceat and
+        then added to their groups; negative codes are left out.
         
         Args:
-            raster_data: 2D raster data array
-            lons: 1D array of longitudes
-            lats: 1D array of latitudes
-            points: List of (lon, lat) point coordinates
+            mask: Boolean array with time along the first axis
+            groups: Integer code per time step
+            n_groups: Number of groups
             
         Returns:
-            Array of extracted values
+            Counts shaped (n_groups, ...)
         """
-        result = []
-        
-        for lon, lat in points:
-            # Find nearest grid cell
-            lon_idx = np.abs(lons - lon).argmin()
-            lat_idx = np.abs(lats - lat).argmin()
+        counts = np.zeros((n_groups,) + mask.shape[1:], dtype=np.int64)
+        if len(groups) == 0:
+            return counts
             
-            # Extract value
-            if 0 <= lon_idx < raster_data.shape[1] and 0 <= lat_idx < raster_data.shape[0]:
-                result.append(raster_data[lat_idx, lon_idx])
-            else:
-                result.append(np.nan)
-                
-        return np.array(result)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        run_sums = np.add.reduceat(mask, starts, axis=0, dtype=np.int64)
+        run_codes = groups[starts]
+        keep = run_codes >= 0
+        np.add.at(counts, run_codes[keep], run_sums[keep])
+        
+        return counts
     
     @staticmethod
-    def raster_difference(raster1: np.ndarray, raster2: np.ndarray) -> np.ndarray:
+    def calc_exceedance_maps(data: Union[np.ndarray, xr.DataArray], dates: Optional[pd.DatetimeIndex] = None,
+                             threshold: float = 120.0, by: Union[str, Tuple[str, ...]] = 'year',
+                             allowed: Optional[int] = None, chunk_size: int = 2**24) -> xr.Dataset:
         """
-        Calculate the difference between two rasters.
+        Calculate per-cell exceedance count maps of a (time, y, x) cube.
+        
+        The cube is read in chunks along time with bounded memory. For legal
+        threshold maps (e.g. 120 MDA8 on more than 25 days per year) pass daily
+        MDA8 values with threshold=120, by='year' and allowed=25.
         
         Args:
-            raster1: First raster array
-            raster2: Second raster array
+            data: (time, ...) array or DataArray
+            dates: DatetimeIndex of the time steps (default: 'time' coordinate of a DataArray)
+            threshold: Exceedance threshold (value >= threshold)
+            by: 'year', 'season', 'month' or a tuple of them; with year and
+                season, December counts in the DJF of the following year
+            allowed: Allowed exceedances per group; adds the map 'above_limit'
+            chunk_size: Number of values read per chunk
             
         Returns:
-            Difference array (raster1 - raster2)
+            Dataset with 'exceedances' and 'n_valid' maps per group
         """
-        if raster1.shape != raster2.shape:
-            raise ValueError(f"Raster shapes do not match: {raster1.shape} vs {raster2.shape}")
+        if dates is None:
+            if not isinstance(data, xr.DataArray) or 'time' not in data.coords:
+                raise ValueError("Dates must be provided unless data is a DataArray with a time coordinate")
+            dates = pd.DatetimeIndex(data['time'].values)
+        dates = pd.DatetimeIndex(dates)
+        if len(dates) != data.shape[0]:
+            raise ValueError(f"Dates length {len(dates)} does not match time axis length {data.shape[0]}")
+            
+        keys = (by,) if isinstance(by, str) else tuple(by)
+        # With both year and season, December belongs to the DJF season of the following year
+        index = DataProcessing.season_index(dates, year_start_month=12 if 'season' in keys and 'year' in keys else 1)
+        season_codes, season_names, years = index.codes, index.names, index.years
+        
+        # Missing dates (and dates outside all seasons) belong to no group
+        valid = ~np.asarray(dates.isna())
+        if 'season' in keys:
+            valid &= season_codes >= 0
+        months = np.nan_to_num(np.asarray(dates.month, dtype=float)).astype(np.int64)
             
-        return raster1 - raster2
\ No newline at end of file
+        codes = np.zeros(len(dates), dtype=np.int64)
+        coords = {}
+        for key in keys:
+            if key == 'year':
+                year_codes, labels = pd.factorize(years[valid], sort=True)
+                key_codes = np.zeros(len(dates), dtype=np.int64)
+                key_codes[valid] = year_codes
+            elif key == 'season':
+                key_codes, labels = season_codes.astype(np.int64), np.array(season_names)
+            elif key == 'month':
+                key_codes, labels = months - 1, np.arange(1, 13)
+            else:
+                raise ValueError(f"Unknown grouping: {key}. Use year, season, or month.")
+            codes = codes * len(labels) + key_codes
+            coords[key] = np.asarray(labels)
+        
+        codes[~valid] = -1
+            
+        group_shape = tuple(len(labels) for labels in coords.values())
+        n_groups = int(np.prod(group_shape))
+        space_shape = tuple(data.shape[1:])
+        step = max(1, chunk_size // max(int(np.prod(space_shape, dtype=np.int64)), 1))
+        
+        exceedances = np.zeros((n_groups,) + space_shape, dtype=np.int64)
+        n_valid = np.zeros((n_groups,) + space_shape, dtype=np.int64)
+        for start in range(0, len(dates), step):
+            chunk = np.asarray(data[start:start + step])
+            chunk_codes = codes[start:start + len(chunk)]
+            exceedances += Statistics._count_by_group(chunk >= threshold, chunk_codes, n_groups)
+            n_valid += Statistics._count_by_group(~np.isnan(chunk), chunk_codes, n_groups)
+            
+        if isinstance(data, xr.DataArray):
+            space_dims = list(data.dims[1:])
+            space_coords = {dim: data[dim].values for dim in space_dims if dim in data.coords}
+        else:
+            space_dims = ['y', 'x'] if len(space_shape) == 2 else [f'dim_{i}' for i in range(1, len(space_shape) + 1)]
+            space_coords = {}
+            
+        dims = list(coords) + space_dims
+        result = xr.Dataset(
+            {
+                'exceedances': (dims, exceedances.reshape(group_shape + space_shape)),
+                'n_valid': (dims, n_valid.reshape(group_shape + space_shape)),
+            },
+            coords={**coords, **space_coords},
+            attrs={'threshold': threshold}
+        )
+        if allowed is not None:
+            result['above_limit'] = result['exceedances'] > allowed
+            result.attrs['allowed'] = allowed
+            
+        return result
+
+
+class MetricsAccumulator:
+    """
+    Mergeable online accumulator of statistical metrics.
+    
+    Chunks of paired data are added with update() and accumulators from
+    separate processes are combined with merge(), using Welford/Chan
+    updates of the means, squared deviations and co-moment. A non-empty
+    shape keeps separate statistics per trailing element (e.g. per station).
+    """
+    
+    def __init__(self, shape: Tuple[int, ...] = ()):
+        """
+        Create an empty accumulator.
+        
+        Args:
+            shape: Shape of the statistics, i.e. the trailing dimensions of the
+                   chunks that are kept. Defaults to () for one global score.
+        """
+        self.shape = tuple(shape)
+        self.n = np.zeros(self.shape, dtype=np.int64)
+        self.mean_obs = np.zeros(self.shape)
+        self.mean_model = np.zeros(self.shape)
+        self.m2_obs = np.zeros(self.shape)
+        self.m2_model = np.zeros(self.shape)
+        self.comoment = np.zeros(self.shape)
+        self.sum_abs_error = np.zeros(self.shape)
+        self.sum_sq_error = np.zeros(self.shape)
+    
+    def update(self, obs: np.ndarray, model: np.ndarray) -> 'MetricsAccumulator':
+        """
+        Add a chunk of paired data.
+        
+        NaN values are removed pairwise, as in calc_statistical_metrics.
+        
+        Args:
+            obs: NumPy array of observation data whose trailing dimensions equal shape.
+            model: NumPy array of model data. Must have the same shape as obs.
+        
+        Returns:
+            The accumulator itself.
+        
+        Raises:
+            ValueError: If the shapes of obs, model and the accumulator do not fit.
+        """
+        if obs.shape != model.shape:
+            raise ValueError(f"Input arrays must have the same shape. Got {obs.shape} and {model.shape}.")
+        n_lead = obs.ndim - len(self.shape)
+        if n_lead < 0 or obs.shape[n_lead:] != self.shape:
+            raise ValueError(f"Trailing dimensions of the data {obs.shape} do not match the accumulator shape {self.shape}.")
+        axes = tuple(range(n_lead))
+        
+        # Statistics of the chunk, centred on its own means
+        valid = ~np.isnan(obs) & ~np.isnan(model)
+        o = np.where(valid, obs, 0.0)
+        m = np.where(valid, model, 0.0)
+        n = valid.sum(axis=axes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_obs = np.where(n > 0, o.sum(axis=axes) / n, 0.0)
+            mean_model = np.where(n > 0, m.sum(axis=axes) / n, 0.0)
+        anom_obs = np.where(valid, o - mean_obs, 0.0)
+        anom_model = np.where(valid, m - mean_model, 0.0)
+        diff = m - o
+        
+        chunk = MetricsAccumulator(self.shape)
+        chunk.n = n.astype(np.int64)
+        chunk.mean_obs = mean_obs
+        chunk.mean_model = mean_model
+        chunk.m2_obs = (anom_obs * anom_obs).sum(axis=axes)
+        chunk.m2_model = (anom_model * anom_model).sum(axis=axes)
+        chunk.comoment = (anom_obs * anom_model).sum(axis=axes)
+        chunk.sum_abs_error = np.abs(diff).sum(axis=axes)
+        chunk.sum_sq_error = (diff * diff).sum(axis=axes)
+        
+        return self.merge(chunk)
+    
+    def merge(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        """
+        Merge the statistics of another accumulator into this one.
+        
+        Args:
+            other: Accumulator with the same shape, e.g. filled by another process.
+        
+        Returns:
+            The accumulator itself.
+        
+        Raises:
+            ValueError: If the shapes of the accumulators differ.
+        """
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge accumulators of shapes {self.shape} and {other.shape}.")
+        
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(n > 0, other.n / n, 0.0)
+        delta_obs = other.mean_obs - self.mean_obs
+        delta_model = other.mean_model - self.mean_model
+        cross = self.n * frac  # n_a * n_b / n
+        
+        self.m2_obs = self.m2_obs + other.m2_obs + delta_obs * delta_obs * cross
+        self.m2_model = self.m2_model + other.m2_model + delta_model * delta_model * cross
+        self.comoment = self.comoment + other.comoment + delta_obs * delta_model * cross
+        self.mean_obs = self.mean_obs + delta_obs * frac
+        self.mean_model = self.mean_model + delta_model * frac
+        self.sum_abs_error = self.sum_abs_error + other.sum_abs_error
+        self.sum_sq_error = self.sum_sq_error + other.sum_sq_error
+        self.n = n
+        
+        return self
+    
+    def __add__(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        return self.copy().merge(other)
+    
+    def __iadd__(self, other: 'MetricsAccumulator') -> 'MetricsAccumulator':
+        return self.merge(other)
+    
+    def copy(self) -> 'MetricsAccumulator':
+        """Return an independent copy of the accumulator."""
+        result = MetricsAccumulator(self.shape)
+        result.__dict__.update({key: np.copy(value) for key, value in self.__dict__.items() if key != 'shape'})
+        return result
+    
+    @classmethod
+    def combine(cls, accumulators: List['MetricsAccumulator']) -> 'MetricsAccumulator':
+        """
+        Merge a list of accumulators, e.g. the results of parallel workers.
+        
+        Args:
+            accumulators: Non-empty list of accumulators with the same shape.
+        
+        Returns:
+            A new accumulator holding the statistics of all of them.
+        """
+        result = accumulators[0].copy()
+        for accumulator in accumulators[1:]:
+            result.merge(accumulator)
+        return result
+    
+    def variance(self, ddof: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Variances of the observations and the model.
+        
+        Args:
+            ddof: Delta degrees of freedom. Defaults to 0.
+        
+        Returns:
+            A tuple (var_obs, var_model); NaN where fewer than ddof + 1 pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            denominator = np.where(self.n > ddof, self.n - ddof, np.nan)
+            return self.m2_obs / denominator, self.m2_model / denominator
+    
+    def covariance(self, ddof: int = 0) -> np.ndarray:
+        """
+        Covariance of observations and model.
+        
+        Args:
+            ddof: Delta degrees of freedom. Defaults to 0.
+        
+        Returns:
+            The covariance; NaN where fewer than ddof + 1 pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.where(self.n > ddof, self.n - ddof, np.nan)
+    
+    def metrics(self) -> Dict[str, Union[float, int, np.ndarray]]:
+        """
+        Metrics of all data added so far.
+        
+        Returns:
+            A dictionary with 'bias', 'rmse', 'mae', 'correlation' and 'n_points',
+            as returned by Statistics.calc_statistical_metrics, holding arrays of the
+            accumulator shape if it is not (). Metrics are NaN without valid
+            pairs and the correlation is NaN for fewer than two pairs.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = np.where(self.n > 0, self.n, np.nan)
+            correlation = np.where(self.n > 1, self.comoment / np.sqrt(self.m2_obs * self.m2_model), np.nan)
+            metrics = {
+                'bias': np.where(self.n > 0, self.mean_model - self.mean_obs, np.nan),
+                'rmse': np.sqrt(self.sum_sq_error / n),
+                'mae': self.sum_abs_error / n,
+                'correlation': correlation,
+                'n_points': self.n
+            }
+        
+        if self.shape == ():
+            return {key: value.item() for key, value in metrics.items()}
+        return metrics
+    
+    def __repr__(self) -> str:
+        return f"MetricsAccumulator(shape={self.shape}, n_points={int(np.sum(self.n))})"
+
+
+class ExceedanceMask:
+    """
+    Bit-packed mask of threshold exceedances along the time axis.
+    
+    One bit per value (np.packbits). Counts per group of time steps and
+    location and run-length episode statistics are computed from the
+    packed bits in chunks of locations.
+    """
+    
+    # Number of set bits of every byte value
+    _POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+    
+    
+    def __init__(self, packed: np.ndarray, n_times: int, threshold: Optional[float] = None):
+        """
+        Wrap an array packed with np.packbits along axis 0.
+        
+        Args:
+            packed: uint8 NumPy array of packed bits along the first axis.
+            n_times: Number of time steps (bits) per location.
+            threshold: Optional threshold the mask was built with.
+        """
+        if packed.dtype != np.uint8 or packed.shape[0] != (n_times + 7) // 8:
+            raise ValueError(f"Packed array of {packed.dtype} and shape {packed.shape} does not hold {n_times} time steps.")
+        self.packed = packed
+        self.n_times = int(n_times)
+        self.threshold = threshold
+    
+    @classmethod
+    def from_data(cls, data: Union[np.ndarray, xr.DataArray], threshold: float = 120.0,
+                  chunk_size: int = 8 * 1024) -> 'ExceedanceMask':
+        """
+        Build the mask of values exceeding a threshold (value >= threshold).
+        
+        The data are compared and packed in chunks along time, so lazily read
+        arrays (e.g. from DataProcessing.read_netcdf(lazy=True) or a netCDF4 variable) are
+        never loaded as a whole. NaN values do not exceed.
+        
+        Args:
+            data: Array-like of shape (time, ...) supporting slicing along time.
+            threshold: The threshold value. Defaults to 120.0.
+            chunk_size: Number of time steps per chunk; rounded down to a multiple of 8.
+        
+        Returns:
+            The ExceedanceMask of the data.
+        """
+        n_times = data.shape[0]
+        step = max(8, chunk_size - chunk_size % 8)
+        packed = np.empty(((n_times + 7) // 8,) + tuple(data.shape[1:]), dtype=np.uint8)
+        
+        for start in range(0, n_times, step):
+            chunk = np.asarray(data[start:start + step])
+            packed[start // 8:(start + len(chunk) + 7) // 8] = np.packbits(chunk >= threshold, axis=0)
+        
+        return cls(packed, n_times, threshold)
+    
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'ExceedanceMask':
+        """
+        Pack a boolean (time, ...) mask.
+        
+        Args:
+            mask: Boolean NumPy array with time along the first axis.
+        
+        Returns:
+            The packed ExceedanceMask.
+        """
+        return cls(np.packbits(np.asarray(mask, dtype=bool), axis=0), len(mask))
+    
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape (time, ...) of the unpacked mask."""
+        return (self.n_times,) + self.packed.shape[1:]
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the packed bits."""
+        return self.packed.nbytes
+    
+    def _location_chunks(self, chunk_size: int) -> List[slice]:
+        """Slices over the flattened locations with about chunk_size mask values each."""
+        n_locations = int(np.prod(self.packed.shape[1:], dtype=np.int64))
+        step = max(1, chunk_size // max(self.n_times, 1))
+        return [slice(start, start + step) for start in range(0, n_locations, step)]
+    
+    def unpack(self, locations: Optional[slice] = None) -> np.ndarray:
+        """
+        Unpack the mask, or the mask of a slice of the flattened locations.
+        
+        Args:
+            locations: Optional slice over the flattened locations.
+        
+        Returns:
+            Boolean NumPy array shaped (time, ...), or (time, n) for a slice.
+        """
+        if locations is None:
+            return np.unpackbits(self.packed, axis=0, count=self.n_times).view(bool)
+        flat = self.packed.reshape(self.packed.shape[0], -1)
+        return np.unpackbits(flat[:, locations], axis=0, count=self.n_times).view(bool)
+    
+    def count(self, groups: Optional[np.ndarray] = None, n_groups: Optional[int] = None,
+              chunk_size: int = 2**24) -> np.ndarray:
+        """
+        Count exceedances per location, optionally per group of time steps.
+        
+        Args:
+            groups: Optional integer NumPy array of length n_times assigning every
+                    time step to a group 0..n_groups-1 (e.g. season or year codes);
+                    negative codes are left out.
+            n_groups: Number of groups. Defaults to max(groups) + 1.
+            chunk_size: Number of mask values unpacked at a time.
+        
+        Returns:
+            int64 NumPy array of counts shaped like a time step, or (n_groups, ...)
+            with groups.
+        """
+        space_shape = self.packed.shape[1:]
+        if groups is None:
+            # Counting set bits of the packed bytes needs no unpacking
+            return self._POPCOUNT[self.packed].sum(axis=0, dtype=np.int64)
+        
+        groups = np.asarray(groups)
+        if len(groups) != self.n_times:
+            raise ValueError(f"Length of groups ({len(groups)}) must match the number of time steps ({self.n_times}).")
+        if n_groups is None:
+            n_groups = int(groups.max()) + 1 if len(groups) else 0
+        
+        counts = np.zeros((n_groups, int(np.prod(space_shape, dtype=np.int64))), dtype=np.int64)
+        for locations in self._location_chunks(chunk_size):
+            counts[:, locations] = Statistics._count_by_group(self.unpack(locations), groups, n_groups)
+        
+        return counts.reshape((n_groups,) + space_shape)
+    
+    def episodes(self, min_length: int = 1, chunk_size: int = 2**24) -> Dict[str, np.ndarray]:
+        """
+        Detect episodes of consecutive exceedances with run-length encoding.
+        
+        Args:
+            min_length: Minimum number of consecutive time steps of an episode. Defaults to 1.
+            chunk_size: Number of mask values unpacked at a time.
+        
+        Returns:
+            A dictionary of int64 NumPy arrays shaped like a time step: 'count'
+            (number of episodes), 'max_duration' (longest episode) and
+            'total_duration' (time steps within episodes).
+        """
+        space_shape = self.packed.shape[1:]
+        n_locations = int(np.prod(space_shape, dtype=np.int64))
+        result = {key: np.zeros(n_locations, dtype=np.int64) for key in ('count', 'max_duration', 'total_duration')}
+        
+        for locations in self._location_chunks(chunk_size):
+            mask = self.unpack(locations).view(np.int8)
+            # +1 where an episode starts, -1 after it ends; rows are locations
+            edges = np.diff(mask, axis=0, prepend=0, append=0).T
+            location, start = np.nonzero(edges == 1)
+            _, end = np.nonzero(edges == -1)
+            duration = end - start
+            keep = duration >= min_length
+            location, duration = location[keep], duration[keep]
+            
+            offset = locations.start
+            n_chunk = edges.shape[0]
+            result['count'][offset:offset + n_chunk] = np.bincount(location, minlength=n_chunk)
+            result['total_duration'][offset:offset + n_chunk] = np.bincount(location, weights=duration, minlength=n_chunk)
+            longest = np.zeros(n_chunk, dtype=np.int64)
+            np.maximum.at(longest, location, duration)
+            result['max_duration'][offset:offset + n_chunk] = longest
+        
+        return {key: value.reshape(space_shape) for key, value in result.items()}
+    
+    def __repr__(self) -> str:
+        return f"ExceedanceMask(shape={self.shape}, threshold={self.threshold}, nbytes={self.nbytes})"
+
+
+#####################################
+# Spatial Module
+#####################################
+
+class Spatial:
+    """Geospatial functions."""
+    
+    @staticmethod
+    def _bracket_indices(coords: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Locate values between the nodes of a monotonic 1D coordinate.
+        
+        Args:
+            coords: Strictly increasing or decreasing coordinates (at least two)
+            values: Coordinates to locate
+            
+        Returns:
+            Indices of the two enclosing nodes, fractional distance from the
+            lower towards the upper node, and mask of values inside the range
+        """
+        increasing = coords[-1] > coords[0]
+        ordered = coords if increasing else coords[::-1]
+        n = len(ordered)
+        
+        upper = np.clip(np.searchsorted(ordered, values, side='right'), 1, n - 1)
+        lower = upper - 1
+        frac = (values - ordered[lower]) / (ordered[upper] - ordered[lower])
+        inside = (values >= ordered[0]) & (values <= ordered[-1])
+        
+        if not increasing:
+            lower, upper = n - 1 - lower, n - 1 - upper
+            
+        return lower, upper, frac, inside
+    
+    @staticmethod
+    def _nearest_indices(coords: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Find the nearest coordinate of every value.
+        
+        Args:
+            coords: 1D coordinates in any order
+            values: Coordinates to locate
+            
+        Returns:
+            Index of the nearest coordinate for each value
+        """
+        if len(coords) == 1:
+            return np.zeros(len(values), dtype=np.intp)
+        
+        # Search in sorted order and map back, so unsorted coordinates work too
+        order = np.argsort(coords, kind='stable')
+        ordered = coords[order]
+        upper = np.clip(np.searchsorted(ordered, values), 1, len(ordered) - 1)
+        lower = upper - 1
+        nearest = np.where(np.abs(ordered[upper] - values) < np.abs(ordered[lower] - values), upper, lower)
+        return order[nearest]
+    
+    @staticmethod
+    def _point_weights(lons: np.ndarray, lats: np.ndarray, points: Union[List[Tuple[float, float]], np.ndarray],
+                       method: str = 'nearest', power: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Compute the grid cells and weights that sample a grid at point locations.
+        
+        Args:
+            lons: 1D array of longitudes
+            lats: 1D array of latitudes
+            points: List or (n, 2) array of (lon, lat) coordinates
+            method: 'nearest', 'bilinear' or 'idw'
+            power: Power of the inverse distance weighting
+            
+        Returns:
+            Row and column indices and weights shaped (n, k), with k = 1 for
+            'nearest' and 4 otherwise, and mask of points inside the grid
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        lon_points, lat_points = points[:, 0], points[:, 1]
+        n_points = len(points)
+        
+        if method == 'nearest':
+            rows = Spatial._nearest_indices(lats, lat_points)
+            cols = Spatial._nearest_indices(lons, lon_points)
+            return rows[:, None], cols[:, None], np.ones((n_points, 1)), np.ones(n_points, dtype=bool)
+        
+        for name, coords in (('Longitude', lons), ('Latitude', lats)):
+            steps = np.diff(coords)
+            if len(coords) < 2 or not (np.all(steps > 0) or np.all(steps < 0)):
+                raise ValueError(f"{name} coordinates must be strictly monotonic for method '{method}'")
+        
+        row0, row1, fy, lat_inside = Spatial._bracket_indices(lats, lat_points)
+        col0, col1, fx, lon_inside = Spatial._bracket_indices(lons, lon_points)
+        
+        rows = np.stack([row0, row0, row1, row1], axis=1)
+        cols = np.stack([col0, col1, col0, col1], axis=1)
+        
+        if method == 'bilinear':
+            weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+        else:
+            # Distances in degrees with longitudes shortened by the cosine of the latitude
+            dx = (lons[cols] - lon_points[:, None]) * np.cos(np.radians(lat_points))[:, None]
+            dy = lats[rows] - lat_points[:, None]
+            distance = np.hypot(dx, dy)
+            exact = distance == 0
+            with np.errstate(divide='ignore'):
+                weights = np.where(exact.any(axis=1)[:, None], exact.astype(float), 1.0 / distance ** power)
+                
+        return rows, cols, weights, lat_inside & lon_inside
+    
+    @staticmethod
+    def _apply_point_weights(raster_data: np.ndarray, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray,
+                             inside: np.ndarray, skip_nan: bool = False) -> np.ndarray:
+        """
+        Sample a raster or a stack of rasters with precomputed point weights.
+        
+        Args:
+            raster_data: Array whose last two dimensions are (lat, lon)
+            rows, cols, weights, inside: Sampling arrays from _point_weights
+            skip_nan: Leave out NaN cells and renormalize the remaining weights
+            
+        Returns:
+            Array shaped (..., n_points)
+        """
+        if weights.shape[1] == 1:
+            values = raster_data[..., rows[:, 0], cols[:, 0]]
+            if inside.all():
+                return values
+            values = values.astype(float)
+            values[..., ~inside] = np.nan
+            return values
+        
+        values = raster_data[..., rows, cols]
+        if skip_nan:
+            valid = ~np.isnan(values)
+            weights = np.where(valid, weights, 0.0)
+            values = np.where(valid, values, 0.0)
+            
+        total = weights.sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (values * weights).sum(axis=-1) / total
+        result[..., ~inside] = np.nan
+        
+        return result
+    
+    @staticmethod
+    def _lonlat_to_xyz(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """
+        Convert longitudes and latitudes to points on the unit sphere.
+        
+        Args:
+            lons: Longitudes in degrees
+            lats: Latitudes in degrees
+            
+        Returns:
+            Array of (x, y, z) coordinates shaped (..., 3)
+        """
+        lon = np.radians(lons)
+        lat = np.radians(lats)
+        cos_lat = np.cos(lat)
+        return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+    
+    @staticmethod
+    def _curvilinear_point_weights(index: 'CurvilinearGridIndex', points: Union[List[Tuple[float, float]], np.ndarray],
+                                   method: str = 'nearest', k: int = 4, power: float = 2.0,
+                                   max_distance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Compute the grid cells and weights that sample a curvilinear grid at point locations.
+        
+        Args:
+            index: CurvilinearGridIndex of the grid
+            points: List or (n, 2) array of (lon, lat) coordinates
+            method: 'nearest' or 'idw' over the k nearest cells
+            k: Number of neighbours for 'idw'
+            power: Power of the inverse distance weighting
+            max_distance: Points farther than this from the nearest cell (km) are outside
+            
+        Returns:
+            Row and column indices, weights and inside mask as from _point_weights
+        """
+        if method not in ('nearest', 'idw'):
+            raise ValueError(f"Unknown method for curvilinear grids: {method}. Use nearest or idw.")
+            
+        rows, cols, distances = index.query(points, k=1 if method == 'nearest' else k)
+        
+        if method == 'nearest':
+            weights = np.ones(distances.shape)
+        else:
+            exact = distances == 0
+            with np.errstate(divide='ignore'):
+                weights = np.where(exact.any(axis=1)[:, None], exact.astype(float), 1.0 / distances ** power)
+                
+        inside = np.ones(len(distances), dtype=bool) if max_distance is None else distances[:, 0] <= max_distance
+        
+        return rows, cols, weights, inside
+    
+    @staticmethod
+    def extract_points(raster_data: np.ndarray, lons: np.ndarray, lats: np.ndarray, 
+                     points: Union[List[Tuple[float, float]], np.ndarray], method: str = 'nearest',
+                     power: float = 2.0, k: int = 4, max_distance: Optional[float] = None) -> np.ndarray:
+        """
+        Extract values at specific points from a raster grid.
+        
+        All points are located in one vectorized search per axis. A stack of
+        rasters such as (time, lat, lon) is sampled at once.
+        To sample the same points from many rasters on one grid, build a
+        PointSampler once and call it for each raster.
+        
+        Curvilinear grids with 2D coordinates (e.g. WRF XLONG/XLAT) are located
+        with a KD-tree on the unit sphere (requires scipy).
+        
+        Args:
+            raster_data: Array whose last two dimensions are (lat, lon), e.g. 2D
+                raster or 3D (time, lat, lon) cube
+            lons: 1D array of longitudes, or 2D array for curvilinear grids
+            lats: 1D array of latitudes, or 2D array for curvilinear grids
+            points: List or (n, 2) array of (lon, lat) point coordinates
+            method: 'nearest', 'bilinear' or 'idw' (inverse distance weighting of
+                the four surrounding cells, ignoring NaN cells)
+            power: Power of the inverse distance weighting
+            k: Curvilinear grids: number of nearest cells used by 'idw'
+            max_distance: Curvilinear grids: points farther than this from the
+                nearest cell (km) are NaN
+            
+        Returns:
+            Array of extracted values shaped (..., n_points); points outside the
+            grid are NaN for 'bilinear' and 'idw'
+        """
+        if method not in ('nearest', 'bilinear', 'idw'):
+            raise ValueError(f"Unknown method: {method}. Use nearest, bilinear, or idw.")
+        grid_shape = np.shape(lons) if np.ndim(lons) == 2 else (len(lats), len(lons))
+        if raster_data.ndim < 2 or raster_data.shape[-2:] != grid_shape:
+            raise ValueError(f"Raster shape {raster_data.shape} does not match grid shape {grid_shape}")
+        
+        return PointSampler(lons, lats, points, method, power, k, max_distance).sample(raster_data)
+    
+    @staticmethod
+    def raster_difference(raster1: np.ndarray, raster2: np.ndarray) -> np.ndarray:
+        """
+        Calculate the difference between two rasters.
+        
+        Args:
+            raster1: First raster array
+            raster2: Second raster array
+            
+        Returns:
+            Difference array (raster1 - raster2)
+        """
+        if raster1.shape != raster2.shape:
+            raise ValueError(f"Raster shapes do not match: {raster1.shape} vs {raster2.shape}")
+            
+        return raster1 - raster2
+
+
+class CurvilinearGridIndex:
+    """
+    KD-tree index for nearest-cell queries on a curvilinear grid.
+    
+    Built once on the unit-sphere coordinates of all cells of a grid with 2D
+    latitudes and longitudes, then queried for many points in bulk. Requires
+    scipy.
+    """
+    
+    def __init__(self, lons: np.ndarray, lats: np.ndarray):
+        """
+        Build the KD-tree.
+        
+        Args:
+            lons: 2D array of cell longitudes
+            lats: 2D array of cell latitudes
+        """
+        if cKDTree is None:
+            raise ImportError("scipy is required for curvilinear grids")
+            
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        if lons.ndim != 2 or lons.shape != lats.shape:
+            raise ValueError(f"Curvilinear coordinates must be 2D with equal shapes: {lons.shape} vs {lats.shape}")
+            
+        self.shape = lons.shape
+        self.tree = cKDTree(Spatial._lonlat_to_xyz(lons, lats).reshape(-1, 3))
+    
+    def query(self, points: Union[List[Tuple[float, float]], np.ndarray],
+              k: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the k nearest grid cells of every point.
+        
+        Args:
+            points: List or (n, 2) array of (lon, lat) coordinates
+            k: Number of neighbours
+            
+        Returns:
+            Rows, columns and great-circle distances (km) shaped (n, k), nearest first
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k = min(k, self.tree.n)
+        
+        chord, flat = self.tree.query(Spatial._lonlat_to_xyz(points[:, 0], points[:, 1]), k=k)
+        chord = np.reshape(chord, (len(points), k))
+        rows, cols = np.unravel_index(np.reshape(flat, (len(points), k)), self.shape)
+        distances = 2 * 6371.0 * np.arcsin(np.clip(chord / 2, 0, 1))
+        
+        return rows, cols, distances
+
+
+class PointSampler:
+    """
+    Precomputed sampling of a grid at a fixed set of points.
+    
+    The grid cells and weights are located once, so sampling many rasters on
+    the same grid is a single fancy-indexing operation each. Samplers can be
+    pickled or saved to a .npz file. Grids with 2D coordinates are located
+    with a CurvilinearGridIndex.
+    """
+    
+    METHODS = ('nearest', 'bilinear', 'idw')
+    
+    def __init__(self, lons: np.ndarray, lats: np.ndarray, points: Union[List[Tuple[float, float]], np.ndarray],
+                 method: str = 'nearest', power: float = 2.0, k: int = 4, max_distance: Optional[float] = None,
+                 index: Optional[CurvilinearGridIndex] = None):
+        """
+        Locate the points on the grid and compute their weights.
+        
+        Args:
+            lons: 1D array of longitudes, or 2D array for curvilinear grids
+            lats: 1D array of latitudes, or 2D array for curvilinear grids
+            points: List or (n, 2) array of (lon, lat) point coordinates
+            method: 'nearest', 'bilinear' or 'idw'
+            power: Power of the inverse distance weighting
+            k: Curvilinear grids: number of nearest cells used by 'idw'
+            max_distance: Curvilinear grids: points farther than this from the
+                nearest cell (km) are NaN
+            index: Curvilinear grids: prebuilt CurvilinearGridIndex to reuse
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown method: {method}. Use nearest, bilinear, or idw.")
+            
+        self.lons = np.asarray(lons, dtype=float)
+        self.lats = np.asarray(lats, dtype=float)
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.method = method
+        self.power = float(power)
+        
+        if self.lons.ndim == 2:
+            if index is None:
+                index = CurvilinearGridIndex(self.lons, self.lats)
+            elif index.shape != self.lons.shape:
+                raise ValueError(f"Index shape {index.shape} does not match coordinate shape {self.lons.shape}")
+            self.rows, self.cols, self.weights, self.inside = Spatial._curvilinear_point_weights(
+                index, self.points, method, k, self.power, max_distance)
+        else:
+            self.rows, self.cols, self.weights, self.inside = Spatial._point_weights(self.lons, self.lats, self.points,
+                                                                                     method, self.power)
+    
+    @property
+    def grid_shape(self) -> Tuple[int, int]:
+        """Shape (n_lats, n_lons) of the grid."""
+        if self.lons.ndim == 2:
+            return self.lons.shape
+        return (len(self.lats), len(self.lons))
+    
+    @property
+    def n_points(self) -> int:
+        """Number of points."""
+        return len(self.points)
+    
+    def matches(self, lons: np.ndarray, lats: np.ndarray) -> bool:
+        """
+        Check whether the sampler was built for the given grid.
+        
+        Args:
+            lons: 1D array of longitudes
+            lats: 1D array of latitudes
+            
+        Returns:
+            True if both coordinate arrays equal those of the sampler
+        """
+        return np.array_equal(self.lons, np.asarray(lons, dtype=float)) and \
+            np.array_equal(self.lats, np.asarray(lats, dtype=float))
+    
+    def sample(self, raster_data: np.ndarray) -> np.ndarray:
+        """
+        Sample a raster or a stack of rasters at the points.
+        
+        Args:
+            raster_data: Array whose last two dimensions are (lat, lon)
+            
+        Returns:
+            Array of values shaped (..., n_points)
+        """
+        if raster_data.ndim < 2 or raster_data.shape[-2:] != self.grid_shape:
+            raise ValueError(f"Raster shape {raster_data.shape} does not match grid shape {self.grid_shape}")
+            
+        return Spatial._apply_point_weights(raster_data, self.rows, self.cols, self.weights, self.inside,
+                                            skip_nan=(self.method == 'idw'))
+    
+    __call__ = sample
+    
+    def save(self, file_path: str) -> None:
+        """
+        Save the sampler to a .npz file.
+        
+        Args:
+            file_path: Output path
+        """
+        np.savez(file_path, lons=self.lons, lats=self.lats, points=self.points, method=self.method,
+                 power=self.power, rows=self.rows, cols=self.cols, weights=self.weights, inside=self.inside)
+    
+    @classmethod
+    def load(cls, file_path: str) -> 'PointSampler':
+        """
+        Load a sampler saved with save().
+        
+        Args:
+            file_path: Path to the .npz file
+            
+        Returns:
+            Restored PointSampler
+        """
+        sampler = cls.__new__(cls)
+        with np.load(file_path) as data:
+            for name in ('lons', 'lats', 'points', 'rows', 'cols', 'weights', 'inside'):
+                setattr(sampler, name, data[name])
+            sampler.method = str(data['method'])
+            sampler.power = float(data['power'])
+        return sampler
+    
+    def __repr__(self) -> str:
+        return f"PointSampler(n_points={self.n_points}, grid_shape={self.grid_shape}, method='{self.method}')"
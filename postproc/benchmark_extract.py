@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Benchmark wrfchem_extract_par.py on synthetic or existing wrfout files.
+
+Runs extract_variables_at_heights with increasing numbers of worker
+processes and records the throughput in time steps per second and per
+core, together with the stage times of the profiling report. The results
+are written as JSON and can be compared against an earlier run to detect
+performance regressions.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import datetime
+import numpy as np
+import netCDF4
+
+from wrfchem_extract_par import (VERTICAL_COORDINATES, ExtractionScheduler, domain_dimensions,
+                                 extract_variables_at_heights)
+from make_synthetic_wrfout import DEFAULT_SPECIES, SPECIES, write_synthetic_wrfout
+
+
+def environment_info():
+    """Return the host and library versions a benchmark was run with."""
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'netCDF4': netCDF4.__version__,
+        'netcdf_library': netCDF4.getlibversion().split()[0],
+        'cpu_count': os.cpu_count(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def output_has_data(output_file, variables):
+    """
+    Check that every extracted variable of an output holds valid values.
+
+    Parameters:
+    -----------
+    output_file : str
+        Path to the output file
+    variables : list
+        List of extracted variable names
+
+    Returns:
+    --------
+    bool:
+        False if a variable is missing or holds only fill values or NaN
+    """
+    with netCDF4.Dataset(output_file, 'r') as ncfile:
+        for var_name in variables:
+            if var_name not in ncfile.variables:
+                return False
+            values = np.ma.filled(ncfile.variables[var_name][:].astype(float), np.nan)
+            if not np.isfinite(values).any():
+                return False
+    return True
+
+
+def benchmark_file(wrfout_file, variables, heights, processes, work_dir, repeat=3, **kwargs):
+    """
+    Time the extraction of one file with a given number of worker processes.
+
+    The worker pool is started and warmed up with one untimed extraction, so
+    the timings measure steady-state throughput as in a long batch.
+
+    Parameters:
+    -----------
+    wrfout_file : str
+        Path to the WRF output file
+    variables : list
+        List of variable names to extract
+    heights : list
+        List of target levels
+    processes : int
+        Number of worker processes
+    work_dir : str
+        Folder for the output files
+    repeat : int
+        Number of timed extractions
+    **kwargs :
+        Further arguments of extract_variables_at_heights
+
+    Returns:
+    --------
+    dict:
+        Wall times, throughput per second and per core, and the profile
+        report of the fastest run
+
+    Raises:
+    -------
+    RuntimeError
+        If an extraction fails or its output holds only fill values, so a
+        broken extraction is never timed as a fast one
+    """
+    n_times = domain_dimensions(wrfout_file)['n_times']
+    output_file = os.path.join(work_dir, f"benchmark_p{processes}.nc")
+
+    wall_times = []
+    profiles = []
+    with ExtractionScheduler(max_workers=processes) as scheduler:
+        for run in range(repeat + 1):
+            start = time.perf_counter()
+            success = extract_variables_at_heights(wrfout_file, variables, heights, output_file,
+                                                   scheduler=scheduler, **kwargs)
+            elapsed = time.perf_counter() - start
+            if not success:
+                raise RuntimeError(f"Extraction with {processes} processes failed")
+
+            # The first run forks the workers and fills the caches
+            if run > 0:
+                wall_times.append(elapsed)
+                profiles.append(scheduler.output_profiles[-1])
+
+    best = int(np.argmin(wall_times))
+    output_bytes = os.path.getsize(output_file)
+    has_data = output_has_data(output_file, variables)
+    os.remove(output_file)
+    if not has_data:
+        raise RuntimeError(f"Extraction with {processes} processes wrote only fill values")
+
+    return {
+        'processes': processes,
+        'n_times': n_times,
+        'wall_times_s': [round(t, 3) for t in wall_times],
+        'best_s': round(wall_times[best], 3),
+        'median_s': round(float(np.median(wall_times)), 3),
+        'timesteps_per_s': round(n_times / wall_times[best], 3),
+        'timesteps_per_s_per_core': round(n_times / wall_times[best] / processes, 3),
+        'output_bytes': output_bytes,
+        'profile': profiles[best],
+    }
+
+
+def compare_results(results, baseline, tolerance=0.15):
+    """
+    Compare throughput against a baseline benchmark.
+
+    Parameters:
+    -----------
+    results : dict
+        Benchmark results from run_benchmark
+    baseline : dict
+        Earlier results of the same benchmark
+    tolerance : float
+        Accepted relative drop in time steps per second per core
+
+    Returns:
+    --------
+    list:
+        Messages describing every configuration slower than the tolerance
+    """
+    baseline_runs = {run['processes']: run for run in baseline['runs']}
+    regressions = []
+
+    for run in results['runs']:
+        reference = baseline_runs.get(run['processes'])
+        if reference is None or run.get('failed') or reference.get('failed'):
+            continue
+        change = run['timesteps_per_s_per_core'] / reference['timesteps_per_s_per_core'] - 1
+        print(f"{run['processes']:>3} processes: {run['timesteps_per_s_per_core']:.3f} time steps/s/core "
+              f"({change:+.1%} against the baseline)")
+        if change < -tolerance:
+            regressions.append(f"{run['processes']} processes: {change:+.1%} time steps/s per core")
+
+    return regressions
+
+
+def run_benchmark(wrfout_file, variables, heights, processes, repeat=3, work_dir=None, **kwargs):
+    """
+    Benchmark the extraction of one file for several numbers of workers.
+
+    Parameters:
+    -----------
+    wrfout_file : str
+        Path to the WRF output file
+    variables : list
+        List of variable names to extract
+    heights : list
+        List of target levels
+    processes : list
+        Numbers of worker processes to benchmark
+    repeat : int
+        Number of timed extractions per configuration
+    work_dir : str, optional
+        Folder for the output files. Default is a temporary folder.
+    **kwargs :
+        Further arguments of extract_variables_at_heights
+
+    Returns:
+    --------
+    dict:
+        Environment, grid, settings and one entry per number of processes;
+        configurations that failed have 'failed' set and the error message
+    """
+    dims = domain_dimensions(wrfout_file)
+    own_work_dir = work_dir is None
+    if own_work_dir:
+        work_dir = tempfile.mkdtemp(prefix='wrfchem_benchmark_')
+
+    results = {
+        'environment': environment_info(),
+        'input': {
+            'wrfout_file': os.path.abspath(wrfout_file),
+            'bytes': os.path.getsize(wrfout_file),
+            'n_times': dims['n_times'],
+            'n_levels': dims['n_levels'],
+            'shape': list(dims['shape']),
+        },
+        'settings': {'variables': list(variables), 'heights': list(heights), 'repeat': repeat,
+                     **{key: value for key, value in kwargs.items() if value is not None}},
+        'runs': [],
+    }
+
+    try:
+        for n_processes in processes:
+            print(f"\nBenchmarking {n_processes} processes")
+            try:
+                run = benchmark_file(wrfout_file, variables, heights, n_processes, work_dir, repeat, **kwargs)
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                results['runs'].append({'processes': n_processes, 'failed': True, 'error': str(e)})
+                continue
+            print(f"Best {run['best_s']:.2f}s: {run['timesteps_per_s']:.2f} time steps/s, "
+                  f"{run['timesteps_per_s_per_core']:.3f} time steps/s per core")
+            results['runs'].append(run)
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    """Main function to parse arguments and run the benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark WRF variable extraction')
+
+    # Input: an existing file or a synthetic one
+    parser.add_argument('--wrfout-file', help='Existing WRF output file to benchmark on (default: synthetic file)')
+    parser.add_argument('--nx', type=int, default=200, help='Synthetic grid cells in west_east direction')
+    parser.add_argument('--ny', type=int, default=150, help='Synthetic grid cells in south_north direction')
+    parser.add_argument('--nz', type=int, default=40, help='Synthetic vertical (mass) levels')
+    parser.add_argument('--times', type=int, default=24, help='Synthetic time steps')
+    parser.add_argument('--keep-input', action='store_true', help='Keep the synthetic input file')
+
+    # Extraction settings
+    parser.add_argument('--vars', '-v', nargs='+', default=DEFAULT_SPECIES[:3], help='Variables to extract')
+    parser.add_argument('--heights', '-z', nargs='+', type=float, default=[10, 100, 1000],
+                        help='Target levels')
+    parser.add_argument('--vertical-coordinate', choices=list(VERTICAL_COORDINATES), default='height_agl',
+                        help='Vertical coordinate of --heights')
+    parser.add_argument('--processes', '-p', nargs='+', type=int, default=[1, 2, 4],
+                        help='Numbers of worker processes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per number of processes')
+    parser.add_argument('--work-dir', help='Folder for inputs and outputs (default: temporary folder)')
+
+    # Results and regression check
+    parser.add_argument('--output', '-o', default='benchmark_extract.json', help='JSON file for the results')
+    parser.add_argument('--baseline', help='Earlier results to compare the throughput against')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Accepted relative throughput drop against the baseline')
+
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='wrfchem_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    wrfout_file = args.wrfout_file
+    synthetic = wrfout_file is None
+    if synthetic:
+        wrfout_file = os.path.join(work_dir, 'wrfout_d01_2020-07-01_00:00:00')
+        print(f"Writing synthetic input {args.nx}x{args.ny}x{args.nz} with {args.times} time steps: {wrfout_file}")
+        write_synthetic_wrfout(wrfout_file, nx=args.nx, ny=args.ny, nz=args.nz, n_times=args.times,
+                               species=DEFAULT_SPECIES + [var for var in args.vars
+                                                          if var in SPECIES and var not in DEFAULT_SPECIES])
+
+    try:
+        results = run_benchmark(wrfout_file, args.vars, args.heights, args.processes, repeat=args.repeat,
+                                work_dir=work_dir, vertical_coordinate=args.vertical_coordinate)
+        results['input']['synthetic'] = synthetic
+    finally:
+        if synthetic and not args.keep_input:
+            os.remove(wrfout_file)
+        if not args.work_dir and not args.keep_input:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+    failed = [run for run in results['runs'] if run.get('failed')]
+    if failed:
+        print("Failed configurations:\n  " + "\n  ".join(f"{run['processes']} processes: {run['error']}"
+                                                          for run in failed))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print("Performance regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No performance regressions")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+"""
+Write synthetic WRF-Chem output files for testing and benchmarking.
+
+The files have the dimensions, variables and global attributes of real
+wrfout files (Times, XLAT/XLONG and their U/V staggered versions, HGT, P/PB, PH/PHB, T, QVAPOR, U/V and
+chemistry species) with smooth, physically plausible fields, so wrf-python
+and wrfchem_extract_par.py can read them like model output. Grid and time
+sizes are configurable, from a few kilobytes to many gigabytes.
+"""
+
+import os
+import sys
+import datetime
+import numpy as np
+from netCDF4 import Dataset
+
+
+# Gravitational acceleration, reference pressure and scale height of the base state
+GRAVITY = 9.81
+P_SURFACE = 100000.0
+SCALE_HEIGHT = 8000.0
+
+# Units and typical surface value of the chemistry species that can be generated
+SPECIES = {
+    'o3': ('ppmv', 0.035),
+    'no': ('ppmv', 0.002),
+    'no2': ('ppmv', 0.01),
+    'co': ('ppmv', 0.15),
+    'so2': ('ppmv', 0.001),
+    'PM2_5_DRY': ('ug m^-3', 12.0),
+    'PM10': ('ug m^-3', 20.0),
+}
+
+DEFAULT_SPECIES = ['o3', 'no', 'no2', 'co', 'PM2_5_DRY']
+
+
+def eta_heights(nz, model_top=20000.0):
+    """
+    Heights above ground of the staggered (w) levels for a stretched grid.
+
+    Parameters:
+    -----------
+    nz : int
+        Number of mass levels (bottom_top)
+    model_top : float
+        Height of the model top in meters
+
+    Returns:
+    --------
+    numpy.ndarray:
+        nz + 1 heights in meters, 0 at the surface
+    """
+    # Quadratic stretching gives thin layers near the ground, as in real runs
+    s = np.linspace(0.0, 1.0, nz + 1)
+    return model_top * (0.3 * s + 0.7 * s ** 2)
+
+
+def grid_coordinates(ny, nx, dx=9000.0, cen_lat=47.5, cen_lon=13.5):
+    """
+    Latitudes and longitudes of a regular grid around a center point.
+
+    Parameters:
+    -----------
+    ny, nx : int
+        Number of grid cells in south_north and west_east direction
+    dx : float
+        Grid spacing in meters
+    cen_lat, cen_lon : float
+        Center of the domain in degrees
+
+    Returns:
+    --------
+    tuple:
+        (lat, lon) arrays shaped (ny, nx)
+    """
+    meters_per_degree = 111200.0
+    lat_1d = cen_lat + (np.arange(ny) - (ny - 1) / 2) * dx / meters_per_degree
+    lat = np.repeat(lat_1d[:, None], nx, axis=1)
+    lon = cen_lon + (np.arange(nx)[None, :] - (nx - 1) / 2) * dx / (meters_per_degree * np.cos(np.radians(lat)))
+    return lat, lon
+
+
+def staggered_coordinates(values, axis):
+    """
+    Coordinates at the cell faces along one axis, as XLAT_U/XLONG_U or XLAT_V/XLONG_V.
+
+    Parameters:
+    -----------
+    values : numpy.ndarray
+        Coordinates at the mass points, shaped (ny, nx)
+    axis : int
+        1 for the west_east (U) faces, 0 for the south_north (V) faces
+
+    Returns:
+    --------
+    numpy.ndarray:
+        Midpoints between neighbouring mass points, linearly extrapolated at
+        the domain edges, with one more point along axis
+    """
+    values = np.moveaxis(values, axis, 0)
+    inner = 0.5 * (values[1:] + values[:-1])
+    first = 1.5 * values[0] - 0.5 * values[1]
+    last = 1.5 * values[-1] - 0.5 * values[-2]
+    return np.moveaxis(np.concatenate([first[None], inner, last[None]]), 0, axis)
+
+
+def terrain_height(lat, lon, max_height=2500.0):
+    """Smooth terrain with a ridge across the domain, in meters."""
+    ridge = np.exp(-((lat - lat.mean()) / (0.25 * np.ptp(lat) + 1e-6)) ** 2)
+    hills = 0.5 + 0.5 * np.sin(np.radians(lon) * 40.0) * np.cos(np.radians(lat) * 35.0)
+    return max_height * ridge * hills + 100.0
+
+
+def _create_variable(ncfile, name, dims, units, description, dtype, stagger='', compression=None):
+    """Create a variable with the attributes wrf-python expects."""
+    kwargs = {}
+    if compression:
+        kwargs.update(compression=compression, complevel=1)
+    var = ncfile.createVariable(name, dtype, dims, **kwargs)
+    var.FieldType = np.int32(104)
+    var.MemoryOrder = 'XYZ' if len(dims) == 4 else ('XY ' if len(dims) == 3 else '0  ')
+    var.description = description
+    var.units = units
+    var.stagger = stagger
+    if len(dims) >= 3:
+        # Staggered fields refer to the coordinates at their cell faces
+        suffix = {'X': '_U', 'Y': '_V'}.get(stagger, '')
+        var.coordinates = f'XLONG{suffix} XLAT{suffix} XTIME'
+    return var
+
+
+def write_synthetic_wrfout(path, nx=100, ny=80, nz=30, n_times=24, start=None, interval_minutes=60,
+                           species=None, dtype='f4', compression=None, seed=0, dx=9000.0):
+    """
+    Write one synthetic wrfout file.
+
+    Time steps are written one at a time, so memory use is independent of
+    the number of time steps.
+
+    Parameters:
+    -----------
+    path : str
+        Path of the file to create
+    nx, ny, nz : int
+        Number of mass grid cells in west_east, south_north and bottom_top
+    n_times : int
+        Number of time steps
+    start : datetime.datetime, optional
+        Time of the first time step. Default is 2020-07-01 00:00.
+    interval_minutes : int
+        Output interval in minutes
+    species : list, optional
+        Chemistry species to include (keys of SPECIES). Default is DEFAULT_SPECIES.
+    dtype : str
+        Data type of the fields, 'f4' as written by WRF or 'f8'
+    compression : str, optional
+        Compressor of the fields (e.g. 'zlib'); None writes uncompressed
+        files, which are the fastest to generate and to read
+    seed : int
+        Seed of the random perturbations
+    dx : float
+        Grid spacing in meters
+
+    Returns:
+    --------
+    str:
+        path
+    """
+    if start is None:
+        start = datetime.datetime(2020, 7, 1)
+    if species is None:
+        species = DEFAULT_SPECIES
+    unknown = [name for name in species if name not in SPECIES]
+    if unknown:
+        raise ValueError(f"Unknown species {', '.join(unknown)}; choose from {', '.join(SPECIES)}")
+
+    rng = np.random.default_rng(seed)
+
+    lat, lon = grid_coordinates(ny, nx, dx)
+    lat_u, lon_u = staggered_coordinates(lat, 1), staggered_coordinates(lon, 1)
+    lat_v, lon_v = staggered_coordinates(lat, 0), staggered_coordinates(lon, 0)
+    hgt = terrain_height(lat, lon)
+
+    # Base state: staggered geopotential over the terrain and hydrostatic base pressure
+    z_stag = eta_heights(nz)[:, None, None] * (1.0 - hgt / 20000.0)[None] + hgt[None]
+    phb = GRAVITY * z_stag
+    z_mass = 0.5 * (z_stag[1:] + z_stag[:-1])
+    pb = P_SURFACE * np.exp(-z_mass / SCALE_HEIGHT)
+    height_agl = z_mass - hgt[None]
+
+    # Vertical profile shapes shared by all time steps
+    decay = np.exp(-height_agl / 2000.0)
+    theta = 290.0 + 4.0 * z_mass / 1000.0
+
+    times = [start + datetime.timedelta(minutes=interval_minutes * t) for t in range(n_times)]
+
+    with Dataset(path, 'w', format='NETCDF4') as ncfile:
+        ncfile.createDimension('Time', None)
+        ncfile.createDimension('DateStrLen', 19)
+        ncfile.createDimension('west_east', nx)
+        ncfile.createDimension('south_north', ny)
+        ncfile.createDimension('bottom_top', nz)
+        ncfile.createDimension('bottom_top_stag', nz + 1)
+        ncfile.createDimension('west_east_stag', nx + 1)
+        ncfile.createDimension('south_north_stag', ny + 1)
+
+        # Global attributes read by wrf-python for metadata and projections
+        ncfile.TITLE = ' OUTPUT FROM SYNTHETIC WRF-CHEM GENERATOR'
+        ncfile.START_DATE = start.strftime('%Y-%m-%d_%H:%M:%S')
+        ncfile.SIMULATION_START_DATE = ncfile.START_DATE
+        ncfile.setncattr('WEST-EAST_GRID_DIMENSION', np.int32(nx + 1))
+        ncfile.setncattr('SOUTH-NORTH_GRID_DIMENSION', np.int32(ny + 1))
+        ncfile.setncattr('BOTTOM-TOP_GRID_DIMENSION', np.int32(nz + 1))
+        ncfile.DX = np.float32(dx)
+        ncfile.DY = np.float32(dx)
+        ncfile.DT = np.float32(dx / 200.0)
+        ncfile.GRID_ID = np.int32(1)
+        ncfile.PARENT_ID = np.int32(0)
+        ncfile.I_PARENT_START = np.int32(1)
+        ncfile.J_PARENT_START = np.int32(1)
+        ncfile.PARENT_GRID_RATIO = np.int32(1)
+        ncfile.MAP_PROJ = np.int32(1)
+        ncfile.MAP_PROJ_CHAR = 'Lambert Conformal'
+        ncfile.CEN_LAT = np.float32(lat.mean())
+        ncfile.CEN_LON = np.float32(lon.mean())
+        ncfile.TRUELAT1 = np.float32(lat.mean() - 1.5)
+        ncfile.TRUELAT2 = np.float32(lat.mean() + 1.5)
+        ncfile.MOAD_CEN_LAT = np.float32(lat.mean())
+        ncfile.STAND_LON = np.float32(lon.mean())
+        ncfile.POLE_LAT = np.float32(90.0)
+        ncfile.POLE_LON = np.float32(0.0)
+        ncfile.MMINLU = 'MODIFIED_IGBP_MODIS_NOAH'
+        ncfile.NUM_LAND_CAT = np.int32(21)
+        ncfile.ISWATER = np.int32(17)
+        ncfile.ISLAKE = np.int32(21)
+        ncfile.ISICE = np.int32(15)
+        ncfile.ISURBAN = np.int32(13)
+        ncfile.ISOILWATER = np.int32(14)
+
+        times_var = ncfile.createVariable('Times', 'S1', ('Time', 'DateStrLen'))
+        xtime = _create_variable(ncfile, 'XTIME', ('Time',), f"minutes since {ncfile.START_DATE.replace('_', ' ')}",
+                                 'minutes since simulation start', 'f4')
+
+        grid_dims = ('Time', 'south_north', 'west_east')
+        mass_dims = ('Time', 'bottom_top', 'south_north', 'west_east')
+        stag_dims = ('Time', 'bottom_top_stag', 'south_north', 'west_east')
+
+        variables = {
+            'XLAT': _create_variable(ncfile, 'XLAT', grid_dims, 'degree_north',
+                                     'LATITUDE, SOUTH IS NEGATIVE', 'f4'),
+            'XLONG': _create_variable(ncfile, 'XLONG', grid_dims, 'degree_east',
+                                      'LONGITUDE, WEST IS NEGATIVE', 'f4'),
+            'XLAT_U': _create_variable(ncfile, 'XLAT_U', ('Time', 'south_north', 'west_east_stag'), 'degree_north',
+                                       'LATITUDE, SOUTH IS NEGATIVE', 'f4', stagger='X'),
+            'XLONG_U': _create_variable(ncfile, 'XLONG_U', ('Time', 'south_north', 'west_east_stag'), 'degree_east',
+                                        'LONGITUDE, WEST IS NEGATIVE', 'f4', stagger='X'),
+            'XLAT_V': _create_variable(ncfile, 'XLAT_V', ('Time', 'south_north_stag', 'west_east'), 'degree_north',
+                                       'LATITUDE, SOUTH IS NEGATIVE', 'f4', stagger='Y'),
+            'XLONG_V': _create_variable(ncfile, 'XLONG_V', ('Time', 'south_north_stag', 'west_east'), 'degree_east',
+                                        'LONGITUDE, WEST IS NEGATIVE', 'f4', stagger='Y'),
+            'HGT': _create_variable(ncfile, 'HGT', grid_dims, 'm', 'Terrain Height', 'f4'),
+            'T2': _create_variable(ncfile, 'T2', grid_dims, 'K', 'TEMP at 2 M', dtype, compression=compression),
+            'P': _create_variable(ncfile, 'P', mass_dims, 'Pa', 'perturbation pressure', dtype,
+                                  compression=compression),
+            'PB': _create_variable(ncfile, 'PB', mass_dims, 'Pa', 'BASE STATE PRESSURE', dtype,
+                                   compression=compression),
+            'PH': _create_variable(ncfile, 'PH', stag_dims, 'm2 s-2', 'perturbation geopotential', dtype,
+                                   stagger='Z', compression=compression),
+            'PHB': _create_variable(ncfile, 'PHB', stag_dims, 'm2 s-2', 'base-state geopotential', dtype,
+                                    stagger='Z', compression=compression),
+            'T': _create_variable(ncfile, 'T', mass_dims, 'K', 'perturbation potential temperature (theta-t0)',
+                                  dtype, compression=compression),
+            'QVAPOR': _create_variable(ncfile, 'QVAPOR', mass_dims, 'kg kg-1', 'Water vapor mixing ratio',
+                                       dtype, compression=compression),
+            'U': _create_variable(ncfile, 'U', ('Time', 'bottom_top', 'south_north', 'west_east_stag'), 'm s-1',
+                                  'x-wind component', dtype, stagger='X', compression=compression),
+            'V': _create_variable(ncfile, 'V', ('Time', 'bottom_top', 'south_north_stag', 'west_east'), 'm s-1',
+                                  'y-wind component', dtype, stagger='Y', compression=compression),
+        }
+        for name in species:
+            units, _ = SPECIES[name]
+            variables[name] = _create_variable(ncfile, name, mass_dims, units, f"{name} concentration", dtype,
+                                               compression=compression)
+
+        for t_idx, t in enumerate(times):
+            times_var[t_idx] = np.array(list(t.strftime('%Y-%m-%d_%H:%M:%S')), dtype='S1')
+            xtime[t_idx] = (t - start).total_seconds() / 60.0
+
+            # Diurnal cycle peaking in the afternoon (UTC + 1)
+            hour = t.hour + t.minute / 60.0 + 1.0
+            diurnal = np.sin(np.pi * (hour - 6.0) / 12.0) if 6.0 <= hour <= 18.0 else 0.0
+
+            variables['XLAT'][t_idx] = lat
+            variables['XLONG'][t_idx] = lon
+            variables['XLAT_U'][t_idx] = lat_u
+            variables['XLONG_U'][t_idx] = lon_u
+            variables['XLAT_V'][t_idx] = lat_v
+            variables['XLONG_V'][t_idx] = lon_v
+            variables['HGT'][t_idx] = hgt
+            variables['PB'][t_idx] = pb
+            variables['PHB'][t_idx] = phb
+
+            noise = rng.standard_normal((nz, ny, nx))
+            variables['PH'][t_idx] = np.concatenate([np.zeros((1, ny, nx)), 20.0 * noise], axis=0)
+            variables['P'][t_idx] = 30.0 * noise
+            variables['T'][t_idx] = theta - 300.0 + 3.0 * diurnal * decay + 0.2 * noise
+            variables['T2'][t_idx] = 288.0 - 0.0065 * hgt + 6.0 * diurnal + 0.3 * noise[0]
+            variables['QVAPOR'][t_idx] = 0.008 * np.exp(-z_mass / 2500.0) * (1.0 + 0.05 * noise)
+            variables['U'][t_idx] = np.pad(5.0 + 15.0 * (1.0 - decay) + noise, ((0, 0), (0, 0), (0, 1)), mode='edge')
+            variables['V'][t_idx] = np.pad(2.0 + noise, ((0, 0), (0, 1), (0, 0)), mode='edge')
+
+            for name in species:
+                _, surface_value = SPECIES[name]
+                if name == 'o3':
+                    # Ozone rises with height and peaks in the afternoon
+                    profile = 1.0 + 0.5 * (1.0 - decay) + 0.6 * diurnal * decay
+                else:
+                    # Primary pollutants are emitted at the ground and mixed up during the day
+                    profile = decay ** (1.0 - 0.5 * diurnal) + 0.05
+                variables[name][t_idx] = surface_value * profile * np.exp(0.1 * noise)
+
+    return path
+
+
+def generate_series(output_folder, n_files=1, domain='d01', start=None, n_times=24, interval_minutes=60, **kwargs):
+    """
+    Write a series of consecutive synthetic wrfout files.
+
+    Parameters:
+    -----------
+    output_folder : str
+        Folder for the files, created if needed
+    n_files : int
+        Number of files
+    domain : str
+        Domain name used in the file names (wrfout_<domain>_<start time>)
+    start : datetime.datetime, optional
+        Time of the first time step. Default is 2020-07-01 00:00.
+    n_times : int
+        Number of time steps per file
+    interval_minutes : int
+        Output interval in minutes
+    **kwargs :
+        Further arguments of write_synthetic_wrfout
+
+    Returns:
+    --------
+    list:
+        Paths of the written files
+    """
+    if start is None:
+        start = datetime.datetime(2020, 7, 1)
+    seed = kwargs.pop('seed', 0)
+    os.makedirs(output_folder, exist_ok=True)
+
+    paths = []
+    for file_idx in range(n_files):
+        file_start = start + datetime.timedelta(minutes=interval_minutes * n_times * file_idx)
+        path = os.path.join(output_folder, f"wrfout_{domain}_{file_start.strftime('%Y-%m-%d_%H:%M:%S')}")
+        print(f"Writing {path}")
+        write_synthetic_wrfout(path, start=file_start, n_times=n_times, interval_minutes=interval_minutes,
+                               seed=seed + file_idx, **kwargs)
+        paths.append(path)
+
+    return paths
+
+
+def main():
+    """Main function to parse arguments and write the files."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write synthetic WRF-Chem output files')
+    parser.add_argument('--output-folder', '-o', required=True, help='Folder for the generated files')
+    parser.add_argument('--files', type=int, default=1, help='Number of consecutive files')
+    parser.add_argument('--domain', default='d01', help='Domain name used in the file names')
+    parser.add_argument('--nx', type=int, default=100, help='Grid cells in west_east direction')
+    parser.add_argument('--ny', type=int, default=80, help='Grid cells in south_north direction')
+    parser.add_argument('--nz', type=int, default=30, help='Number of vertical (mass) levels')
+    parser.add_argument('--times', type=int, default=24, help='Time steps per file')
+    parser.add_argument('--interval', type=int, default=60, help='Output interval in minutes')
+    parser.add_argument('--start', default='2020-07-01_00:00:00', help='Time of the first time step')
+    parser.add_argument('--species', nargs='+', default=DEFAULT_SPECIES, choices=list(SPECIES),
+                        help='Chemistry species to include')
+    parser.add_argument('--dtype', choices=['f4', 'f8'], default='f4', help='Data type of the fields')
+    parser.add_argument('--compression', default=None, help='Compressor of the fields (default: none)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random perturbations')
+
+    args = parser.parse_args()
+
+    start = datetime.datetime.strptime(args.start, '%Y-%m-%d_%H:%M:%S')
+    # Size of the four-dimensional fields, which dominate the file size
+    n_fields = 6 + len(args.species)
+    size_gb = args.files * args.times * n_fields * args.nz * args.ny * args.nx * int(args.dtype[1]) / 1024 ** 3
+    print(f"Generating {args.files} files of {args.times} time steps on a "
+          f"{args.nx}x{args.ny}x{args.nz} grid (~{size_gb:.2f} GB uncompressed)")
+
+    generate_series(args.output_folder, n_files=args.files, domain=args.domain, start=start,
+                    n_times=args.times, interval_minutes=args.interval, nx=args.nx, ny=args.ny, nz=args.nz,
+                    species=args.species, dtype=args.dtype, compression=args.compression, seed=args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
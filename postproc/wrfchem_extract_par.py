@@ -11,21 +11,33 @@ import os
 import sys
 import glob
 import numpy as np
-from netCDF4 import Dataset, num2date
+from netCDF4 import Dataset, num2date, chartostring
 import wrf
-from wrf import getvar, interplevel, to_np, ALL_TIMES
+from wrf import getvar, to_np, ALL_TIMES
 import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
 from functools import partial
 import time
 import datetime
 import yaml
+import json
+import csv
+import hashlib
 import concurrent.futures
 import itertools
+from collections import OrderedDict, deque
 import queue
 import threading
+import gc
+import resource
 import psutil
 
 
+# Fill value used by wrf-python for points outside the interpolation range
+MISSING_VALUE = wrf.default_fill(np.float64)
+
+
 def verify_wrf_times(ncfile):
     """
     Verify time information from WRF output without changing it.
@@ -81,308 +93,2895 @@ def safe_get_variable(ncfile, var_name, t_idx):
 
     Parameters:
     -----------
-    ncfile : netCDF4.Dataset
-        Open WRF output file
-    var_name : str
-        Name of the variable to extract
-    t_idx : int
-        Time index
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    var_name : str
+        Name of the variable to extract
+    t_idx : int
+        Time index
+
+    Returns:
+    --------
+    wrf.Variable or None:
+        The requested variable or None if not found/error
+    """
+    try:
+        var_3d = getvar(ncfile, var_name, timeidx=t_idx)
+        return var_3d
+    except Exception as e:
+        print(f"  Warning: Variable {var_name} not found or error: {e}")
+        return None
+
+
+def safe_get_attributes(var_3d):
+    """
+    Safely extract attributes from a WRF variable, handling problematic types.
+
+    Parameters:
+    -----------
+    var_3d : wrf.Variable or netCDF4.Variable
+        Variable to extract attributes from
+
+    Returns:
+    --------
+    dict:
+        Dictionary of attribute name/value pairs
+    """
+    var_attrs = {}
+
+    # Safe attribute types that can be directly stored in netCDF4
+    safe_types = (str, int, float, bool, np.int8, np.int16, np.int32, np.int64,
+                 np.uint8, np.uint16, np.uint32, np.uint64, np.float32, np.float64)
+
+    if hasattr(var_3d, 'attrs'):
+        attrs = var_3d.attrs
+    else:
+        attrs = {attr_name: var_3d.getncattr(attr_name) for attr_name in var_3d.ncattrs()}
+
+    for attr_name in attrs:
+        if attr_name not in ['coordinates', 'grid_mapping', 'cell_methods', 'time', 'projection']:
+            attr_value = attrs[attr_name]
+
+            # Convert non-safe types to strings
+            if not isinstance(attr_value, safe_types):
+                attr_value = str(attr_value)
+
+            var_attrs[attr_name] = attr_value
+
+    return var_attrs
+
+
+def compute_interp_weights(z, heights):
+    """
+    Compute vertical bracketing indices and linear weights for all target heights.
+
+    The weights only depend on the height field, so they are computed once per
+    time step and reused for every variable (see apply_interp_weights).
+
+    Parameters:
+    -----------
+    z : numpy.ndarray
+        3D height field (bottom_top, south_north, west_east), increasing with level
+    heights : list
+        List of target heights in the same units as z
+
+    Returns:
+    --------
+    dict:
+        'k0' (index of the level below each target), 'weight' (linear weight of
+        the level above) and 'valid' (False where the target lies outside the
+        column), each shaped (len(heights), south_north, west_east)
+    """
+    z = np.asarray(z, dtype=np.float64)
+    levels = np.asarray(heights, dtype=np.float64).reshape(-1, 1, 1)
+    n_levels = z.shape[0]
+
+    # Number of model levels at or below each target height
+    n_below = np.zeros((levels.shape[0],) + z.shape[1:], dtype=np.intp)
+    for k in range(n_levels):
+        n_below += z[k] <= levels
+
+    k0 = np.clip(n_below - 1, 0, n_levels - 2)
+    z0 = np.take_along_axis(z, k0, axis=0)
+    z1 = np.take_along_axis(z, k0 + 1, axis=0)
+    dz = z1 - z0
+
+    weight = np.divide(levels - z0, dz, out=np.zeros_like(z0), where=dz != 0)
+    valid = (levels >= z[0]) & (levels <= z[-1])
+
+    return {'k0': k0, 'weight': weight, 'valid': valid}
+
+
+def apply_interp_weights(field, weights, missing=MISSING_VALUE):
+    """
+    Linearly interpolate one or more 3D fields using precomputed weights.
+
+    Parameters:
+    -----------
+    field : numpy.ndarray
+        Array shaped (..., bottom_top, south_north, west_east); any leading
+        dimensions (e.g. stacked variables) are interpolated in the same pass
+    weights : dict
+        Output of compute_interp_weights for the matching height field, or
+        {'index': levels} to select model levels (see vertical_interp_weights)
+    missing : float
+        Value used where the target height lies outside the column
+
+    Returns:
+    --------
+    numpy.ndarray:
+        Array shaped (..., len(heights), south_north, west_east)
+    """
+    if 'index' in weights:
+        # Model levels are taken as they are
+        return np.take(field, weights['index'], axis=-3)
+
+    k0 = weights['k0']
+    index = np.broadcast_to(k0, field.shape[:-3] + k0.shape)
+
+    lower = np.take_along_axis(field, index, axis=-3)
+    upper = np.take_along_axis(field, index + 1, axis=-3)
+    result = lower + weights['weight'] * (upper - lower)
+
+    return np.where(weights['valid'], result, missing)
+
+
+def locate_window(lats, lons, subdomain):
+    """
+    Determine the index window of a subdomain.
+
+    Parameters:
+    -----------
+    lats, lons : numpy.ndarray
+        2D latitude and longitude of the mass grid (XLAT, XLONG)
+    subdomain : dict
+        Either 'bbox': [lat_min, lat_max, lon_min, lon_max], selecting the
+        smallest index window that contains every grid cell inside the box,
+        or 'window': [j0, j1, i0, i1] with half-open south_north and
+        west_east index ranges
+
+    Returns:
+    --------
+    tuple:
+        (j0, j1, i0, i1) index bounds of the window
+
+    Raises:
+    -------
+    ValueError:
+        If the subdomain is malformed or does not overlap the grid
+    """
+    ny, nx = np.shape(lats)
+
+    if subdomain.get('bbox') is not None:
+        if len(subdomain['bbox']) != 4:
+            raise ValueError("bbox must be [lat_min, lat_max, lon_min, lon_max]")
+        lat_min, lat_max, lon_min, lon_max = map(float, subdomain['bbox'])
+        inside = (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+        if not inside.any():
+            raise ValueError(f"No grid cell lies inside the bounding box {subdomain['bbox']}")
+
+        rows = np.flatnonzero(inside.any(axis=1))
+        cols = np.flatnonzero(inside.any(axis=0))
+        return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+    if subdomain.get('window') is not None:
+        if len(subdomain['window']) != 4:
+            raise ValueError("window must be [j0, j1, i0, i1]")
+        j0, j1, i0, i1 = map(int, subdomain['window'])
+        if not (0 <= j0 < j1 <= ny and 0 <= i0 < i1 <= nx):
+            raise ValueError(f"Index window {subdomain['window']} is outside the {ny}x{nx} grid")
+        return j0, j1, i0, i1
+
+    raise ValueError("Subdomain needs either a bbox or a window")
+
+
+def load_stations(stations):
+    """
+    Read a list of stations for point extraction.
+
+    Parameters:
+    -----------
+    stations : str or list
+        Path to a CSV file with name, lat and lon columns, or a list of
+        dicts with 'name', 'lat' and 'lon' keys
+
+    Returns:
+    --------
+    list:
+        List of {'name': str, 'lat': float, 'lon': float} dicts
+
+    Raises:
+    -------
+    ValueError:
+        If a station has no valid coordinates or the list is empty
+    """
+    if isinstance(stations, str):
+        with open(stations, 'r', newline='') as file:
+            rows = list(csv.DictReader(file))
+    else:
+        rows = stations
+
+    parsed = []
+    for i, row in enumerate(rows):
+        row = {str(key).strip().lower(): value for key, value in row.items()}
+        try:
+            lat = float(row.get('lat', row.get('latitude')))
+            lon = float(row.get('lon', row.get('longitude')))
+        except (TypeError, ValueError):
+            raise ValueError(f"Station {i+1} needs numeric lat and lon values")
+
+        name = str(row.get('name') or row.get('station') or f"station_{i+1}").strip()
+        parsed.append({'name': name, 'lat': lat, 'lon': lon})
+
+    if not parsed:
+        raise ValueError("Station list is empty")
+
+    return parsed
+
+
+def _unit_vectors(lat, lon):
+    """Convert latitudes and longitudes in degrees to points on the unit sphere."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def locate_points(lats, lons, stations, method='nearest'):
+    """
+    Precompute the grid indices and weights used to sample stations.
+
+    The nearest grid cell is found on the unit sphere, so the search works on
+    any curvilinear WRF grid. For bilinear sampling the fractional grid
+    position of each station is derived from the local grid spacing around
+    that cell. Stations outside the domain are dropped with a warning.
+
+    Parameters:
+    -----------
+    lats, lons : numpy.ndarray
+        2D latitude and longitude of the mass grid (XLAT, XLONG)
+    stations : list
+        Stations as returned by load_stations
+    method : str
+        'nearest' or 'bilinear'
+
+    Returns:
+    --------
+    dict:
+        Point spec with the station 'names', 'lat' and 'lon', the nearest
+        cell ('grid_j', 'grid_i', 'grid_lat', 'grid_lon'), the horizontal
+        'window' (j0, j1, i0, i1) enclosing all needed columns, and the
+        window-relative indices 'jj', 'ii' and 'weights' shaped
+        (n_stations, n_neighbours)
+    """
+    if method not in POINT_METHODS:
+        raise ValueError(f"Point method must be one of {', '.join(POINT_METHODS)}, got {method!r}")
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    ny, nx = lats.shape
+    if ny < 2 or nx < 2:
+        raise ValueError("Point extraction needs a grid of at least 2x2 cells")
+
+    st_lat = np.array([station['lat'] for station in stations], dtype=np.float64)
+    st_lon = np.array([station['lon'] for station in stations], dtype=np.float64)
+
+    # Nearest grid cell by the largest dot product of unit vectors, in batches of stations
+    grid_xyz = _unit_vectors(lats.ravel(), lons.ravel())
+    st_xyz = _unit_vectors(st_lat, st_lon)
+    nearest = np.empty(len(stations), dtype=np.intp)
+    batch = max(1, 2 ** 22 // grid_xyz.shape[0])
+    for start in range(0, len(stations), batch):
+        nearest[start:start + batch] = np.argmax(st_xyz[start:start + batch] @ grid_xyz.T, axis=1)
+    jn, in_ = np.unravel_index(nearest, (ny, nx))
+
+    # Fractional grid position from the local Jacobian of the grid around the nearest cell
+    jlo, jhi = np.clip(jn - 1, 0, ny - 1), np.clip(jn + 1, 0, ny - 1)
+    ilo, ihi = np.clip(in_ - 1, 0, nx - 1), np.clip(in_ + 1, 0, nx - 1)
+    coslat = np.cos(np.radians(lats[jn, in_]))
+
+    def eastward(lon_from, lon_to):
+        return ((lon_to - lon_from + 180) % 360 - 180) * coslat
+
+    dx_dj = eastward(lons[jlo, in_], lons[jhi, in_]) / (jhi - jlo)
+    dy_dj = (lats[jhi, in_] - lats[jlo, in_]) / (jhi - jlo)
+    dx_di = eastward(lons[jn, ilo], lons[jn, ihi]) / (ihi - ilo)
+    dy_di = (lats[jn, ihi] - lats[jn, ilo]) / (ihi - ilo)
+    dx = eastward(lons[jn, in_], st_lon)
+    dy = st_lat - lats[jn, in_]
+
+    det = dx_dj * dy_di - dx_di * dy_dj
+    frac_j = jn + (dx * dy_di - dx_di * dy) / det
+    frac_i = in_ + (dx_dj * dy - dx * dy_dj) / det
+
+    inside = (frac_j >= -0.5) & (frac_j <= ny - 0.5) & (frac_i >= -0.5) & (frac_i <= nx - 0.5)
+    for idx in np.flatnonzero(~inside):
+        print(f"Warning: Station {stations[idx]['name']} ({st_lat[idx]}, {st_lon[idx]}) "
+              f"is outside the model domain; skipping")
+    if not inside.any():
+        raise ValueError("None of the stations lies inside the model domain")
+
+    keep = np.flatnonzero(inside)
+    jn, in_, frac_j, frac_i = jn[keep], in_[keep], frac_j[keep], frac_i[keep]
+
+    if method == 'nearest':
+        jj, ii = jn[:, np.newaxis], in_[:, np.newaxis]
+        weights = np.ones(jj.shape)
+    else:
+        frac_j = np.clip(frac_j, 0, ny - 1)
+        frac_i = np.clip(frac_i, 0, nx - 1)
+        j0 = np.minimum(np.floor(frac_j).astype(np.intp), ny - 2)
+        i0 = np.minimum(np.floor(frac_i).astype(np.intp), nx - 2)
+        tj, ti = frac_j - j0, frac_i - i0
+
+        jj = np.stack([j0, j0, j0 + 1, j0 + 1], axis=1)
+        ii = np.stack([i0, i0 + 1, i0, i0 + 1], axis=1)
+        weights = np.stack([(1 - tj) * (1 - ti), (1 - tj) * ti, tj * (1 - ti), tj * ti], axis=1)
+
+    # Only the window enclosing all needed columns is read from disk
+    window = (int(jj.min()), int(jj.max()) + 1, int(ii.min()), int(ii.max()) + 1)
+
+    return {
+        'method': method,
+        'names': [stations[idx]['name'] for idx in keep],
+        'lat': st_lat[keep],
+        'lon': st_lon[keep],
+        'grid_shape': (ny, nx),
+        'grid_j': jn,
+        'grid_i': in_,
+        'grid_lat': lats[jn, in_],
+        'grid_lon': lons[jn, in_],
+        'window': window,
+        'jj': jj - window[0],
+        'ii': ii - window[2],
+        'weights': weights,
+    }
+
+
+def sample_points(field, points):
+    """
+    Sample a field cropped to the point window at the stations.
+
+    Parameters:
+    -----------
+    field : numpy.ndarray
+        Array shaped (..., window_south_north, window_west_east)
+    points : dict
+        Point spec from locate_points
+
+    Returns:
+    --------
+    numpy.ndarray:
+        Array shaped (..., 1, n_stations), so station data can be handled
+        like a horizontal field with a single row
+    """
+    values = np.sum(field[..., points['jj'], points['ii']] * points['weights'], axis=-1)
+    return values[..., np.newaxis, :]
+
+
+def read_window(ncfile, var_name, t_idx, window):
+    """
+    Read one time step of a variable inside a horizontal window straight from the file.
+
+    Only variables stored on the mass grid can be read this way; anything
+    else (diagnostics, staggered fields) has to go through getvar.
+
+    Parameters:
+    -----------
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    var_name : str
+        Name of the variable
+    t_idx : int
+        Time index
+    window : tuple
+        (j0, j1, i0, i1) index bounds of the window
+
+    Returns:
+    --------
+    tuple or None:
+        (values, attrs), or None if the variable is not stored on the mass grid
+    """
+    if var_name not in ncfile.variables:
+        return None
+
+    nc_var = ncfile.variables[var_name]
+    dims = nc_var.dimensions
+    if dims[0] != 'Time' or dims[-2:] != ('south_north', 'west_east'):
+        return None
+    if len(dims) == 4 and dims[1] != 'bottom_top':
+        return None
+    if len(dims) not in (3, 4):
+        return None
+
+    j0, j1, i0, i1 = window
+    values = nc_var[t_idx, ..., j0:j1, i0:i1]
+
+    return np.ma.filled(values.astype(np.float64), np.nan), safe_get_attributes(nc_var)
+
+
+def read_vertical_window(ncfile, t_idx, vertical_coordinate, window):
+    """
+    Compute the vertical coordinate of the mass levels inside a horizontal window.
+
+    Uses the same definitions as wrf-python's height_agl, z and pressure
+    diagnostics, but only reads the window of PH, PHB and HGT (heights) or
+    P and PB (pressure).
+
+    Parameters:
+    -----------
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    t_idx : int
+        Time index
+    vertical_coordinate : str
+        'height_agl', 'height_msl' or 'pressure'
+    window : tuple
+        (j0, j1, i0, i1) index bounds of the window
+
+    Returns:
+    --------
+    numpy.ndarray:
+        Vertical coordinate (bottom_top, window_south_north, window_west_east)
+        in m or hPa
+    """
+    j0, j1, i0, i1 = window
+    nc_vars = ncfile.variables
+
+    if vertical_coordinate == 'pressure' and all(name in nc_vars for name in ('P', 'PB')):
+        pressure = nc_vars['P'][t_idx, :, j0:j1, i0:i1].astype(np.float64) + nc_vars['PB'][t_idx, :, j0:j1, i0:i1]
+        return np.asarray(pressure / 100.0)
+
+    if vertical_coordinate != 'pressure' and all(name in nc_vars for name in ('PH', 'PHB', 'HGT')):
+        geopotential = (nc_vars['PH'][t_idx, :, j0:j1, i0:i1].astype(np.float64)
+                        + nc_vars['PHB'][t_idx, :, j0:j1, i0:i1])
+        height = 0.5 * (geopotential[1:] + geopotential[:-1]) / GRAVITY
+        if vertical_coordinate == 'height_agl':
+            height = height - nc_vars['HGT'][t_idx, j0:j1, i0:i1]
+        return np.asarray(height)
+
+    wrf_name = VERTICAL_COORDINATES[vertical_coordinate]['wrf_name']
+    return to_np(getvar(ncfile, wrf_name, timeidx=t_idx))[:, j0:j1, i0:i1]
+
+
+def read_vertical_coordinate(ncfile, t_idx, vertical_coordinate='height_agl', window=None, points=None):
+    """
+    Read the vertical coordinate of one time step, cropped or sampled at the stations.
+
+    Parameters:
+    -----------
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    t_idx : int
+        Time index
+    vertical_coordinate : str
+        One of VERTICAL_COORDINATES
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain to read; if None the full grid is read
+    points : dict, optional
+        Point spec from locate_points; its window replaces the subdomain
+
+    Returns:
+    --------
+    numpy.ndarray or None:
+        Vertical coordinate (bottom_top, south_north, west_east) of the
+        window, or (bottom_top, 1, n_stations) in point mode; None for
+        model levels, which need no coordinate field
+    """
+    if vertical_coordinate == 'model_level':
+        return None
+
+    if points is not None:
+        window = points['window']
+
+    if window is None:
+        wrf_name = VERTICAL_COORDINATES[vertical_coordinate]['wrf_name']
+        return to_np(getvar(ncfile, wrf_name, timeidx=t_idx))
+
+    z = read_vertical_window(ncfile, t_idx, vertical_coordinate, window)
+    if points is not None:
+        z = sample_points(z, points)
+
+    return z
+
+
+def vertical_interp_weights(z, levels, vertical_coordinate='height_agl'):
+    """
+    Compute the interpolation weights for the target levels of a vertical coordinate.
+
+    Parameters:
+    -----------
+    z : numpy.ndarray or None
+        Vertical coordinate field from read_vertical_coordinate
+    levels : list
+        Target heights (m), pressures (hPa) or model level indices
+    vertical_coordinate : str
+        One of VERTICAL_COORDINATES
+
+    Returns:
+    --------
+    dict:
+        Weights for apply_interp_weights
+    """
+    if vertical_coordinate == 'model_level':
+        # Model levels are selected, not interpolated
+        return {'index': np.asarray(levels).astype(np.intp)}
+
+    if vertical_coordinate == 'pressure':
+        # Pressure decreases upwards, so interpolate in -p to get an increasing coordinate
+        return compute_interp_weights(-z, -np.asarray(levels, dtype=np.float64))
+
+    return compute_interp_weights(z, levels)
+
+
+def check_model_levels(levels, n_levels):
+    """
+    Check that model level targets are valid bottom_top indices.
+
+    Raises:
+    -------
+    ValueError:
+        If a level is not an integer in [0, n_levels)
+    """
+    for level in levels:
+        if float(level) != int(level) or not 0 <= int(level) < n_levels:
+            raise ValueError(f"Model level {level} is not an index between 0 and {n_levels - 1}")
+
+
+def read_field(ncfile, var_name, t_idx, window=None, points=None):
+    """
+    Read one time step of a variable, cropped to a subdomain or sampled at the stations.
+
+    Parameters:
+    -----------
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    var_name : str
+        Name of the variable
+    t_idx : int
+        Time index
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain to read; if None the full field is returned
+    points : dict, optional
+        Point spec from locate_points; its window replaces the subdomain
+
+    Returns:
+    --------
+    tuple or None:
+        (values, attrs), or None if the variable could not be read or is
+        staggered while a window is given
+    """
+    if points is not None:
+        window = points['window']
+
+    # Raw variables are read only inside the window
+    raw = read_window(ncfile, var_name, t_idx, window) if window is not None else None
+
+    if raw is not None:
+        values, attrs = raw
+    else:
+        var_3d = safe_get_variable(ncfile, var_name, t_idx)
+        if var_3d is None:
+            return None
+
+        values, attrs = to_np(var_3d), safe_get_attributes(var_3d)
+        if window is not None:
+            # The window indices refer to the mass grid, so a staggered field would be cropped half a cell off
+            dims = getattr(var_3d, 'dims', None) or (
+                ncfile.variables[var_name].dimensions if var_name in ncfile.variables else ())
+            if any(dim.endswith('_stag') for dim in dims):
+                print(f"  Warning: {var_name} is on a staggered grid {tuple(dims)}, which does not match "
+                      f"the mass grid of the window; skipping")
+                return None
+
+            j0, j1, i0, i1 = window
+            values = values[..., j0:j1, i0:i1]
+
+    if points is not None:
+        values = sample_points(values, points)
+
+    return values, attrs
+
+
+def interpolate_timestep(ncfile, variables, t_idx, heights, include_surface, shape, window=None, points=None,
+                         vertical_coordinate='height_agl', profile=None):
+    """
+    Extract all requested variables at one time step.
+
+    The vertical coordinate field and the interpolation weights are computed
+    once and all 3D variables on the mass grid are interpolated together in
+    one pass.
+    With a subdomain window only that window is read and interpolated; in
+    point mode only the station columns are interpolated.
+
+    Parameters:
+    -----------
+    ncfile : netCDF4.Dataset
+        Open WRF output file
+    variables : list
+        List of variable names to extract
+    t_idx : int
+        Time index
+    heights : list
+        List of target levels in the units of the vertical coordinate
+    include_surface : bool
+        Whether to include surface level values
+    shape : tuple
+        Horizontal shape (south_north, west_east) of the window, or
+        (1, n_stations) in point mode
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain to extract; if None the full grid is used
+    points : dict, optional
+        Point spec from locate_points to extract station columns only
+    vertical_coordinate : str
+        One of VERTICAL_COORDINATES: 'height_agl' (m), 'height_msl' (m),
+        'pressure' (hPa) or 'model_level' (bottom_top index)
+    profile : ExtractionProfile, optional
+        Receives the time spent in the height, getvar and interpolate stages
+
+    Returns:
+    --------
+    dict:
+        {var_name: result_dict} for every variable that could be read,
+        where result_dict has 'data', 'attrs', and 'surface' keys
+    """
+    results = {}
+    fields_3d = {}
+
+    # Get the vertical coordinate for this time step once for all variables
+    start = time.perf_counter()
+    z = read_vertical_coordinate(ncfile, t_idx, vertical_coordinate, window, points)
+    weights = vertical_interp_weights(z, heights, vertical_coordinate)
+    if profile is not None:
+        profile.add('height', time.perf_counter() - start, nbytes_read=0 if z is None else z.nbytes)
+
+    for var_name in variables:
+        start = time.perf_counter()
+        field = read_field(ncfile, var_name, t_idx, window, points)
+
+        if field is None:
+            continue
+
+        values, attrs = field
+        if profile is not None:
+            profile.add('getvar', time.perf_counter() - start, var_name, nbytes_read=values.nbytes)
+        surface_value = None
+
+        if values.ndim > 2:  # 3D variable
+            if z is not None and values.shape != z.shape:
+                print(f"  Warning: {var_name} has shape {values.shape}, which does not match "
+                      f"the vertical coordinate {z.shape}; skipping")
+                continue
+
+            fields_3d[var_name] = values
+            var_data = None
+
+            # The first vertical level is usually closest to the surface
+            if include_surface:
+                surface_value = values[0, :, :]
+        else:  # 2D variable
+            # For 2D variables, just store the original values at all heights
+            var_data = np.broadcast_to(values, (len(heights), shape[0], shape[1])).astype(np.float64)
+
+            # For 2D variables, surface is the same as the variable
+            if include_surface:
+                surface_value = values
+
+        results[var_name] = {
+            'data': var_data,
+            'attrs': attrs,
+            'surface': surface_value
+        }
+
+    # Interpolate all 3D variables to all heights in one vectorized pass
+    if fields_3d:
+        start = time.perf_counter()
+        interpolated = apply_interp_weights(np.stack(list(fields_3d.values())), weights)
+        for var_idx, var_name in enumerate(fields_3d):
+            results[var_name]['data'] = interpolated[var_idx]
+
+        if profile is not None:
+            # The pass is shared, so its time is split evenly among the variables
+            elapsed = time.perf_counter() - start
+            for var_name in fields_3d:
+                profile.add('interpolate', elapsed / len(fields_3d), var_name)
+
+    return results
+
+
+def shared_buffer_views(shm, n_slots, n_variables, n_heights, shape):
+    """
+    Create NumPy views onto a shared memory block holding time step slabs.
+
+    The block holds the interpolated data followed by the surface data, with
+    one slot per time step in flight.
+
+    Parameters:
+    -----------
+    shm : multiprocessing.shared_memory.SharedMemory
+        Shared memory block of at least shared_buffer_nbytes(...) bytes
+    n_slots : int
+        Number of time step slots in the block
+    n_variables : int
+        Number of variables per time step
+    n_heights : int
+        Number of heights per variable
+    shape : tuple
+        Horizontal shape (south_north, west_east)
+
+    Returns:
+    --------
+    tuple:
+        (data, surface) arrays shaped (n_slots, n_variables, n_heights, *shape)
+        and (n_slots, n_variables, *shape)
+    """
+    data_shape = (n_slots, n_variables, n_heights) + tuple(shape)
+    surface_shape = (n_slots, n_variables) + tuple(shape)
+
+    data = np.ndarray(data_shape, dtype=np.float64, buffer=shm.buf)
+    surface = np.ndarray(surface_shape, dtype=np.float64, buffer=shm.buf, offset=data.nbytes)
+
+    return data, surface
+
+
+def shared_buffer_nbytes(n_slots, n_variables, n_heights, shape):
+    """Return the size in bytes of a shared time step buffer."""
+    return n_slots * n_variables * (n_heights + 1) * shape[0] * shape[1] * np.dtype(np.float64).itemsize
+
+
+# Per-process state of extraction workers, set up by init_worker
+_worker_state = {
+    'max_open_files': 1,
+    'files': OrderedDict(),
+    'buffers': OrderedDict(),
+}
+
+
+def init_worker(max_open_files=1):
+    """
+    Initialize a worker process of the shared extraction pool.
+
+    Workers live for the whole batch. They keep the wrfout files and shared
+    result buffers they have used open, so each file is opened once per
+    worker rather than once per time step.
+
+    Parameters:
+    -----------
+    max_open_files : int
+        Number of files (and shared buffers) each worker keeps open
+    """
+    _worker_state['max_open_files'] = max(1, max_open_files)
+
+
+def _worker_cached(cache, key, open_func, close_func):
+    """Return cache[key], opening it and evicting the least recently used entry if needed."""
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    while len(cache) >= _worker_state['max_open_files']:
+        _, stale = cache.popitem(last=False)
+        close_func(stale)
+
+    cache[key] = open_func()
+    return cache[key]
+
+
+def _attach_buffer(spec):
+    """Attach to the shared result buffer described by a job spec."""
+    shm = shared_memory.SharedMemory(name=spec['shm_name'])
+    data, surface = shared_buffer_views(shm, spec['n_slots'], len(spec['variables']),
+                                        len(spec['heights']), spec['shape'])
+    return {'shm': shm, 'data': data, 'surface': surface}
+
+
+def _detach_buffer(buffer):
+    """Release a shared result buffer attached by _attach_buffer."""
+    # The views must be dropped before the mapping can be closed
+    del buffer['data'], buffer['surface']
+    buffer['shm'].close()
+
+
+def process_timestep(args):
+    """
+    Process all variables of one file at a specific time step in a pool worker.
+
+    The interpolated fields are written into the shared buffer slot instead of
+    being returned, so only the small per-variable metadata is pickled.
+
+    Parameters:
+    -----------
+    args : tuple
+        Contains (spec, t_idx, slot), where spec is the job spec created by
+        open_extraction_job
+
+    Returns:
+    --------
+    tuple:
+        (job_id, t_idx, slot, meta, memory_mb, profile, success)
+        where meta is {var_name: {'attrs': dict, 'has_surface': bool}}
+        for every variable found at this time step, memory_mb is the
+        private memory of the worker measured after the interpolation,
+        profile holds the stage timings of the time step (see ExtractionProfile)
+        and success is False if the time step could not be processed
+    """
+    spec, t_idx, slot = args
+    profile = ExtractionProfile()
+    started = time.time()
+
+    try:
+        start = time.perf_counter()
+        ncfile = _worker_cached(_worker_state['files'], spec['wrfout_file'],
+                                partial(Dataset, spec['wrfout_file'], 'r'), Dataset.close)
+        buffer = _worker_cached(_worker_state['buffers'], spec['shm_name'],
+                                partial(_attach_buffer, spec), _detach_buffer)
+        profile.add('open', time.perf_counter() - start)
+
+        results = interpolate_timestep(ncfile, spec['variables'], t_idx, spec['heights'],
+                                       spec['include_surface'], spec['shape'], spec['window'], spec['points'],
+                                       spec['vertical_coordinate'], profile)
+        memory_mb = get_private_memory_usage()
+
+        start = time.perf_counter()
+        meta = {}
+        for var_idx, var_name in enumerate(spec['variables']):
+            if var_name not in results:
+                continue
+
+            result = results[var_name]
+            buffer['data'][slot, var_idx] = result['data']
+
+            has_surface = result['surface'] is not None
+            if has_surface:
+                buffer['surface'][slot, var_idx] = result['surface']
+
+            meta[var_name] = {'attrs': result['attrs'], 'has_surface': has_surface}
+        profile.add('ipc', time.perf_counter() - start)
+
+        return (spec['job_id'], t_idx, slot, meta, memory_mb, profile.worker_report(started), True)
+
+    except Exception as e:
+        print(f"Error processing time step {t_idx} of {spec['wrfout_file']}: {e}")
+        return (spec['job_id'], t_idx, slot, {}, None, profile.worker_report(started), False)
+
+
+def get_memory_usage():
+    """
+    Get current memory usage in MB.
+    
+    Returns:
+    --------
+    float:
+        Current memory usage in MB
+    """
+    process = psutil.Process(os.getpid())
+    memory_info = process.memory_info()
+    return memory_info.rss / 1024 / 1024  # Convert to MB
+
+
+def get_private_memory_usage():
+    """
+    Get the memory of this process that is not shared with others, in MB.
+
+    Unlike the RSS this excludes the shared result buffers a worker has
+    touched, so it measures the worker's own working set.
+
+    Returns:
+    --------
+    float:
+        Private memory usage in MB
+    """
+    memory_info = psutil.Process(os.getpid()).memory_info()
+    return (memory_info.rss - getattr(memory_info, 'shared', 0)) / 1024 / 1024
+
+
+def get_peak_memory_usage():
+    """
+    Get the peak resident memory of this process in MB.
+
+    Returns:
+    --------
+    float:
+        Maximum resident set size since the process started in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class ExtractionProfile:
+    """
+    Accumulated wall time per stage and per variable, bytes moved and peak memory.
+
+    Workers fill one profile per time step and return it as a small dict; the
+    scheduler merges those into one profile per output file and one per batch.
+    Stages are summed over all workers, so with several workers they can add
+    up to more than the wall time.
+    """
+
+    def __init__(self):
+        self.stages = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self.variables = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.n_timesteps = 0
+        self.worker_peak_rss_mb = {}
+        self.start_time = time.time()
+
+    def add(self, stage, seconds, var_name=None, nbytes_read=0):
+        """Add the time spent in a stage, optionally charged to a variable."""
+        self.stages[stage] += seconds
+        self.bytes_read += nbytes_read
+        if var_name is not None:
+            var_stages = self.variables.setdefault(var_name, {})
+            var_stages[stage] = var_stages.get(stage, 0.0) + seconds
+
+    def worker_report(self, started):
+        """Return the profile of one worker time step for the scheduler."""
+        return {
+            'stages': self.stages,
+            'variables': self.variables,
+            'bytes_read': self.bytes_read,
+            'pid': os.getpid(),
+            'peak_rss_mb': get_peak_memory_usage(),
+            'started': started,
+            'finished': time.time(),
+        }
+
+    def merge(self, other):
+        """Add the stages, variables, bytes and worker memory of another profile."""
+        for stage, seconds in other.stages.items():
+            self.stages[stage] += seconds
+        for var_name, var_stages in other.variables.items():
+            for stage, seconds in var_stages.items():
+                self.add(stage, seconds, var_name)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.n_timesteps += other.n_timesteps
+        for pid, peak in other.worker_peak_rss_mb.items():
+            self.worker_peak_rss_mb[pid] = max(peak, self.worker_peak_rss_mb.get(pid, 0.0))
+
+    def add_worker_report(self, report, submitted):
+        """
+        Merge the profile of one worker time step.
+
+        Parameters:
+        -----------
+        report : dict
+            Profile returned by process_timestep
+        submitted : float
+            time.time() when the time step was submitted to the pool
+        """
+        for stage, seconds in report['stages'].items():
+            self.stages[stage] += seconds
+        for var_name, var_stages in report['variables'].items():
+            for stage, seconds in var_stages.items():
+                self.add(stage, seconds, var_name)
+        self.bytes_read += report['bytes_read']
+        self.n_timesteps += 1
+
+        # Time waiting for a free worker, and for the main process to pick up the result
+        self.stages['queue'] += max(0.0, report['started'] - submitted)
+        self.stages['ipc'] += max(0.0, time.time() - report['finished'])
+
+        pid = report['pid']
+        self.worker_peak_rss_mb[pid] = max(report['peak_rss_mb'], self.worker_peak_rss_mb.get(pid, 0.0))
+
+    def to_dict(self):
+        """Return the profile as a JSON serializable report."""
+        wall_time = time.time() - self.start_time
+        stage_total = sum(self.stages.values())
+        mb = 1024 ** 2
+
+        return {
+            'wall_time_s': round(wall_time, 3),
+            'n_timesteps': self.n_timesteps,
+            'timesteps_per_s': round(self.n_timesteps / wall_time, 3) if wall_time > 0 else None,
+            'stages_s': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            'stage_fractions': {stage: round(seconds / stage_total, 3) if stage_total else 0.0
+                                for stage, seconds in self.stages.items()},
+            'variables_s': {var_name: {stage: round(seconds, 3) for stage, seconds in var_stages.items()}
+                            for var_name, var_stages in self.variables.items()},
+            'bytes_read': int(self.bytes_read),
+            'bytes_written': int(self.bytes_written),
+            'read_mb_per_s': round(self.bytes_read / mb / self.stages['getvar'], 1) if self.stages['getvar'] else None,
+            'write_mb_per_s': round(self.bytes_written / mb / self.stages['write'], 1) if self.stages['write'] else None,
+            'worker_peak_rss_mb': {str(pid): round(peak, 1) for pid, peak in sorted(self.worker_peak_rss_mb.items())},
+            'main_peak_rss_mb': round(get_peak_memory_usage(), 1),
+        }
+
+    def summary(self):
+        """Return a one line summary of the stage times."""
+        stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in self.stages.items())
+        return f"Stage times: {stages}"
+
+
+def write_profile(path, report):
+    """Atomically write a profiling report as JSON."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def domain_dimensions(wrfout_file):
+    """
+    Read the grid dimensions of a WRF output file.
+
+    Parameters:
+    -----------
+    wrfout_file : str
+        Path to the WRF output file
+
+    Returns:
+    --------
+    dict:
+        'n_times', 'n_levels' (bottom_top) and 'shape' (south_north, west_east)
+    """
+    with Dataset(wrfout_file, 'r') as ncfile:
+        dims = ncfile.dimensions
+        return {
+            'n_times': len(dims['Time']),
+            'n_levels': len(dims['bottom_top']),
+            'shape': (len(dims['south_north']), len(dims['west_east'])),
+        }
+
+
+def estimate_task_memory_mb(n_variables, n_heights, n_levels, shape):
+    """
+    Estimate the peak memory of a worker extracting one time step.
+
+    Parameters:
+    -----------
+    n_variables : int
+        Number of variables to process
+    n_heights : int
+        Number of target heights
+    n_levels : int
+        Number of model levels (bottom_top)
+    shape : tuple
+        Horizontal shape (south_north, west_east)
+
+    Returns:
+    --------
+    float:
+        Estimated memory in MB, including the idle worker footprint
+    """
+    level_bytes = shape[0] * shape[1] * np.dtype(np.float64).itemsize
+    column_bytes = n_levels * level_bytes
+
+    task_bytes = (
+        2 * n_variables * column_bytes                  # fields read by getvar and their stacked copy
+        + 6 * column_bytes                              # height_agl and its geopotential intermediates
+        + 3 * n_heights * level_bytes                   # bracketing indices, weights and valid mask
+        + 4 * n_variables * n_heights * level_bytes     # lower, upper and interpolated fields
+    )
+
+    return WORKER_BASELINE_MB + task_bytes / 1024 ** 2
+
+
+def memory_budget_mb(total_memory_limit_gb=0.8):
+    """Return the share of system memory the extraction may use, in MB."""
+    return psutil.virtual_memory().total / 1024 ** 2 * total_memory_limit_gb
+
+
+def memory_limited_workers(max_workers, task_memory_mb, total_memory_limit_gb=0.8):
+    """
+    Limit a worker count so that all workers fit into memory at once.
+
+    Parameters:
+    -----------
+    max_workers : int
+        Requested number of workers
+    task_memory_mb : float
+        Peak memory of one worker (see estimate_task_memory_mb)
+    total_memory_limit_gb : float
+        Maximum fraction of system memory to use
+
+    Returns:
+    --------
+    int:
+        Number of workers, at least 1
+    """
+    fitting = int(memory_budget_mb(total_memory_limit_gb) // max(task_memory_mb, 1))
+    return max(1, min(max_workers, fitting))
+
+
+def adaptive_chunk_size(n_times, n_variables, total_memory_limit_gb=0.8, n_heights=1, n_levels=1,
+                        shape=(1, 1), n_workers=1, n_files=1, task_memory_mb=None):
+    """
+    Calculate how many time steps of a file may be in flight at once.
+
+    The memory budget is shared between the working sets of all workers and
+    the shared result buffers of all files in flight; each in-flight time step
+    needs one buffer slot of n_variables * (n_heights + 1) 2D fields.
+    
+    Parameters:
+    -----------
+    n_times : int
+        Number of time steps to process
+    n_variables : int
+        Number of variables to process
+    total_memory_limit_gb : float
+        Maximum fraction of system memory to use
+    n_heights : int
+        Number of target heights
+    n_levels : int
+        Number of model levels (bottom_top)
+    shape : tuple
+        Horizontal shape (south_north, west_east)
+    n_workers : int
+        Number of worker processes sharing the memory budget
+    n_files : int
+        Number of files whose buffers share the memory budget
+    task_memory_mb : float, optional
+        Measured peak memory of a worker; estimated from the domain if None
+        
+    Returns:
+    --------
+    int:
+        Number of time steps (buffer slots) in flight
+    """
+    if task_memory_mb is None:
+        task_memory_mb = estimate_task_memory_mb(n_variables, n_heights, n_levels, shape)
+
+    slot_memory_mb = shared_buffer_nbytes(1, n_variables, n_heights, shape) / 1024 ** 2
+
+    # Memory left for buffers once every worker holds its working set
+    buffer_budget_mb = (memory_budget_mb(total_memory_limit_gb) - n_workers * task_memory_mb) / max(1, n_files)
+
+    if buffer_budget_mb < slot_memory_mb:
+        print(f"Warning: {n_workers} workers of {task_memory_mb:.0f} MB leave no room for result buffers; "
+              f"consider fewer processes")
+
+    chunk_size = max(1, min(n_times, int(buffer_budget_mb // slot_memory_mb)))
+    
+    return chunk_size
+
+
+# Resident memory of an idle worker with numpy, netCDF4 and wrf-python loaded
+WORKER_BASELINE_MB = 150
+
+# Default encoding of extracted variables (matches the historic f8/zlib output)
+DEFAULT_ENCODING = {
+    'dtype': 'f8',
+    'least_significant_digit': None,
+    'chunking': None,
+    'compression': 'zlib',
+    'complevel': 1,
+    'shuffle': True,
+}
+
+# Compressors accepted by netCDF4.Dataset.createVariable
+COMPRESSORS = ('zlib', 'szip', 'zstd', 'bzip2', 'blosc_lz', 'blosc_lz4',
+               'blosc_lz4hc', 'blosc_zlib', 'blosc_zstd')
+
+# Default file name of the batch manifest used for resuming
+MANIFEST_NAME = '.wrfchem_extract_manifest.json'
+
+# Target size of one chunk when chunking for time series access
+TIMESERIES_CHUNK_BYTES = 1024 ** 2
+
+# Default file name of the batch profiling report
+PROFILE_NAME = 'extraction_profile.json'
+
+# Stages timed by the profiling report, in processing order
+PROFILE_STAGES = ('open', 'queue', 'height', 'getvar', 'interpolate', 'ipc', 'write')
+
+# Horizontal sampling methods of the point extraction mode
+POINT_METHODS = ('nearest', 'bilinear')
+
+# Grouping of time steps when concatenating a series of wrfout files
+CONCATENATE_MODES = ('month', 'run')
+
+# Gravitational acceleration used by wrf-python to convert geopotential to height
+GRAVITY = 9.81
+
+# Vertical coordinates of the target levels, with the wrf-python diagnostic providing each
+VERTICAL_COORDINATES = {
+    'height_agl': {'wrf_name': 'height_agl', 'units': 'meters', 'description': 'Heights above ground level'},
+    'height_msl': {'wrf_name': 'z', 'units': 'meters', 'description': 'Heights above sea level'},
+    'pressure': {'wrf_name': 'pressure', 'units': 'hPa', 'description': 'Pressure levels'},
+    'model_level': {'wrf_name': None, 'units': '1', 'description': 'Model levels (bottom_top index, 0 at the surface)'},
+}
+
+# Daily diagnostics the streaming stage can derive
+DIAGNOSTIC_PRODUCTS = ('mda8', 'daily_max', 'aot40')
+
+# Default settings of the diagnostics stage
+DEFAULT_DIAGNOSTICS = {
+    'products': list(DIAGNOSTIC_PRODUCTS),
+    'variables': None,
+    'level': 'surface',
+    'hourly': True,
+    'utc_offset': 0,
+    'aot40_threshold': None,
+    'aot40_hours': [8, 20],
+    'aot40_months': [5, 6, 7],
+}
+
+# Length of the MDA8 running mean and the fraction of valid values it needs
+MDA8_WINDOW_HOURS = 8
+MDA8_MIN_FRACTION = 0.75
+
+# The AOT40 threshold of 40 ppb in common WRF-Chem and observation units
+AOT40_THRESHOLDS = {
+    'ppmv': 0.04,
+    'ppm': 0.04,
+    'ppbv': 40.0,
+    'ppb': 40.0,
+    'ug m-3': 80.0,
+    'ug/m3': 80.0,
+}
+
+
+def resolve_encoding(encoding=None):
+    """
+    Validate an output encoding and fill in defaults.
+
+    Parameters:
+    -----------
+    encoding : dict or None
+        Partial encoding with any of the keys of DEFAULT_ENCODING
+
+    Returns:
+    --------
+    dict:
+        Complete encoding dictionary
+
+    Raises:
+    -------
+    ValueError:
+        If an option is unknown or has an invalid value
+    """
+    resolved = dict(DEFAULT_ENCODING)
+    for key, value in (encoding or {}).items():
+        if key not in DEFAULT_ENCODING:
+            raise ValueError(f"Unknown encoding option: {key}")
+        resolved[key] = value
+
+    if resolved['dtype'] not in ('f4', 'f8'):
+        raise ValueError(f"Output dtype must be 'f4' or 'f8', got {resolved['dtype']!r}")
+
+    chunking = resolved['chunking']
+    if isinstance(chunking, (list, tuple)):
+        if len(chunking) != 4 or not all(isinstance(c, int) and c > 0 for c in chunking):
+            raise ValueError("Explicit chunking must be four positive integers (time, height, south_north, west_east)")
+    elif chunking not in (None, 'timeseries', 'map'):
+        raise ValueError(f"Chunking must be 'timeseries', 'map', a list or null, got {chunking!r}")
+
+    if resolved['compression'] in ('none', False):
+        resolved['compression'] = None
+    if resolved['compression'] is not None and resolved['compression'] not in COMPRESSORS:
+        raise ValueError(f"Unknown compression {resolved['compression']!r}, choose one of {', '.join(COMPRESSORS)}")
+
+    return resolved
+
+
+def resolve_diagnostics(diagnostics=None):
+    """
+    Validate the settings of the diagnostics stage and fill in defaults.
+
+    Parameters:
+    -----------
+    diagnostics : dict or None
+        Partial settings with any of the keys of DEFAULT_DIAGNOSTICS
+
+    Returns:
+    --------
+    dict:
+        Complete diagnostics settings
+
+    Raises:
+    -------
+    ValueError:
+        If an option is unknown or has an invalid value
+    """
+    resolved = dict(DEFAULT_DIAGNOSTICS)
+    for key, value in (diagnostics or {}).items():
+        if key not in DEFAULT_DIAGNOSTICS:
+            raise ValueError(f"Unknown diagnostics option: {key}")
+        resolved[key] = value
+
+    unknown = [product for product in resolved['products'] if product not in DIAGNOSTIC_PRODUCTS]
+    if unknown or not resolved['products']:
+        raise ValueError(f"Diagnostic products must be chosen from {', '.join(DIAGNOSTIC_PRODUCTS)}")
+
+    start, end = resolved['aot40_hours']
+    if not 0 <= start < end <= 24:
+        raise ValueError(f"aot40_hours must be [start, end) hours of the day, got {resolved['aot40_hours']}")
+
+    if resolved['level'] != 'surface':
+        resolved['level'] = float(resolved['level'])
+
+    return resolved
+
+
+def chunk_shape(encoding, dim_sizes):
+    """
+    Determine the chunk shape of an output variable.
+
+    Parameters:
+    -----------
+    encoding : dict
+        Resolved encoding (see resolve_encoding)
+    dim_sizes : tuple
+        Sizes of (time, height, south_north, west_east), or of
+        (time, south_north, west_east) for surface variables
+
+    Returns:
+    --------
+    tuple or None:
+        Chunk sizes, or None to use the library default
+    """
+    chunking = encoding['chunking']
+    if chunking is None:
+        return None
+
+    has_height = len(dim_sizes) == 4
+    n_times, ny, nx = dim_sizes[0], dim_sizes[-2], dim_sizes[-1]
+
+    if chunking == 'map':
+        # One full 2D field per chunk
+        chunks = (1, 1, ny, nx)
+    elif chunking == 'timeseries':
+        # Full time axis over small horizontal tiles of about TIMESERIES_CHUNK_BYTES
+        itemsize = np.dtype(encoding['dtype']).itemsize
+        tile = max(1, int(np.sqrt(TIMESERIES_CHUNK_BYTES / (itemsize * max(1, n_times)))))
+        chunks = (n_times, 1, min(ny, tile), min(nx, tile))
+    else:
+        chunks = tuple(chunking)
+
+    if not has_height:
+        chunks = (chunks[0],) + chunks[2:]
+
+    return tuple(max(1, min(c, size)) for c, size in zip(chunks, dim_sizes))
+
+
+def variable_kwargs(encoding, dim_sizes):
+    """
+    Build createVariable keyword arguments for an output variable.
+
+    Parameters:
+    -----------
+    encoding : dict
+        Resolved encoding (see resolve_encoding)
+    dim_sizes : tuple
+        Sizes of the variable dimensions
+
+    Returns:
+    --------
+    dict:
+        Keyword arguments for netCDF4.Dataset.createVariable
+    """
+    kwargs = {
+        'compression': encoding['compression'],
+        'shuffle': encoding['shuffle'],
+    }
+    if encoding['compression'] is not None:
+        kwargs['complevel'] = encoding['complevel']
+    if encoding['least_significant_digit'] is not None:
+        kwargs['least_significant_digit'] = encoding['least_significant_digit']
+
+    chunks = chunk_shape(encoding, dim_sizes)
+    if chunks is not None:
+        kwargs['chunksizes'] = chunks
+
+    return kwargs
+
+
+class StreamingWriter:
+    """
+    Write finished time step slabs straight into an open output file.
+
+    Output variables are created on the first time step a variable is found,
+    so nothing but the slab currently being written is held in memory.
+    """
+
+    var_dims = ('time', 'height', 'south_north', 'west_east')
+    surface_dims = ('time', 'south_north', 'west_east')
+
+    def __init__(self, outfile, variables, include_surface=True, encoding=None):
+        """
+        Parameters:
+        -----------
+        outfile : netCDF4.Dataset
+            Output file opened for writing, with dimensions already defined
+        variables : list
+            List of variable names in the order of the shared buffer
+        include_surface : bool
+            Whether to write surface level values
+        encoding : dict, optional
+            Output dtype, quantization, chunking and compression
+            (see DEFAULT_ENCODING). Default is the historic f8/zlib encoding.
+        """
+        self.outfile = outfile
+        self.variables = variables
+        self.include_surface = include_surface
+        self.encoding = resolve_encoding(encoding)
+        self.nc_vars = {}
+        self.nc_surf_vars = {}
+        self.bytes_written = 0
+
+        # Reuse variables already present when resuming a partial output file
+        for var_name in variables:
+            if var_name in outfile.variables:
+                self.nc_vars[var_name] = outfile.variables[var_name]
+            if f"{var_name}_surface" in outfile.variables:
+                self.nc_surf_vars[var_name] = outfile.variables[f"{var_name}_surface"]
+
+    def create_kwargs(self, dims):
+        """Return the createVariable keyword arguments for a variable with the given dimensions."""
+        dim_sizes = tuple(len(self.outfile.dimensions[dim]) for dim in dims)
+        return variable_kwargs(self.encoding, dim_sizes)
+
+    def write_slab(self, nc_var, t_idx, values):
+        """Write the values of one time step into an output variable."""
+        nc_var[t_idx] = values
+
+    def create_variable(self, var_name, var_attrs):
+        """Create the output variable (and surface variable) for var_name."""
+        print(f"Creating output variable: {var_name}")
+        
+        # Create main variable
+        nc_var = self.outfile.createVariable(var_name, self.encoding['dtype'], self.var_dims,
+                                             **self.create_kwargs(self.var_dims))
+        
+        # Copy attributes
+        for attr_name, attr_value in var_attrs.items():
+            try:
+                setattr(nc_var, attr_name, attr_value)
+            except Exception as e:
+                print(f"Warning: Couldn't set attribute {attr_name} for {var_name}: {e}")
+        
+        self.nc_vars[var_name] = nc_var
+        
+        # Create surface variable if needed
+        if self.include_surface:
+            surf_var_name = f"{var_name}_surface"
+            surf_var = self.outfile.createVariable(surf_var_name, self.encoding['dtype'], self.surface_dims,
+                                                   **self.create_kwargs(self.surface_dims))
+            
+            # Copy attributes
+            for attr_name, attr_value in var_attrs.items():
+                try:
+                    setattr(surf_var, attr_name, attr_value)
+                except Exception as e:
+                    print(f"Warning: Couldn't set attribute {attr_name} for {surf_var_name}: {e}")
+            
+            # Add surface-specific attributes
+            surf_var.description = f"Surface level values for {var_name}"
+            
+            self.nc_surf_vars[var_name] = surf_var
+
+    def write_timestep(self, t_idx, meta, data, surface):
+        """
+        Write all variables of one finished time step.
+
+        Parameters:
+        -----------
+        t_idx : int
+            Time index in the output file
+        meta : dict
+            {var_name: {'attrs': dict, 'has_surface': bool}} from process_timestep
+        data : numpy.ndarray
+            Slab shaped (n_variables, n_heights, south_north, west_east)
+        surface : numpy.ndarray
+            Slab shaped (n_variables, south_north, west_east)
+        """
+        # Iterate in configured order so variables are created deterministically
+        for var_idx, var_name in enumerate(self.variables):
+            if var_name not in meta:
+                continue
+            
+            if var_name not in self.nc_vars:
+                self.create_variable(var_name, meta[var_name]['attrs'])
+            
+            # Write main variable data
+            self.write_slab(self.nc_vars[var_name], t_idx, data[var_idx])
+            self.bytes_written += data[var_idx].size * self.nc_vars[var_name].dtype.itemsize
+            
+            # Write surface data if available
+            if self.include_surface and meta[var_name]['has_surface']:
+                self.write_slab(self.nc_surf_vars[var_name], t_idx, surface[var_idx])
+                self.bytes_written += surface[var_idx].size * self.nc_surf_vars[var_name].dtype.itemsize
+
+
+class PointWriter(StreamingWriter):
+    """
+    Write station time series of the point extraction mode.
+
+    Slabs arrive as (..., 1, n_stations) like a single-row horizontal field
+    and are stored as (station, time, height) so each station's time series
+    is contiguous.
+    """
+
+    var_dims = ('station', 'time', 'height')
+    surface_dims = ('station', 'time')
+
+    def create_kwargs(self, dims):
+        """Return the createVariable keyword arguments, chunked per station or per time step."""
+        dim_sizes = tuple(len(self.outfile.dimensions[dim]) for dim in dims)
+        kwargs = variable_kwargs(dict(self.encoding, chunking=None), dim_sizes)
+
+        if self.encoding['chunking'] == 'map':
+            # All stations of one time step per chunk
+            kwargs['chunksizes'] = (dim_sizes[0], 1) + dim_sizes[2:]
+        elif self.encoding['chunking'] is not None:
+            # Whole time series of one station per chunk
+            kwargs['chunksizes'] = (1,) + dim_sizes[1:]
+
+        return kwargs
+
+    def write_slab(self, nc_var, t_idx, values):
+        """Write one time step, moving the station axis to the front."""
+        nc_var[:, t_idx] = np.moveaxis(values[..., 0, :], -1, 0)
+
+
+class DiagnosticStream:
+    """
+    Derive daily air quality diagnostics from extracted fields as time steps arrive.
+
+    Time steps may finish out of order, so the selected level of each one is
+    held back until all earlier time steps are in. They are then folded in
+    time order into running 8-hour means and the reductions of the current
+    day, and every finished day is written at once, so only one day of state
+    is kept per variable and the hourly output never has to be read again.
+    """
+
+    def __init__(self, writer, variables, heights, times, diagnostics=None):
+        """
+        Parameters:
+        -----------
+        writer : StreamingWriter
+            Writer of the output file the diagnostics are added to
+        variables : list
+            List of variable names in the order of the shared buffer
+        heights : list
+            Target levels of the extraction
+        times : list
+            datetime of every time step (UTC)
+        diagnostics : dict, optional
+            Settings of the diagnostics stage (see DEFAULT_DIAGNOSTICS)
+        """
+        self.writer = writer
+        self.outfile = writer.outfile
+        self.config = resolve_diagnostics(diagnostics)
+        self.variables = [var for var in variables
+                          if self.config['variables'] is None or var in self.config['variables']]
+        self.var_index = {var: variables.index(var) for var in self.variables}
+
+        if self.config['level'] == 'surface':
+            if not writer.include_surface:
+                raise ValueError("Diagnostics at the surface need surface values (include_surface)")
+            self.level_index = None
+        else:
+            matches = [k for k, height in enumerate(heights) if float(height) == self.config['level']]
+            if not matches:
+                raise ValueError(f"Diagnostics level {self.config['level']} is not one of the extracted levels")
+            self.level_index = matches[0]
+
+        # Days are defined in local time
+        offset = datetime.timedelta(hours=self.config['utc_offset'])
+        self.local_times = [t + offset for t in times]
+        self.days = sorted({t.date() for t in self.local_times})
+        day_lookup = {day: d for d, day in enumerate(self.days)}
+        self.day_index = [day_lookup[t.date()] for t in self.local_times]
+
+        # Running means cover MDA8_WINDOW_HOURS of time steps
+        self.step_hours = 1.0
+        if len(times) > 1:
+            self.step_hours = (times[1] - times[0]).total_seconds() / 3600
+        self.window = max(1, int(round(MDA8_WINDOW_HOURS / self.step_hours)))
+        self.min_steps = int(np.ceil(MDA8_MIN_FRACTION * self.window))
+
+        self.pending = {}
+        self.next_t = 0
+        self.state = {}
+        self.nc_vars = {}
+        self.day_dims = tuple('day' if dim == 'time' else dim for dim in writer.surface_dims)
+        self.season_dims = tuple(dim for dim in writer.surface_dims if dim != 'time')
+
+        self._write_days()
+
+    @property
+    def hourly(self):
+        """Whether the hourly fields are written next to the diagnostics."""
+        return self.config['hourly']
+
+    def _write_days(self):
+        """Create the day dimension and its date coordinate."""
+        self.outfile.createDimension('day', len(self.days))
+        self.outfile.createDimension('date_len', 10)
+
+        day_var = self.outfile.createVariable('day_str', 'S1', ('day', 'date_len'))
+        day_var.long_name = "Local date of the daily diagnostics"
+        day_var.units = "YYYY-MM-DD format"
+        day_var.utc_offset = self.config['utc_offset']
+        day_var[:] = np.array([list(day.isoformat()) for day in self.days], dtype='S1')
+
+    def _create(self, name, dims, attrs, description, units):
+        """Create one diagnostic output variable."""
+        if dims == self.season_dims:
+            # Single field, library chunking
+            dim_sizes = tuple(len(self.outfile.dimensions[dim]) for dim in dims)
+            kwargs = variable_kwargs(dict(self.writer.encoding, chunking=None), dim_sizes)
+        else:
+            kwargs = self.writer.create_kwargs(dims)
+
+        print(f"Creating diagnostic variable: {name}")
+        nc_var = self.outfile.createVariable(name, self.writer.encoding['dtype'], dims, **kwargs)
+        for attr_name, attr_value in attrs.items():
+            if attr_name not in ('description', 'units'):
+                try:
+                    setattr(nc_var, attr_name, attr_value)
+                except Exception as e:
+                    print(f"Warning: Couldn't set attribute {attr_name} for {name}: {e}")
+        nc_var.description = description
+        if units is not None:
+            nc_var.units = units
+
+        self.nc_vars[name] = nc_var
+        return nc_var
+
+    def _new_state(self, var_name, shape, attrs):
+        """Set up the running state of one variable."""
+        units = attrs.get('units')
+        threshold = self.config['aot40_threshold']
+        if threshold is None and 'aot40' in self.config['products']:
+            threshold = AOT40_THRESHOLDS.get(str(units).strip().lower())
+            if threshold is None:
+                print(f"Warning: No AOT40 threshold known for {var_name} in units {units!r}; "
+                      f"set diagnostics.aot40_threshold to compute it")
+
+        return {
+            'attrs': attrs,
+            'units': units,
+            'threshold': threshold,
+            'ring': np.full((self.window,) + shape, np.nan),
+            'day': None,
+            'daily_max': np.full(shape, np.nan),
+            'mda8': np.full(shape, np.nan),
+            'aot40': np.zeros(shape),
+            'aot40_season': np.zeros(shape),
+        }
+
+    def add(self, t_idx, meta, data, surface):
+        """
+        Take the diagnostics level of one finished time step.
+
+        Parameters:
+        -----------
+        t_idx : int
+            Time index
+        meta : dict
+            {var_name: {'attrs': dict, 'has_surface': bool}} from process_timestep
+            (empty if the time step failed)
+        data : numpy.ndarray
+            Slab shaped (n_variables, n_heights, south_north, west_east)
+        surface : numpy.ndarray
+            Slab shaped (n_variables, south_north, west_east)
+        """
+        fields = {}
+        for var_name in self.variables:
+            if var_name not in meta:
+                continue
+
+            if self.level_index is None:
+                if not meta[var_name]['has_surface']:
+                    continue
+                field = surface[self.var_index[var_name]]
+            else:
+                field = data[self.var_index[var_name], self.level_index]
+
+            # Copy out of the shared slot, which is reused once this returns
+            fields[var_name] = (np.where(field == MISSING_VALUE, np.nan, field), meta[var_name]['attrs'])
+
+        self.pending[t_idx] = fields
+        while self.next_t in self.pending:
+            self._fold(self.next_t, self.pending.pop(self.next_t))
+            self.next_t += 1
+
+    def _fold(self, t_idx, fields):
+        """Fold one time step into the running means and daily reductions."""
+        day = self.day_index[t_idx]
+        hour = self.local_times[t_idx].hour
+        aot40_start, aot40_end = self.config['aot40_hours']
+
+        for var_name in self.variables:
+            state = self.state.get(var_name)
+            if var_name in fields:
+                field, attrs = fields[var_name]
+                if state is None:
+                    state = self.state[var_name] = self._new_state(var_name, field.shape, attrs)
+            elif state is None:
+                continue
+            else:
+                field = np.full(state['ring'].shape[1:], np.nan)
+
+            if day != state['day']:
+                if state['day'] is not None:
+                    self._emit_day(var_name, state)
+                state['day'] = day
+
+            # Running mean over the last window of time steps
+            ring = state['ring']
+            ring[t_idx % self.window] = field
+            valid = np.isfinite(ring)
+            n_valid = valid.sum(axis=0)
+            running_mean = np.full(field.shape, np.nan)
+            np.divide(np.where(valid, ring, 0).sum(axis=0), n_valid, out=running_mean,
+                      where=n_valid >= self.min_steps)
+
+            state['daily_max'] = np.fmax(state['daily_max'], field)
+            state['mda8'] = np.fmax(state['mda8'], running_mean)
+            if state['threshold'] is not None and aot40_start <= hour < aot40_end:
+                state['aot40'] += np.where(field > state['threshold'], field - state['threshold'], 0) * self.step_hours
+
+    def _emit_day(self, var_name, state):
+        """Write the finished day of one variable and reset its daily reductions."""
+        day = state['day']
+        units = state['units']
+        descriptions = {
+            'mda8': (f"Maximum daily {MDA8_WINDOW_HOURS}-hour running mean of {var_name}", units),
+            'daily_max': (f"Daily maximum of {var_name}", units),
+            'aot40': (f"Daily accumulated exposure of {var_name} over the AOT40 threshold "
+                      f"(local hours {self.config['aot40_hours'][0]}-{self.config['aot40_hours'][1]})",
+                      f"{units} h" if units else None),
+        }
+
+        for product in self.config['products']:
+            if product == 'aot40' and state['threshold'] is None:
+                continue
+
+            name = f"{var_name}_{product}"
+            nc_var = self.nc_vars.get(name)
+            if nc_var is None:
+                description, product_units = descriptions[product]
+                nc_var = self._create(name, self.day_dims, state['attrs'], description, product_units)
+                if product == 'aot40':
+                    nc_var.threshold = state['threshold']
+            self.writer.write_slab(nc_var, day, state[product])
+
+        if self.days[day].month in self.config['aot40_months']:
+            state['aot40_season'] += state['aot40']
+
+        state['daily_max'] = np.full(state['daily_max'].shape, np.nan)
+        state['mda8'] = np.full(state['mda8'].shape, np.nan)
+        state['aot40'] = np.zeros(state['aot40'].shape)
+
+    def finish(self):
+        """Write the last day and the seasonal AOT40 of every variable."""
+        for var_name, state in self.state.items():
+            if state['day'] is not None:
+                self._emit_day(var_name, state)
+
+            if 'aot40' in self.config['products'] and state['threshold'] is not None:
+                months = ', '.join(str(month) for month in self.config['aot40_months'])
+                nc_var = self._create(f"{var_name}_aot40_season", self.season_dims, state['attrs'],
+                                      f"AOT40 of {var_name} accumulated over the days of months {months}",
+                                      f"{state['units']} h" if state['units'] else None)
+                nc_var.threshold = state['threshold']
+                nc_var[:] = state['aot40_season'].reshape(nc_var.shape)
+
+
+def read_output_times(outfile):
+    """
+    Read the time stamps of an output file.
+
+    Parameters:
+    -----------
+    outfile : netCDF4.Dataset
+        Output file created by open_output_file
+
+    Returns:
+    --------
+    list:
+        datetime of every time step
+    """
+    time_strings = chartostring(outfile.variables['time_str'][:])
+    return [datetime.datetime.strptime(str(t)[:19].replace('_', 'T'), '%Y-%m-%dT%H:%M:%S')
+            for t in time_strings]
+
+
+def write_station_coordinates(outfile, points):
+    """
+    Write the station dimension and coordinates of a point extraction output.
+
+    Parameters:
+    -----------
+    outfile : netCDF4.Dataset
+        Output file opened for writing
+    points : dict
+        Point spec from locate_points
+    """
+    n_stations = len(points['names'])
+    name_len = max(len(name) for name in points['names'])
+    outfile.createDimension('station', n_stations)
+    outfile.createDimension('name_len', name_len)
+    outfile.point_method = points['method']
+
+    name_var = outfile.createVariable('station_name', 'S1', ('station', 'name_len'))
+    name_var.long_name = 'Station name'
+    name_var[:] = np.array([list(name.ljust(name_len)) for name in points['names']], dtype='S1')
+
+    lat_var = outfile.createVariable('lat', 'f8', ('station',))
+    lat_var.units = 'degrees_north'
+    lat_var.description = 'station latitude'
+    lat_var[:] = points['lat']
+
+    lon_var = outfile.createVariable('lon', 'f8', ('station',))
+    lon_var.units = 'degrees_east'
+    lon_var.description = 'station longitude'
+    lon_var[:] = points['lon']
+
+    for name, values, units, description in (
+            ('grid_lat', points['grid_lat'], 'degrees_north', 'latitude of the nearest grid cell'),
+            ('grid_lon', points['grid_lon'], 'degrees_east', 'longitude of the nearest grid cell')):
+        grid_var = outfile.createVariable(name, 'f8', ('station',))
+        grid_var.units = units
+        grid_var.description = description
+        grid_var[:] = values
+
+    for name, values, dim in (('grid_j', points['grid_j'], 'south_north'),
+                              ('grid_i', points['grid_i'], 'west_east')):
+        index_var = outfile.createVariable(name, 'i4', ('station',))
+        index_var.description = f"{dim} index of the nearest grid cell"
+        index_var[:] = values
+
+
+def open_output_file(wrfout_file, output_file, heights, append=False, window=None, points=None,
+                     vertical_coordinate='height_agl', times=None):
+    """
+    Create an output file with the time, height and lat/lon coordinates of a wrfout file.
+
+    Parameters:
+    -----------
+    wrfout_file : str
+        Path to the WRF output file
+    output_file : str
+        Path to the output netCDF file
+    heights : list
+        List of heights in meters to extract variables at
+    append : bool
+        Reopen an existing (partial) output file instead of creating it
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain; the grid and lat/lon are cropped to it
+    points : dict, optional
+        Point spec from locate_points; the file then holds station
+        coordinates instead of the lat/lon grid
+    vertical_coordinate : str
+        Vertical coordinate of the target levels (see VERTICAL_COORDINATES)
+    times : list, optional
+        Time stamps of a concatenated output (see plan_concatenation). The
+        time dimension is then unlimited and wrfout_file only provides the grid.
+
+    Returns:
+    --------
+    tuple:
+        (outfile, n_times, shape) with the output file left open for writing,
+        where shape is that of the window, or (1, n_stations) in point mode
+    """
+    # Open the WRF output file to get dimensions and coordinates
+    with Dataset(wrfout_file, 'r') as ncfile:
+        # Verify dates without modifying them
+        verify_wrf_times(ncfile)
+
+        # Get time, latitude, and longitude
+        wrf_times = getvar(ncfile, "times", timeidx=ALL_TIMES)
+        lats, lons = getvar(ncfile, "lat"), getvar(ncfile, "lon")
+
+        # Get shape for pre-allocation
+        shape = (lats.shape[0], lats.shape[1])
+
+        # Get height info to be used by all processes
+        time_values = to_np(wrf_times) if times is None else np.asarray(times)
+        n_times = len(time_values)
+        lat_values = to_np(lats)
+        lon_values = to_np(lons)
+
+        # Try to get time units and calendar for proper time representation
+        if hasattr(wrf_times, 'units'):
+            time_units = wrf_times.units
+        else:
+            time_units = 'hours since 1900-01-01 00:00:00'
+
+        if hasattr(wrf_times, 'calendar'):
+            calendar = wrf_times.calendar
+        else:
+            calendar = 'standard'
+
+    if points is not None:
+        # The station indices are only valid on the grid they were located on
+        if (lat_values.shape != tuple(points['grid_shape'])
+                or not np.allclose(lat_values[points['grid_j'], points['grid_i']], points['grid_lat'])
+                or not np.allclose(lon_values[points['grid_j'], points['grid_i']], points['grid_lon'])):
+            raise ValueError(f"The grid of {wrfout_file} differs from the grid the stations were located on")
+        shape = (1, len(points['names']))
+    elif window is not None:
+        j0, j1, i0, i1 = window
+        lat_values = lat_values[j0:j1, i0:i1]
+        lon_values = lon_values[j0:j1, i0:i1]
+        shape = lat_values.shape
+
+    if append:
+        outfile = Dataset(output_file, 'a')
+        expected = {'time': n_times, 'height': len(heights)}
+        if points is None:
+            expected.update({'south_north': shape[0], 'west_east': shape[1]})
+        else:
+            expected['station'] = shape[1]
+        for dim, size in expected.items():
+            if dim not in outfile.dimensions or len(outfile.dimensions[dim]) != size:
+                outfile.close()
+                raise ValueError(f"Cannot resume {output_file}: dimension '{dim}' does not match {wrfout_file}")
+        return outfile, n_times, shape
+
+    outfile = Dataset(output_file, 'w', format='NETCDF4')
+
+    try:
+        # Set up dimensions in the output file; concatenated outputs get an unlimited time axis
+        outfile.createDimension('time', None if times is not None else n_times)
+        outfile.createDimension('height', len(heights))
+        if points is None:
+            outfile.createDimension('south_north', shape[0])
+            outfile.createDimension('west_east', shape[1])
+        if points is None and window is not None:
+            # Position of the subdomain in the original grid (half-open index ranges)
+            outfile.subdomain_window = np.array(window, dtype=np.int32)
+
+        # Create dimension variables
+        time_var = outfile.createVariable('time', 'f8', ('time',))
+        time_var.units = time_units
+        time_var.calendar = calendar
+        time_var.standard_name = "time"
+        time_var[:] = np.arange(n_times)  # Use simple indices to avoid date conversion issues
+
+        # Create a character array to store time strings
+        # Use a fixed-length character array instead of a string variable
+        str_len = 20  # Length to fit YYYY-MM-DD_HH:MM:SS format
+        outfile.createDimension('str_len', str_len)
+        time_str_var = outfile.createVariable('time_str', 'S1', ('time', 'str_len'))
+        time_str_var.units = "YYYY-MM-DD_HH:MM:SS format"
+        time_str_var.long_name = "Time as formatted string"
+
+        # Fill the character array
+        for i, t in enumerate(time_values):
+            t_str = str(t)
+            for j, c in enumerate(t_str[:str_len]):
+                time_str_var[i, j] = c
+
+        # The level axis keeps the name 'height' for every vertical coordinate
+        coordinate = VERTICAL_COORDINATES[vertical_coordinate]
+        height_var = outfile.createVariable('height', 'f8', ('height',))
+        height_var.units = coordinate['units']
+        height_var.description = coordinate['description']
+        height_var.vertical_coordinate = vertical_coordinate
+        height_var[:] = heights
+
+        if points is not None:
+            write_station_coordinates(outfile, points)
+            return outfile, n_times, shape
+
+        lat_var = outfile.createVariable('lat', 'f8', ('south_north', 'west_east'))
+        lat_var.units = 'degrees_north'
+        lat_var.description = 'latitude'
+        lat_var[:] = lat_values
+
+        lon_var = outfile.createVariable('lon', 'f8', ('south_north', 'west_east'))
+        lon_var.units = 'degrees_east'
+        lon_var.description = 'longitude'
+        lon_var[:] = lon_values
+    except Exception:
+        outfile.close()
+        raise
+
+    return outfile, n_times, shape
+
+
+def open_extraction_output(output_file, wrfout_file, variables, heights, include_surface=True, encoding=None,
+                           window=None, points=None, vertical_coordinate='height_agl', diagnostics=None,
+                           times=None, resume_from=0):
+    """
+    Open the output file of a task for the ExtractionScheduler.
+
+    Creates the output file with its writer and diagnostics stage. An output
+    is fed by one extraction job per input file, or by several when the time
+    steps of a series of wrfout files are concatenated.
+
+    Parameters:
+    -----------
+    output_file : str
+        Path to the output netCDF file
+    wrfout_file : str
+        Path to the (first) WRF output file, providing grid and coordinates
+    variables : list
+        List of variable names to extract
+    heights : list
+        List of heights in meters to extract variables at
+    include_surface : bool
+        Whether to include surface level values
+    encoding : dict, optional
+        Output encoding (see DEFAULT_ENCODING)
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain to extract instead of the full grid
+    points : dict, optional
+        Point spec from locate_points to extract station time series
+        instead of full fields
+    vertical_coordinate : str
+        Vertical coordinate of the target levels (see VERTICAL_COORDINATES)
+    diagnostics : dict, optional
+        Settings of the daily diagnostics stage (see DEFAULT_DIAGNOSTICS);
+        requires processing from the first time step
+    times : list, optional
+        Time stamps of a concatenated output (see plan_concatenation)
+    resume_from : int
+        First time step to process; earlier time steps are taken to be
+        complete in an existing output file, which is appended to
+
+    Returns:
+    --------
+    dict:
+        Output state used by the scheduler
+    """
+    if vertical_coordinate == 'model_level':
+        check_model_levels(heights, domain_dimensions(wrfout_file)['n_levels'])
+
+    outfile, n_times, shape = open_output_file(wrfout_file, output_file, heights, append=resume_from > 0,
+                                               window=window, points=points,
+                                               vertical_coordinate=vertical_coordinate, times=times)
+    if resume_from > 0:
+        print(f"Resuming at time step {resume_from}/{n_times}")
+
+    try:
+        if points is None:
+            writer = StreamingWriter(outfile, variables, include_surface, encoding)
+        else:
+            writer = PointWriter(outfile, variables, include_surface, encoding)
+
+        diagnostic_stream = None
+        if diagnostics is not None:
+            if resume_from > 0:
+                raise ValueError("The diagnostics stage cannot resume a partial output")
+            diagnostic_stream = DiagnosticStream(writer, variables, heights, read_output_times(outfile), diagnostics)
+    except Exception:
+        outfile.close()
+        raise
+
+    return {
+        'output_file': output_file,
+        'outfile': outfile,
+        'writer': writer,
+        'diagnostics': diagnostic_stream,
+        'shape': shape,
+        'n_times': n_times,
+        'written': set(),
+        'written_upto': resume_from,
+        'failed': False,
+        'open_jobs': 0,
+        'start_time': time.time(),
+    }
+
+
+def close_extraction_output(output):
+    """
+    Finish the diagnostics and close the file of an output.
+
+    Parameters:
+    -----------
+    output : dict
+        Output state created by open_extraction_output
+
+    Returns:
+    --------
+    bool:
+        True if every time step was written without errors
+    """
+    found_variables = len(output['writer'].nc_vars)
+
+    if output['diagnostics'] is not None and not output['failed']:
+        try:
+            output['diagnostics'].finish()
+            found_variables += len(output['diagnostics'].nc_vars)
+        except Exception as e:
+            print(f"Error writing diagnostics to {output['output_file']}: {e}")
+            output['failed'] = True
+
+    output['outfile'].close()
+
+    if output['failed']:
+        return False
+
+    if not found_variables:
+        print(f"Warning: No variables were successfully processed for {output['output_file']}!")
+    else:
+        print(f"Wrote {found_variables} variables to output file")
+
+    elapsed_time = time.time() - output['start_time']
+    print(f"Extraction completed in {elapsed_time:.2f} seconds")
+    print(f"Output saved to: {output['output_file']}")
+
+    return True
+
+
+def open_extraction_job(job_id, output, wrfout_file, variables, heights, include_surface=True,
+                        window=None, points=None, vertical_coordinate='height_agl', time_indices=None,
+                        output_indices=None, n_workers=1, n_files=1, task_memory_mb=None, max_slots=None):
+    """
+    Prepare one input file for extraction by the ExtractionScheduler.
+
+    Creates a shared result buffer with one slot per time step in flight.
+    Time steps the output already holds (before its written_upto) are skipped.
+
+    Parameters:
+    -----------
+    job_id : int
+        Identifier of the job within the batch
+    output : dict
+        Output state from open_extraction_output that receives the time steps
+    wrfout_file : str
+        Path to the WRF output file
+    variables : list
+        List of variable names to extract
+    heights : list
+        List of heights in meters to extract variables at
+    include_surface : bool
+        Whether to include surface level values
+    window : tuple, optional
+        (j0, j1, i0, i1) subdomain to extract instead of the full grid
+    points : dict, optional
+        Point spec from locate_points to extract station time series
+    vertical_coordinate : str
+        Vertical coordinate of the target levels (see VERTICAL_COORDINATES)
+    time_indices : list, optional
+        Time steps of the input file to extract. Default is all.
+    output_indices : list, optional
+        Time index in the output of each of time_indices. Default is the same.
+    n_workers : int
+        Number of worker processes sharing the memory budget
+    n_files : int
+        Number of files in flight sharing the memory budget
+    task_memory_mb : float, optional
+        Measured peak memory of a worker; estimated from the domain if None
+    max_slots : int, optional
+        Upper bound on the number of time steps in flight
 
     Returns:
     --------
-    wrf.Variable or None:
-        The requested variable or None if not found/error
+    dict:
+        Job state used by the scheduler
     """
-    try:
-        var_3d = getvar(ncfile, var_name, timeidx=t_idx)
-        return var_3d
-    except Exception as e:
-        print(f"  Warning: Variable {var_name} not found or error: {e}")
-        return None
-
-
-def get_surface_value(ncfile, var_name, t_idx):
+    dims = domain_dimensions(wrfout_file)
+    if time_indices is None:
+        time_indices = list(range(dims['n_times']))
+        output_indices = time_indices
+
+    time_map = dict(zip(time_indices, output_indices))
+    pending = deque(t_idx for t_idx in time_indices if time_map[t_idx] >= output['written_upto'])
+
+    shape = output['shape']
+    read_shape = shape
+    if points is not None:
+        j0, j1, i0, i1 = points['window']
+        read_shape = (j1 - j0, i1 - i0)
+
+    # Determine how many time steps may be in flight based on the domain size
+    estimated_mb = estimate_task_memory_mb(len(variables), len(heights), dims['n_levels'], read_shape)
+    if task_memory_mb is None or task_memory_mb < estimated_mb:
+        task_memory_mb = estimated_mb
+
+    n_slots = adaptive_chunk_size(max(1, len(pending)), len(variables), n_heights=len(heights),
+                                  n_levels=dims['n_levels'], shape=shape, n_workers=n_workers, n_files=n_files,
+                                  task_memory_mb=task_memory_mb)
+    if max_slots is not None:
+        n_slots = max(1, min(n_slots, max_slots))
+    print(f"Processing with up to {n_slots} time steps in flight "
+          f"(~{task_memory_mb:.0f} MB per worker)")
+
+    shm = shared_memory.SharedMemory(
+        create=True, size=shared_buffer_nbytes(n_slots, len(variables), len(heights), shape))
+    data, surface = shared_buffer_views(shm, n_slots, len(variables), len(heights), shape)
+
+    spec = {
+        'job_id': job_id,
+        'wrfout_file': wrfout_file,
+        'variables': variables,
+        'heights': heights,
+        'include_surface': include_surface,
+        'shape': shape,
+        'window': None if points is not None else window,
+        'points': points,
+        'vertical_coordinate': vertical_coordinate,
+        'shm_name': shm.name,
+        'n_slots': n_slots,
+    }
+
+    output['open_jobs'] += 1
+
+    return {
+        'spec': spec,
+        'output': output,
+        'time_map': time_map,
+        'shm': shm,
+        'data': data,
+        'surface': surface,
+        'pending': pending,
+        'free_slots': list(range(n_slots)),
+        'submitted': {},
+        'n_times': len(time_indices),
+        'in_flight': 0,
+        'completed': len(time_indices) - len(pending),
+        'failed': False,
+        'task_memory_mb': task_memory_mb,
+        'start_time': time.time(),
+    }
+
+
+def close_extraction_job(job):
     """
-    Get the surface (ground level) value for a variable.
+    Release the shared buffer of a job and detach it from its output.
 
     Parameters:
     -----------
-    ncfile : netCDF4.Dataset
-        Open WRF output file
-    var_name : str
-        Name of the variable to extract
-    t_idx : int
-        Time index
+    job : dict
+        Job state created by open_extraction_job
 
     Returns:
     --------
-    numpy.ndarray or None:
-        2D array of surface values or None if not available
+    bool:
+        True if the job finished without errors
     """
-    try:
-        # For 3D variables, we need to get the lowest level (k=0)
-        # First check if variable exists in the WRF file
-        var_3d = safe_get_variable(ncfile, var_name, t_idx)
+    del job['data'], job['surface']
+    job['shm'].close()
+    job['shm'].unlink()
 
-        if var_3d is None:
-            return None
+    job['output']['open_jobs'] -= 1
+    if job['failed']:
+        job['output']['failed'] = True
+        return False
 
-        # Check if this is a 3D variable (has a vertical dimension)
-        if len(var_3d.shape) > 2:
-            # For 3D variables, take the first vertical level (usually closest to surface)
-            surface_value = to_np(var_3d[0, :, :])
-        else:
-            # For 2D variables, use as is
-            surface_value = to_np(var_3d)
+    return True
 
-        return surface_value
 
-    except Exception as e:
-        print(f"  Warning: Could not get surface value for {var_name}: {e}")
-        return None
+def task_inputs(task):
+    """Return the input files of a task, in time order."""
+    if task.get('segments'):
+        return [segment['wrfout_file'] for segment in task['segments']]
+    return [task['wrfout_file']]
 
 
-def safe_get_attributes(var_3d):
+def input_signature(wrfout_file):
+    """Return the modification time and size identifying the state of an input file."""
+    stat = os.stat(wrfout_file)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def config_hash(task):
     """
-    Safely extract attributes from a WRF variable, handling problematic types.
+    Hash the settings of a file task that determine the output contents.
 
     Parameters:
     -----------
-    var_3d : wrf.Variable
-        Variable to extract attributes from
+    task : dict
+        File task with variables, heights, include_surface, encoding and
+        optionally window, points, vertical_coordinate, diagnostics and
+        the segments of a concatenated output
 
     Returns:
     --------
-    dict:
-        Dictionary of attribute name/value pairs
+    str:
+        Hex digest identifying the extraction configuration
     """
-    var_attrs = {}
+    settings = {
+        'variables': list(task['variables']),
+        'heights': [float(h) for h in task['heights']],
+        'include_surface': bool(task['include_surface']),
+        'encoding': resolve_encoding(task.get('encoding')),
+    }
+    if task.get('diagnostics') is not None:
+        settings['diagnostics'] = resolve_diagnostics(task['diagnostics'])
+    if task.get('vertical_coordinate', 'height_agl') != 'height_agl':
+        settings['vertical_coordinate'] = task['vertical_coordinate']
+    if task.get('window') is not None:
+        settings['window'] = [int(index) for index in task['window']]
+    if task.get('points') is not None:
+        points = task['points']
+        settings['points'] = {
+            'method': points['method'],
+            'names': list(points['names']),
+            'lat': [float(lat) for lat in points['lat']],
+            'lon': [float(lon) for lon in points['lon']],
+        }
+    if task.get('segments'):
+        settings['segments'] = [
+            {'time_indices': [int(t) for t in segment['time_indices']],
+             'output_indices': [int(t) for t in segment['output_indices']]}
+            for segment in task['segments']]
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
 
-    # Safe attribute types that can be directly stored in netCDF4
-    safe_types = (str, int, float, bool, np.int8, np.int16, np.int32, np.int64,
-                 np.uint8, np.uint16, np.uint32, np.uint64, np.float32, np.float64)
 
-    for attr_name in var_3d.attrs:
-        if attr_name not in ['coordinates', 'grid_mapping', 'cell_methods', 'time', 'projection']:
-            attr_value = var_3d.attrs[attr_name]
+class Manifest:
+    """
+    Record of completed and partial outputs of a batch, persisted as JSON.
 
-            # Convert non-safe types to strings
-            if not isinstance(attr_value, safe_types):
-                attr_value = str(attr_value)
+    Each output is stored with the mtime and size of its inputs, the config
+    hash and the number of leading time steps that are fully written, so an
+    interrupted batch can skip finished files and resume partial ones.
+    Concatenated outputs store lists of inputs and signatures.
+    """
 
-            var_attrs[attr_name] = attr_value
+    def __init__(self, path):
+        """
+        Parameters:
+        -----------
+        path : str
+            Path of the JSON manifest; loaded if it exists
+        """
+        self.path = path
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    self.entries = json.load(file).get('outputs', {})
+            except Exception as e:
+                print(f"Warning: Could not read manifest {path}, starting a new one: {e}")
+
+    def resume_point(self, task):
+        """
+        Determine where processing of a file task should start.
+
+        Parameters:
+        -----------
+        task : dict
+            File task (see ExtractionScheduler.run)
+
+        Returns:
+        --------
+        int or None:
+            None if the output is complete and up to date, otherwise the first
+            time step to process (0 to start from scratch)
+        """
+        entry = self.entries.get(os.path.abspath(task['output_file']))
+
+        if entry is None or not os.path.exists(task['output_file']):
+            return 0
+        inputs, signatures = self.describe_inputs(task)
+        if entry['input'] != inputs:
+            return 0
+        if entry['input_signature'] != signatures:
+            return 0
+        if entry['config_hash'] != config_hash(task):
+            return 0
+
+        if entry['complete']:
+            return None
+        return entry['written_upto']
+
+    @staticmethod
+    def describe_inputs(task):
+        """Return the input path(s) and signature(s) of a task as stored in the manifest."""
+        inputs = [os.path.abspath(wrfout_file) for wrfout_file in task_inputs(task)]
+        signatures = [input_signature(wrfout_file) for wrfout_file in task_inputs(task)]
+        if not task.get('segments'):
+            return inputs[0], signatures[0]
+        return inputs, signatures
+
+    def record(self, task, n_times, written_upto, complete):
+        """Update the entry of a file task and write the manifest to disk."""
+        inputs, signatures = self.describe_inputs(task)
+        self.entries[os.path.abspath(task['output_file'])] = {
+            'input': inputs,
+            'input_signature': signatures,
+            'config_hash': config_hash(task),
+            'n_times': n_times,
+            'written_upto': written_upto,
+            'complete': complete,
+            'updated': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        self.save()
 
-    return var_attrs
+    def save(self):
+        """Atomically write the manifest to disk."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'outputs': self.entries}, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
 
 
-def process_variable_at_time(args):
+class ExtractionScheduler:
     """
-    Process a single variable at a specific time step.
-    
-    Parameters:
-    -----------
-    args : tuple
-        Contains (wrfout_file, var_name, t_idx, heights, include_surface, shape)
-    
-    Returns:
-    --------
-    tuple:
-        (var_name, t_idx, result_dict)
-        where result_dict has 'data', 'attrs', and 'surface' keys
+    Schedule (file, time step) work items of a whole batch on one worker pool.
+
+    The pool is created once and shared by every file, so workers are started
+    and wrf-python is imported once per batch, and the number of worker
+    processes never exceeds the core budget, however many files are in flight.
     """
-    wrfout_file, var_name, t_idx, heights, include_surface, shape = args
-    
-    try:
-        # Open the file to access the data
-        with Dataset(wrfout_file, 'r') as ncfile:
-            # Get the variable for this time step
-            var_3d = safe_get_variable(ncfile, var_name, t_idx)
-            
-            if var_3d is None:
-                return (var_name, t_idx, None)
-                
-            # Get attributes
-            var_attrs = safe_get_attributes(var_3d)
-            
-            # Get surface value if requested
-            surface_value = None
-            if include_surface:
-                surface_value = get_surface_value(ncfile, var_name, t_idx)
-            
-            # Get 3D height for this time step
-            z = getvar(ncfile, "height_agl", timeidx=t_idx)
-            
-            # Process data based on dimensionality
-            if len(var_3d.shape) > 2:  # 3D variable
-                # Pre-allocate array for all heights
-                var_data = np.zeros((len(heights), shape[0], shape[1]), dtype=np.float64)
-                
-                # Interpolate to each height level
-                for h_idx, height in enumerate(heights):
-                    var_at_height = interplevel(var_3d, z, height)
-                    var_data[h_idx, :, :] = to_np(var_at_height)
-            else:  # 2D variable
-                # For 2D variables, just store the original values at all heights
-                var_data = np.zeros((len(heights), shape[0], shape[1]), dtype=np.float64)
-                for h_idx in range(len(heights)):
-                    var_data[h_idx, :, :] = to_np(var_3d)
-                    
-                # For 2D variables, surface is the same as the variable
-                if include_surface and surface_value is None:
-                    surface_value = to_np(var_3d)
-            
-            # Return results
-            result = {
-                'data': var_data,
-                'attrs': var_attrs,
-                'surface': surface_value
-            }
-            
-            return (var_name, t_idx, result)
-                
-    except Exception as e:
-        print(f"Error processing variable {var_name} at time {t_idx}: {e}")
-        return (var_name, t_idx, None)
 
+    def __init__(self, max_workers=None, max_parallel_files=1, checkpoint_interval=60, profile=False):
+        """
+        Parameters:
+        -----------
+        max_workers : int, optional
+            Total number of worker processes (core budget). Default is None,
+            which uses the number of available CPU cores minus 1.
+        max_parallel_files : int
+            Maximum number of files whose time steps are interleaved
+        checkpoint_interval : float
+            Minimum number of seconds between manifest checkpoints of a file
+        profile : bool
+            Write a JSON profiling report next to every output file. The
+            batch profile is kept in self.batch_profile either way.
+        """
+        if max_workers is None:
+            max_workers = max(1, mp.cpu_count() - 1)
+
+        self.max_workers = max_workers
+        self.max_parallel_files = max(1, max_parallel_files)
+        self.checkpoint_interval = checkpoint_interval
+        self.profile = profile
+        self.batch_profile = ExtractionProfile()
+        self.output_profiles = []
+        self.measured_task_mb = None
+        # Workers are started from a clean server process rather than forked from this one,
+        # so they never inherit (and keep locked) output files opened by the batch
+        start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=mp.get_context(start_method),
+            initializer=init_worker,
+            initargs=(self.max_parallel_files,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
+
+    def shutdown(self):
+        """Stop the worker pool."""
+        self.executor.shutdown(wait=True)
+
+    def _in_flight_limit(self, active):
+        """Maximum number of time steps in flight over all files that fits into memory."""
+        task_memory_mb = max([job['task_memory_mb'] for job in active.values()] + [self.measured_task_mb or 0])
+        workers = memory_limited_workers(self.max_workers, task_memory_mb)
+
+        # Keep a second time step queued per worker unless memory already limits the workers
+        return workers if workers < self.max_workers else 2 * self.max_workers
+
+    def _submit(self, job, futures, limit):
+        """Submit pending time steps of a job while it has free buffer slots."""
+        while job['pending'] and job['free_slots'] and len(futures) < limit:
+            t_idx = job['pending'].popleft()
+            slot = job['free_slots'].pop()
+            future = self.executor.submit(process_timestep, (job['spec'], t_idx, slot))
+            futures[future] = (job['spec']['job_id'], t_idx, slot)
+            job['submitted'][t_idx] = time.time()
+            job['in_flight'] += 1
+
+    def _fail(self, job):
+        """Mark a job and its output as failed and stop submitting its time steps."""
+        job['failed'] = True
+        job['output']['failed'] = True
+        job['pending'].clear()
+
+    def _collect(self, job, t_idx, slot, meta, memory_mb, report, success=True):
+        """Write a finished time step to the job's output and return its slot to the job."""
+        # Calibrate the memory model with the measured worker footprint
+        if memory_mb is not None and memory_mb > job['task_memory_mb']:
+            job['task_memory_mb'] = memory_mb
+            if self.measured_task_mb is None or memory_mb > self.measured_task_mb:
+                self.measured_task_mb = memory_mb
+
+        output = job['output']
+        out_idx = job['time_map'][t_idx]
+        output['profile'].add_worker_report(report, job['submitted'].pop(t_idx))
+
+        if not success:
+            # A failed time step must never be counted as written, or the output would be recorded complete
+            self._fail(job)
+
+        start = time.perf_counter()
+        try:
+            if not output['failed']:
+                diagnostics = output['diagnostics']
+                if meta and (diagnostics is None or diagnostics.hourly):
+                    output['writer'].write_timestep(out_idx, meta, job['data'][slot], job['surface'][slot])
+                if diagnostics is not None:
+                    diagnostics.add(out_idx, meta, job['data'][slot], job['surface'][slot])
+        except Exception as e:
+            print(f"Error writing time step {out_idx} to {output['output_file']}: {e}")
+            self._fail(job)
+        output['profile'].add('write', time.perf_counter() - start)
+
+        job['free_slots'].append(slot)
+        job['in_flight'] -= 1
+        job['completed'] += 1
+
+        # Track the contiguous prefix of finished time steps for checkpoints
+        if output['failed']:
+            return
+        output['written'].add(out_idx)
+        while output['written_upto'] in output['written']:
+            output['written'].remove(output['written_upto'])
+            output['written_upto'] += 1
+
+        # Update progress
+        completed, total = job['completed'], job['n_times']
+        if completed % max(1, total // 100) == 0:
+            elapsed = time.time() - job['start_time']
+            progress = completed / total * 100
+            est_total = elapsed / (completed / total)
+            remaining = est_total - elapsed
+            memory_usage_mb = get_memory_usage()
+
+            print(f"Progress {os.path.basename(job['spec']['wrfout_file'])}: "
+                  f"{progress:.1f}% ({completed}/{total}), "
+                  f"Memory: {memory_usage_mb:.1f} MB, "
+                  f"Est. remaining: {remaining:.1f}s")
+
+    def _checkpoint(self, output, manifest, force=False):
+        """Flush an output file and record its progress in the manifest."""
+        if manifest is None or output['failed']:
+            return
+        if not force and time.time() - output['last_checkpoint'] < self.checkpoint_interval:
+            return
+
+        output['outfile'].sync()
+        manifest.record(output['task'], output['n_times'], output['written_upto'], complete=False)
+        output['last_checkpoint'] = time.time()
+
+    def _open_output(self, task, manifest):
+        """Open the output of a task, or return None if it is up to date."""
+        resume_from = 0
+        if manifest is not None:
+            resume_from = manifest.resume_point(task)
+            if resume_from is None:
+                return None
+            if resume_from > 0 and task.get('diagnostics') is not None:
+                # Running means and daily reductions need every time step
+                print(f"Restarting {task['output_file']} from the first time step for the diagnostics")
+                resume_from = 0
+
+        segments = task.get('segments') or [{'wrfout_file': task['wrfout_file'],
+                                             'time_indices': None, 'output_indices': None}]
+
+        profile = ExtractionProfile()
+        start = time.perf_counter()
+        output = open_extraction_output(
+            task['output_file'], segments[0]['wrfout_file'], task['variables'], task['heights'],
+            include_surface=task['include_surface'], encoding=task.get('encoding'), window=task.get('window'),
+            points=task.get('points'), vertical_coordinate=task.get('vertical_coordinate', 'height_agl'),
+            diagnostics=task.get('diagnostics'), times=task.get('times'), resume_from=resume_from)
+        profile.add('open', time.perf_counter() - start)
+        output['profile'] = profile
+
+        # Only inputs with time steps beyond the resume point are opened again
+        output['segments'] = deque(
+            segment for segment in segments
+            if segment['output_indices'] is None or max(segment['output_indices']) >= resume_from)
+        output['task'] = task
+        output['last_checkpoint'] = time.time()
+        return output
+
+    def _next_segment(self, outputs):
+        """Return an output with an input that may be opened now, if any."""
+        for output in outputs.values():
+            if not output['segments'] or output['failed']:
+                continue
+            # The diagnostics fold time steps in order, so their inputs are read one after another
+            if output['diagnostics'] is not None and output['open_jobs'] > 0:
+                continue
+            return output
+        return None
 
-def get_memory_usage():
+    def _report(self, output, close_seconds):
+        """Finish the profile of a closed output, merge it into the batch and write its report."""
+        profile = output['profile']
+        profile.add('write', close_seconds)
+        profile.bytes_written = output['writer'].bytes_written
+        self.batch_profile.merge(profile)
+
+        report = dict(profile.to_dict(), output_file=output['output_file'],
+                      inputs=task_inputs(output['task']))
+        self.output_profiles.append(report)
+        print(profile.summary())
+
+        if self.profile:
+            report_file = f"{os.path.splitext(output['output_file'])[0]}.profile.json"
+            try:
+                write_profile(report_file, report)
+                print(f"Profile saved to: {report_file}")
+            except Exception as e:
+                print(f"Warning: Could not write profile {report_file}: {e}")
+
+    def batch_report(self):
+        """
+        Return the profile of everything this scheduler processed.
+
+        Returns:
+        --------
+        dict:
+            Batch totals (see ExtractionProfile.to_dict) with the worker
+            settings and a short entry per output file
+        """
+        report = self.batch_profile.to_dict()
+        report['max_workers'] = self.max_workers
+        report['max_parallel_files'] = self.max_parallel_files
+        report['timesteps_per_s_per_worker'] = (
+            round(report['timesteps_per_s'] / self.max_workers, 3) if report['timesteps_per_s'] else None)
+        report['outputs'] = [
+            {key: entry[key] for key in ('output_file', 'wall_time_s', 'n_timesteps', 'timesteps_per_s')}
+            for entry in self.output_profiles]
+        return report
+
+    def run(self, file_tasks, manifest=None):
+        """
+        Extract a batch of files.
+
+        Parameters:
+        -----------
+        file_tasks : list
+            List of dicts with wrfout_file, variables, heights, output_file,
+            include_surface, encoding and optionally window, points,
+            vertical_coordinate and diagnostics. A concatenated output has
+            'segments' and 'times' from plan_concatenation instead of wrfout_file.
+        manifest : Manifest, optional
+            If given, outputs that are complete and up to date are skipped,
+            partial outputs are resumed and progress is checkpointed
+
+        Returns:
+        --------
+        list:
+            (input, output_file, success) for every task, in input order, where
+            input is the wrfout file or the list of wrfout files of the output
+        """
+        queued = deque(enumerate(file_tasks))
+        outputs = {}
+        active = {}
+        futures = {}
+        results = {}
+        n_jobs = 0
+
+        # Keep a few time steps queued per worker, the memory model may allow fewer
+        max_slots = 2 * self.max_workers
+
+        while queued or outputs:
+            # Open new files up to the parallel file limit
+            while len(active) < self.max_parallel_files:
+                output = self._next_segment(outputs)
+                if output is None:
+                    if not queued:
+                        break
+                    task_id, task = queued.popleft()
+                    label = task.get('wrfout_file') or task_inputs(task)
+                    try:
+                        output = self._open_output(task, manifest)
+                    except Exception as e:
+                        print(f"Error processing file {task['output_file']}: {e}")
+                        traceback.print_exc()
+                        results[task_id] = (label, task['output_file'], False)
+                        continue
+                    if output is None:
+                        print(f"Skipping up-to-date output: {task['output_file']}")
+                        results[task_id] = (label, task['output_file'], True)
+                        continue
+                    output['task_id'] = task_id
+                    outputs[task_id] = output
+                    continue
+
+                segment = output['segments'].popleft()
+                task = output['task']
+                n_jobs += 1
+                print(f"\nProcessing file {n_jobs} (output {output['task_id']+1}/{len(file_tasks)}): "
+                      f"{segment['wrfout_file']}")
+                try:
+                    active[n_jobs] = open_extraction_job(
+                        n_jobs, output, segment['wrfout_file'], task['variables'], task['heights'],
+                        include_surface=task['include_surface'], window=task.get('window'),
+                        points=task.get('points'), vertical_coordinate=task.get('vertical_coordinate', 'height_agl'),
+                        time_indices=segment['time_indices'], output_indices=segment['output_indices'],
+                        n_workers=self.max_workers, n_files=self.max_parallel_files,
+                        task_memory_mb=self.measured_task_mb, max_slots=max_slots)
+                except Exception as e:
+                    print(f"Error processing file {segment['wrfout_file']}: {e}")
+                    traceback.print_exc()
+                    output['failed'] = True
+                    output['segments'].clear()
+
+            # Keep the free buffer slots of every file busy within the memory limit
+            limit = self._in_flight_limit(active)
+            for job in active.values():
+                self._submit(job, futures, limit)
+
+            # Write time steps as they complete
+            if futures:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    job_id, t_idx, slot = futures.pop(future)
+                    job = active[job_id]
+                    try:
+                        _, _, _, meta, memory_mb, report, success = future.result()
+                    except Exception as e:
+                        print(f"Error in task processing: {e}")
+                        self._fail(job)
+                        job['submitted'].pop(t_idx, None)
+                        job['free_slots'].append(slot)
+                        job['in_flight'] -= 1
+                        continue
+                    self._collect(job, t_idx, slot, meta, memory_mb, report, success)
+                    self._checkpoint(active[job_id]['output'], manifest)
+
+            # Release files that have no work left
+            for job_id in [j for j, job in active.items() if not job['pending'] and job['in_flight'] == 0]:
+                close_extraction_job(active.pop(job_id))
+
+            # Close outputs once all of their files are done
+            for task_id in [t for t, output in outputs.items()
+                            if (not output['segments'] or output['failed']) and output['open_jobs'] == 0]:
+                output = outputs.pop(task_id)
+                start = time.perf_counter()
+                success = close_extraction_output(output)
+                task = output['task']
+                self._report(output, time.perf_counter() - start)
+                results[task_id] = (task.get('wrfout_file') or task_inputs(task), output['output_file'], success)
+
+                if manifest is not None and success:
+                    manifest.record(task, output['n_times'], output['n_times'], complete=True)
+
+                # Explicitly trigger garbage collection after each file
+                gc.collect()
+
+        return [results[task_id] for task_id in sorted(results)]
+
+
+def prepare_points(wrfout_file, stations, method='nearest'):
     """
-    Get current memory usage in MB.
-    
+    Locate stations on the grid of a WRF output file.
+
+    Parameters:
+    -----------
+    wrfout_file : str
+        Path to a WRF output file on the target grid
+    stations : str or list
+        Station CSV file or list of stations (see load_stations)
+    method : str
+        'nearest' or 'bilinear'
+
     Returns:
     --------
-    float:
-        Current memory usage in MB
+    dict:
+        Point spec from locate_points, shared by all files on this grid
     """
-    process = psutil.Process(os.getpid())
-    memory_info = process.memory_info()
-    return memory_info.rss / 1024 / 1024  # Convert to MB
+    with Dataset(wrfout_file, 'r') as ncfile:
+        lats, lons = to_np(getvar(ncfile, "lat")), to_np(getvar(ncfile, "lon"))
 
+    points = locate_points(lats, lons, load_stations(stations), method)
 
-def adaptive_chunk_size(n_times, n_variables, total_memory_limit_gb=0.8):
+    j0, j1, i0, i1 = points['window']
+    print(f"Extracting {len(points['names'])} stations ({method}) "
+          f"from a {j1 - j0}x{i1 - i0} window of the {lats.shape[0]}x{lats.shape[1]} grid")
+
+    return points
+
+
+def prepare_window(wrfout_file, subdomain):
     """
-    Calculate an adaptive chunk size based on available system memory.
-    
+    Locate a subdomain on the grid of a WRF output file.
+
     Parameters:
     -----------
-    n_times : int
-        Number of time steps to process
-    n_variables : int
-        Number of variables to process
-    total_memory_limit_gb : float
-        Maximum fraction of system memory to use
-        
+    wrfout_file : str
+        Path to a WRF output file on the target grid
+    subdomain : dict
+        Subdomain with a 'bbox' or 'window' entry (see locate_window)
+
     Returns:
     --------
-    int:
-        Chunk size for processing batches
+    tuple:
+        (j0, j1, i0, i1) index window, shared by all files on this grid
     """
-    # Get system memory
-    total_memory_gb = psutil.virtual_memory().total / (1024 ** 3)
-    
-    # Limit to a percentage of available memory
-    memory_limit_gb = total_memory_gb * total_memory_limit_gb
-    
-    # Estimate memory for each task
-    # This is a rough approximation based on typical WRF file sizes
-    estimated_task_memory_mb = 100  # MB per task
-    
-    # Calculate how many tasks we could potentially run given our memory limit
-    max_tasks = int((memory_limit_gb * 1024) / estimated_task_memory_mb)
-    
-    # Calculate chunk size, with some safety factor
-    chunk_size = max(1, min(n_times, max_tasks // (n_variables * 2)))
-    
-    return chunk_size
+    with Dataset(wrfout_file, 'r') as ncfile:
+        lats, lons = to_np(getvar(ncfile, "lat")), to_np(getvar(ncfile, "lon"))
+
+    window = locate_window(lats, lons, subdomain)
 
+    j0, j1, i0, i1 = window
+    print(f"Extracting the subdomain south_north {j0}:{j1}, west_east {i0}:{i1} "
+          f"({j1 - j0}x{i1 - i0} of the {lats.shape[0]}x{lats.shape[1]} grid)")
 
-def process_timestep_chunks(wrfout_file, variables, heights, time_chunks, include_surface=True, max_workers=None):
+    return window
+
+
+def plan_concatenation(wrfout_files, mode, output_folder, output_prefix='extracted_'):
     """
-    Process chunks of time steps for efficient parallelization.
-    
+    Group the time steps of a series of wrfout files into concatenated outputs.
+
+    Time steps are ordered by time; a time step that appears in several files
+    (the overlap of restart runs) is taken from the first file only.
+
     Parameters:
     -----------
-    wrfout_file : str
-        Path to WRF output file
-    variables : list
-        List of variable names to extract
-    heights : list
-        List of heights in meters to extract variables at
-    time_chunks : list
-        List of lists of time indices to process in chunks
-    include_surface : bool
-        Whether to include surface level values
-    max_workers : int
-        Maximum number of worker processes to use
-        
+    wrfout_files : list
+        Paths to the WRF output files of one domain
+    mode : str
+        'month' for one output per calendar month (UTC) or 'run' for a
+        single output covering all files
+    output_folder : str
+        Folder for output files
+    output_prefix : str
+        Prefix for output files
+
     Returns:
     --------
-    dict:
-        Dictionary of results with structure {var_name: {time_idx: result_dict}}
+    list:
+        One dict per output with 'output_file', 'times' (time stamps in time
+        order) and 'segments', a list of {'wrfout_file', 'time_indices',
+        'output_indices'} giving the time steps each input contributes
     """
-    # Get dimensions once to avoid opening the file repeatedly
-    with Dataset(wrfout_file, 'r') as ncfile:
-        lats, lons = getvar(ncfile, "lat"), getvar(ncfile, "lon")
-        shape = (lats.shape[0], lats.shape[1])
-    
-    # Results storage
-    all_results = {var: {} for var in variables}
-    
-    # Set up progress reporting
-    total_tasks = sum(len(chunk) for chunk in time_chunks) * len(variables)
-    completed_tasks = 0
-    start_time = time.time()
-    
-    # Process each chunk of time steps
-    for chunk_idx, time_chunk in enumerate(time_chunks):
-        print(f"Processing chunk {chunk_idx+1}/{len(time_chunks)} ({len(time_chunk)} time steps)")
-        
-        # Create task arguments
-        tasks = []
-        for t_idx in time_chunk:
-            for var_name in variables:
-                tasks.append((wrfout_file, var_name, t_idx, heights, include_surface, shape))
-        
-        # Process tasks in parallel
-        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            future_to_task = {executor.submit(process_variable_at_time, task): task for task in tasks}
-            
-            # Process results as they complete
-            for future in concurrent.futures.as_completed(future_to_task):
-                try:
-                    var_name, t_idx, result = future.result()
-                    if result is not None:
-                        all_results[var_name][t_idx] = result
-                    
-                    # Update progress
-                    completed_tasks += 1
-                    if completed_tasks % max(1, total_tasks // 100) == 0:
-                        elapsed = time.time() - start_time
-                        progress = completed_tasks / total_tasks * 100
-                        est_total = elapsed / (completed_tasks / total_tasks)
-                        remaining = est_total - elapsed
-                        memory_usage_mb = get_memory_usage()
-                        
-                        print(f"Progress: {progress:.1f}% ({completed_tasks}/{total_tasks}), "
-                              f"Memory: {memory_usage_mb:.1f} MB, "
-                              f"Est. remaining: {remaining:.1f}s")
-                        
-                except Exception as e:
-                    print(f"Error in task processing: {e}")
-        
-        # Explicitly trigger garbage collection after each chunk
-        import gc
-        gc.collect()
-    
-    return all_results
+    if mode not in CONCATENATE_MODES:
+        raise ValueError(f"Concatenation mode must be one of {', '.join(CONCATENATE_MODES)}")
+
+    # Collect (time, file, time index) of every time step of the series
+    steps = []
+    for file_idx, wrfout_file in enumerate(wrfout_files):
+        with Dataset(wrfout_file, 'r') as ncfile:
+            times = to_np(getvar(ncfile, "times", timeidx=ALL_TIMES))
+        for t_idx, t in enumerate(np.atleast_1d(times)):
+            key = str(t)[:19].replace('_', 'T')
+            steps.append((key, file_idx, t_idx, t))
+
+    # Order by time, keeping the first file of duplicated time steps
+    steps.sort(key=lambda step: (step[0], step[1]))
+    unique_steps = []
+    for step in steps:
+        if unique_steps and unique_steps[-1][0] == step[0]:
+            continue
+        unique_steps.append(step)
+
+    n_duplicates = len(steps) - len(unique_steps)
+    if n_duplicates:
+        print(f"Skipping {n_duplicates} duplicated time steps of overlapping files")
+
+    groups = {}
+    for step in unique_steps:
+        group_key = step[0][:7] if mode == 'month' else 'run'
+        groups.setdefault(group_key, []).append(step)
+
+    domain = os.path.basename(wrfout_files[0]).replace('.nc', '').replace('wrfout_', '').split('_')[0]
+
+    plan = []
+    for group_key, group_steps in groups.items():
+        if mode == 'month':
+            label = group_key
+        else:
+            label = f"{group_steps[0][0][:10]}_{group_steps[-1][0][:10]}"
 
+        segments = {}
+        for out_idx, (_, file_idx, t_idx, _) in enumerate(group_steps):
+            segment = segments.setdefault(file_idx, {'wrfout_file': wrfout_files[file_idx],
+                                                     'time_indices': [], 'output_indices': []})
+            segment['time_indices'].append(t_idx)
+            segment['output_indices'].append(out_idx)
 
-def extract_variables_at_heights(wrfout_file, variables, heights, output_file, n_processes=None, include_surface=True):
+        plan.append({
+            'output_file': os.path.join(output_folder, f'{output_prefix}{domain}_{label}.nc'),
+            'times': [step[3] for step in group_steps],
+            'segments': [segments[file_idx] for file_idx in sorted(segments)],
+        })
+
+    return plan
+
+
+def extract_variables_at_heights(wrfout_file, variables, heights, output_file, n_processes=None, include_surface=True,
+                                 encoding=None, scheduler=None, stations=None, point_method='nearest',
+                                 subdomain=None, vertical_coordinate='height_agl', diagnostics=None, profile=False):
     """
     Extract WRF variables at specific heights and surface level, saving to a netCDF file.
     Uses parallel processing for improved performance.
 
+    The target levels may also be heights above sea level, pressure levels
+    or model levels (see vertical_coordinate).
+
     Parameters:
     -----------
     wrfout_file : str
@@ -390,7 +2989,8 @@ def extract_variables_at_heights(wrfout_file, variables, heights, output_file, n
     variables : list
         List of variable names to extract (e.g., ["ua", "va", "tc", "rh"])
     heights : list
-        List of heights in meters to extract variables at
+        List of heights in meters to extract variables at (pressures in hPa
+        or bottom_top indices for the other vertical coordinates)
     output_file : str
         Path to the output netCDF file
     n_processes : int, optional
@@ -398,237 +2998,82 @@ def extract_variables_at_heights(wrfout_file, variables, heights, output_file, n
         which uses the number of available CPU cores minus 1.
     include_surface : bool, optional
         Whether to include surface (ground level) data. Default is True.
+    encoding : dict, optional
+        Output dtype, quantization, chunking and compression of the extracted
+        variables (see DEFAULT_ENCODING). Default is f8 with zlib level 1.
+    scheduler : ExtractionScheduler, optional
+        Existing scheduler whose worker pool should be reused. If None, a
+        temporary pool with n_processes workers is created.
+    stations : str or list, optional
+        Station CSV file or list of stations (see load_stations). If given,
+        only station time series are extracted instead of full fields.
+    point_method : str, optional
+        Horizontal sampling at the stations, 'nearest' or 'bilinear'
+    subdomain : dict, optional
+        Only extract a part of the grid given as 'bbox' ([lat_min, lat_max,
+        lon_min, lon_max]) or 'window' ([j0, j1, i0, i1]). Ignored in point mode.
+    vertical_coordinate : str, optional
+        'height_agl' (default), 'height_msl', 'pressure' or 'model_level'
+    diagnostics : dict, optional
+        Daily diagnostics (MDA8, daily maximum, AOT40) to derive while
+        extracting (see DEFAULT_DIAGNOSTICS). Default is None (hourly only).
+    profile : bool, optional
+        Write a JSON profiling report with per-stage and per-variable times,
+        bytes read and written and worker peak memory next to the output file.
 
     Returns:
     --------
-    None
+    bool:
+        True if every time step was extracted and written without errors
     """
-    start_time = time.time()
     print(f"Opening WRF output file: {wrfout_file}")
 
-    if n_processes is None:
+    if scheduler is None and n_processes is None:
         n_processes = max(1, mp.cpu_count() - 1)
-    print(f"Using up to {n_processes} processes for parallel extraction")
+    print(f"Using up to {scheduler.max_workers if scheduler else n_processes} processes for parallel extraction")
     print(f"Including surface level: {include_surface}")
 
-    try:
-        # Open the WRF output file to get dimensions and create output file
-        with Dataset(wrfout_file, 'r') as ncfile:
-            # Verify dates without modifying them
-            verify_wrf_times(ncfile)
-
-            # Get time, latitude, and longitude
-            times = getvar(ncfile, "times", timeidx=ALL_TIMES)
-            lats, lons = getvar(ncfile, "lat"), getvar(ncfile, "lon")
-
-            # Get shape for pre-allocation
-            shape = (lats.shape[0], lats.shape[1])
-            n_times = len(times)
-
-            # Get height info to be used by all processes
-            time_values = to_np(times)
-            lat_values = to_np(lats)
-            lon_values = to_np(lons)
-
-            # Try to get time units and calendar for proper time representation
-            if hasattr(times, 'units'):
-                time_units = times.units
-            else:
-                time_units = 'hours since 1900-01-01 00:00:00'
-
-            if hasattr(times, 'calendar'):
-                calendar = times.calendar
-            else:
-                calendar = 'standard'
-
-        # Create output file with dimensions
-        with Dataset(output_file, 'w', format='NETCDF4') as outfile:
-            # Set up dimensions in the output file
-            outfile.createDimension('time', n_times)
-            outfile.createDimension('height', len(heights))
-            outfile.createDimension('south_north', shape[0])
-            outfile.createDimension('west_east', shape[1])
-
-            # Create dimension variables
-            time_var = outfile.createVariable('time', 'f8', ('time',))
-            time_var.units = time_units
-            time_var.calendar = calendar
-            time_var.standard_name = "time"
-            time_var[:] = np.arange(n_times)  # Use simple indices to avoid date conversion issues
-
-            # Create a character array to store time strings
-            # Use a fixed-length character array instead of a string variable
-            str_len = 20  # Length to fit YYYY-MM-DD_HH:MM:SS format
-            outfile.createDimension('str_len', str_len)
-            time_str_var = outfile.createVariable('time_str', 'S1', ('time', 'str_len'))
-            time_str_var.units = "YYYY-MM-DD_HH:MM:SS format"
-            time_str_var.long_name = "Time as formatted string"
-
-            # Fill the character array
-            for i, t in enumerate(time_values):
-                t_str = str(t)
-                for j, c in enumerate(t_str[:str_len]):
-                    time_str_var[i, j] = c
-
-            height_var = outfile.createVariable('height', 'f8', ('height',))
-            height_var.units = 'meters'
-            height_var.description = 'Heights above ground level'
-            height_var[:] = heights
-
-            lat_var = outfile.createVariable('lat', 'f8', ('south_north', 'west_east'))
-            lat_var.units = 'degrees_north'
-            lat_var.description = 'latitude'
-            lat_var[:] = lat_values
-
-            lon_var = outfile.createVariable('lon', 'f8', ('south_north', 'west_east'))
-            lon_var.units = 'degrees_east'
-            lon_var.description = 'longitude'
-            lon_var[:] = lon_values
-
-        # Determine optimal chunk size based on memory constraints
-        chunk_size = adaptive_chunk_size(n_times, len(variables))
-        print(f"Processing in chunks of {chunk_size} time steps")
-        
-        # Create time chunks
-        time_indices = list(range(n_times))
-        time_chunks = [time_indices[i:i+chunk_size] for i in range(0, n_times, chunk_size)]
-        
-        # Process all chunks
-        all_results = process_timestep_chunks(
-            wrfout_file, 
-            variables, 
-            heights, 
-            time_chunks,
-            include_surface,
-            max_workers=n_processes
-        )
-        
-        # Now write the results to the output file
-        with Dataset(output_file, 'a') as outfile:
-            # Determine all found variables
-            found_variables = [var for var in variables if all_results[var]]
-            
-            if not found_variables:
-                print("Warning: No variables were successfully processed!")
-                return
-            
-            print(f"Writing {len(found_variables)} variables to output file")
-            
-            # Create netCDF variables and write data incrementally
-            var_dims = ('time', 'height', 'south_north', 'west_east')
-            surface_dims = ('time', 'south_north', 'west_east')
-            
-            # Create all variables first
-            nc_vars = {}
-            nc_surf_vars = {}
-            
-            for var_name in found_variables:
-                # Get attributes from the first available time step
-                var_attrs = None
-                for t_result in all_results[var_name].values():
-                    if t_result and 'attrs' in t_result:
-                        var_attrs = t_result['attrs']
-                        break
-                
-                if var_attrs is None:
-                    print(f"Warning: Could not find attributes for {var_name}, skipping")
-                    continue
-                
-                print(f"Creating output variable: {var_name}")
-                
-                # Create main variable
-                nc_var = outfile.createVariable(var_name, 'f8', var_dims,
-                                              zlib=True, complevel=1)
-                
-                # Copy attributes
-                for attr_name, attr_value in var_attrs.items():
-                    try:
-                        setattr(nc_var, attr_name, attr_value)
-                    except Exception as e:
-                        print(f"Warning: Couldn't set attribute {attr_name} for {var_name}: {e}")
-                
-                nc_vars[var_name] = nc_var
-                
-                # Create surface variable if needed
-                if include_surface:
-                    surf_var_name = f"{var_name}_surface"
-                    surf_var = outfile.createVariable(surf_var_name, 'f8', surface_dims,
-                                                     zlib=True, complevel=1)
-                    
-                    # Copy attributes
-                    for attr_name, attr_value in var_attrs.items():
-                        try:
-                            setattr(surf_var, attr_name, attr_value)
-                        except Exception as e:
-                            print(f"Warning: Couldn't set attribute {attr_name} for {surf_var_name}: {e}")
-                    
-                    # Add surface-specific attributes
-                    surf_var.description = f"Surface level values for {var_name}"
-                    
-                    nc_surf_vars[var_name] = surf_var
-            
-            # Write data for each time step
-            for t_idx in range(n_times):
-                for var_name in found_variables:
-                    if t_idx in all_results[var_name]:
-                        var_result = all_results[var_name][t_idx]
-                        if var_result:
-                            # Write main variable data
-                            nc_vars[var_name][t_idx] = var_result['data']
-                            
-                            # Write surface data if available
-                            if include_surface and var_name in nc_surf_vars and var_result['surface'] is not None:
-                                nc_surf_vars[var_name][t_idx] = var_result['surface']
-            
-            # Release memory as we go
-            all_results = None
-
-        elapsed_time = time.time() - start_time
-        print(f"Extraction completed in {elapsed_time:.2f} seconds")
-        print(f"Output saved to: {output_file}")
-
-    except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
+    # Validate the encoding before any work is done
+    encoding = resolve_encoding(encoding)
+    if vertical_coordinate not in VERTICAL_COORDINATES:
+        raise ValueError(f"Vertical coordinate must be one of {', '.join(VERTICAL_COORDINATES)}")
+
+    task = {
+        'wrfout_file': wrfout_file,
+        'variables': variables,
+        'heights': heights,
+        'output_file': output_file,
+        'include_surface': include_surface,
+        'encoding': encoding,
+        'vertical_coordinate': vertical_coordinate,
+        'diagnostics': resolve_diagnostics(diagnostics) if diagnostics is not None else None,
+    }
+    if stations is not None:
+        task['points'] = prepare_points(wrfout_file, stations, point_method)
+    elif subdomain is not None:
+        task['window'] = prepare_window(wrfout_file, subdomain)
+
+    if scheduler is not None:
+        (_, _, success), = scheduler.run([task])
+    else:
+        with ExtractionScheduler(max_workers=n_processes, profile=profile) as scheduler:
+            (_, _, success), = scheduler.run([task])
 
+    if profile and not scheduler.profile and scheduler.output_profiles:
+        report_file = f"{os.path.splitext(output_file)[0]}.profile.json"
+        write_profile(report_file, scheduler.output_profiles[-1])
+        print(f"Profile saved to: {report_file}")
 
-def process_file_wrapper(args):
-    """
-    Wrapper function for processing a single file in parallel.
-    
-    Parameters:
-    -----------
-    args : tuple
-        (i, total_files, wrfout_file, variables, heights, output_file, n_processes, include_surface)
-    
-    Returns:
-    --------
-    tuple:
-        (wrfout_file, output_file, success)
-    """
-    i, total_files, wrfout_file, variables, heights, output_file, n_processes, include_surface = args
-    
-    try:
-        print(f"\nProcessing file {i+1}/{total_files}: {wrfout_file}")
-        extract_variables_at_heights(
-            wrfout_file, 
-            variables, 
-            heights, 
-            output_file, 
-            n_processes, 
-            include_surface
-        )
-        return (wrfout_file, output_file, True)
-    except Exception as e:
-        print(f"Error processing file {wrfout_file}: {e}")
-        return (wrfout_file, output_file, False)
+    return success
 
 
 def process_all_wrfout_files(config):
     """
     Process all wrfout files based on the provided configuration.
+
+    All files share one worker pool of at most `processes` workers; with
+    `process_files_parallel`, time steps of up to `max_parallel_files` files
+    are interleaved on that pool.
     
     Parameters:
     -----------
@@ -647,10 +3092,23 @@ def process_all_wrfout_files(config):
     heights = config['heights']
     include_surface = config['options']['include_surface']
     n_processes = config['options']['processes']
+    vertical_coordinate = config['options'].get('vertical_coordinate', 'height_agl')
+    diagnostics = config.get('diagnostics')
+    encoding = config['output'].get('encoding')
+    concatenate = config['output'].get('concatenate')
+    points_config = config.get('points')
+    subdomain = config.get('subdomain')
     
-    # New option for parallel file processing
+    # Option for interleaving several files on the shared pool
     process_files_parallel = config['options'].get('process_files_parallel', False)
     max_parallel_files = config['options'].get('max_parallel_files', 1)
+    if not process_files_parallel:
+        max_parallel_files = 1
+    
+    # Options for skipping finished outputs and resuming interrupted runs
+    resume = config['options'].get('resume', False)
+    profile = config['options'].get('profile', False)
+    manifest_path = config['options'].get('manifest') or os.path.join(output_folder, MANIFEST_NAME)
     
     # Ensure output folder exists
     os.makedirs(output_folder, exist_ok=True)
@@ -665,47 +3123,103 @@ def process_all_wrfout_files(config):
     
     print(f"Found {len(wrfout_files)} files to process")
     
-    # Prepare file processing arguments
-    file_args = []
-    for i, wrfout_file in enumerate(wrfout_files):
-        # Generate output filename
-        base_name = os.path.basename(wrfout_file).replace('.nc', '').replace('wrfout_', '')
-        output_file = os.path.join(output_folder, f'{output_prefix}{base_name}.nc')
-        
-        # Add to args list
-        file_args.append((
-            i, 
-            len(wrfout_files), 
-            wrfout_file, 
-            variables, 
-            heights, 
-            output_file, 
-            n_processes, 
-            include_surface
-        ))
+    # Locate the stations or the subdomain once; all files of the batch share the grid
+    points = None
+    window = None
+    try:
+        if points_config:
+            if subdomain:
+                print("Warning: The subdomain is ignored in point mode")
+            points = prepare_points(wrfout_files[0], points_config['stations'], points_config['method'])
+        elif subdomain:
+            window = prepare_window(wrfout_files[0], subdomain)
+    except Exception as e:
+        print(f"Error locating the extraction region: {e}")
+        return
     
-    # Process files
-    if process_files_parallel and max_parallel_files > 1:
-        # Process multiple files in parallel
-        print(f"Processing up to {max_parallel_files} files in parallel")
-        
-        successful_files = 0
-        failed_files = 0
-        
-        with concurrent.futures.ProcessPoolExecutor(max_workers=max_parallel_files) as executor:
-            for wrfout_file, output_file, success in executor.map(process_file_wrapper, file_args):
-                if success:
-                    successful_files += 1
-                    print(f"Successfully processed: {wrfout_file} -> {output_file}")
-                else:
-                    failed_files += 1
-                    print(f"Failed to process: {wrfout_file}")
-        
-        print(f"Processing complete: {successful_files} successful, {failed_files} failed")
+    # Settings shared by every output
+    settings = {
+        'variables': variables,
+        'heights': heights,
+        'include_surface': include_surface,
+        'encoding': encoding,
+        'window': window,
+        'points': points,
+        'vertical_coordinate': vertical_coordinate,
+        'diagnostics': diagnostics,
+    }
+    
+    # Prepare file processing tasks
+    file_tasks = []
+    if concatenate:
+        try:
+            plan = plan_concatenation(wrfout_files, concatenate, output_folder, output_prefix)
+        except Exception as e:
+            print(f"Error reading the time steps of the input files: {e}")
+            return
+        print(f"Concatenating the time steps into {len(plan)} output files ({concatenate})")
+        for group in plan:
+            file_tasks.append(dict(settings, **group))
     else:
-        # Process files sequentially
-        for args in file_args:
-            process_file_wrapper(args)
+        for wrfout_file in wrfout_files:
+            # Generate output filename
+            base_name = os.path.basename(wrfout_file).replace('.nc', '').replace('wrfout_', '')
+            output_file = os.path.join(output_folder, f'{output_prefix}{base_name}.nc')
+            
+            file_tasks.append(dict(settings, wrfout_file=wrfout_file, output_file=output_file))
+    
+    # Limit the core budget to the number of workers that fit into memory
+    if n_processes is None:
+        n_processes = max(1, mp.cpu_count() - 1)
+    try:
+        dims = domain_dimensions(wrfout_files[0])
+        read_shape = dims['shape']
+        read_bounds = points['window'] if points is not None else window
+        if read_bounds is not None:
+            j0, j1, i0, i1 = read_bounds
+            read_shape = (j1 - j0, i1 - i0)
+        task_memory_mb = estimate_task_memory_mb(len(variables), len(heights), dims['n_levels'], read_shape)
+        max_workers = memory_limited_workers(n_processes, task_memory_mb)
+        if max_workers < n_processes:
+            print(f"Reducing workers from {n_processes} to {max_workers} "
+                  f"to fit {task_memory_mb:.0f} MB per worker into memory")
+        n_processes = max_workers
+    except Exception as e:
+        print(f"Warning: Could not estimate memory use from {wrfout_files[0]}: {e}")
+    
+    manifest = None
+    if resume:
+        manifest = Manifest(manifest_path)
+        print(f"Resume mode: recording progress in {manifest_path}")
+    
+    # Process all files on one long-lived worker pool
+    with ExtractionScheduler(max_workers=n_processes, max_parallel_files=max_parallel_files,
+                             profile=profile) as scheduler:
+        print(f"Using {scheduler.max_workers} worker processes, up to {scheduler.max_parallel_files} files in parallel")
+        results = scheduler.run(file_tasks, manifest)
+        batch_report = scheduler.batch_report()
+    
+    if profile:
+        report_file = os.path.join(output_folder, PROFILE_NAME)
+        try:
+            write_profile(report_file, batch_report)
+            print(f"Batch profile saved to: {report_file}")
+        except Exception as e:
+            print(f"Warning: Could not write profile {report_file}: {e}")
+    
+    successful_files = 0
+    failed_files = 0
+    for inputs, output_file, success in results:
+        if not isinstance(inputs, str):
+            inputs = f"{len(inputs)} files"
+        if success:
+            successful_files += 1
+            print(f"Successfully processed: {inputs} -> {output_file}")
+        else:
+            failed_files += 1
+            print(f"Failed to process: {inputs} -> {output_file}")
+    
+    print(f"Processing complete: {successful_files} successful, {failed_files} failed")
 
 
 def load_config(config_file):
@@ -761,6 +3275,52 @@ def load_config(config_file):
         if 'max_parallel_files' not in config['options']:
             config['options']['max_parallel_files'] = 1
             
+        if 'resume' not in config['options']:
+            config['options']['resume'] = False
+            
+        if 'manifest' not in config['options']:
+            config['options']['manifest'] = None
+            
+        if 'profile' not in config['options']:
+            config['options']['profile'] = False
+            
+        if 'vertical_coordinate' not in config['options']:
+            config['options']['vertical_coordinate'] = 'height_agl'
+        if config['options']['vertical_coordinate'] not in VERTICAL_COORDINATES:
+            raise ValueError(f"options.vertical_coordinate must be one of {', '.join(VERTICAL_COORDINATES)}")
+            
+        # Validate output encoding early so bad options fail before processing
+        config['output']['encoding'] = resolve_encoding(config['output'].get('encoding'))
+        
+        if config['output'].get('concatenate') is None:
+            config['output']['concatenate'] = None
+        elif config['output']['concatenate'] not in CONCATENATE_MODES:
+            raise ValueError(f"output.concatenate must be one of {', '.join(CONCATENATE_MODES)}")
+        
+        # Point extraction mode
+        if config.get('points'):
+            if 'stations' not in config['points']:
+                raise ValueError("Missing required configuration field: points.stations")
+            config['points'].setdefault('method', 'nearest')
+            if config['points']['method'] not in POINT_METHODS:
+                raise ValueError(f"points.method must be one of {', '.join(POINT_METHODS)}")
+        else:
+            config['points'] = None
+        
+        # Daily diagnostics stage
+        if config.get('diagnostics'):
+            config['diagnostics'] = resolve_diagnostics(config['diagnostics'])
+        else:
+            config['diagnostics'] = None
+        
+        # Subdomain cropping
+        subdomain = config.get('subdomain')
+        if subdomain:
+            if subdomain.get('bbox') is None and subdomain.get('window') is None:
+                raise ValueError("The subdomain needs either a bbox or a window")
+        else:
+            config['subdomain'] = None
+            
         return config
         
     except Exception as e:
@@ -784,14 +3344,65 @@ def main():
     parser.add_argument('--output-folder', help='Folder for output files')
     parser.add_argument('--output-prefix', default='extracted_', help='Prefix for output files')
     parser.add_argument('--vars', '-v', nargs='+', help='Variables to extract (e.g., ua va tc rh)')
-    parser.add_argument('--heights', '-z', nargs='+', type=float, help='Heights in meters to extract variables at')
-    parser.add_argument('--processes', '-p', type=int, default=None, help='Number of processes to use (default: CPU count - 1)')
+    parser.add_argument('--heights', '-z', nargs='+', type=float,
+                        help='Heights in meters to extract variables at (hPa or level indices, see --vertical-coordinate)')
+    parser.add_argument('--vertical-coordinate', choices=list(VERTICAL_COORDINATES), default='height_agl',
+                        help='Vertical coordinate of --heights')
+    parser.add_argument('--processes', '-p', type=int, default=None, help='Total number of worker processes for all files (default: CPU count - 1)')
     parser.add_argument('--no-surface', action='store_true', help='Skip extraction of surface (ground level) data')
     parser.add_argument('--parallel-files', action='store_true', help='Process multiple files in parallel')
     parser.add_argument('--max-parallel-files', type=int, default=1, help='Maximum number of files to process in parallel')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip up-to-date outputs and resume partial ones using a manifest in the output folder')
+    parser.add_argument('--dtype', choices=['f4', 'f8'], default='f8', help='Output data type of extracted variables')
+    parser.add_argument('--least-significant-digit', type=int, default=None,
+                        help='Quantize output to this many decimal digits (lossy, improves compression)')
+    parser.add_argument('--chunking', choices=['timeseries', 'map'], default=None,
+                        help='Chunk layout tuned for point time series or for 2D map access')
+    parser.add_argument('--compression', default='zlib', help="Compressor for output variables (e.g. zlib, zstd, none)")
+    parser.add_argument('--complevel', type=int, default=1, help='Compression level')
+    parser.add_argument('--stations', help='CSV file with name, lat and lon columns; extract station time series only')
+    parser.add_argument('--point-method', choices=list(POINT_METHODS), default='nearest',
+                        help='Horizontal sampling at the stations')
+    parser.add_argument('--diagnostics', nargs='+', choices=list(DIAGNOSTIC_PRODUCTS),
+                        help='Daily diagnostics to derive from the surface values while extracting')
+    parser.add_argument('--diagnostics-only', action='store_true',
+                        help='Write only the daily diagnostics, not the hourly fields')
+    parser.add_argument('--utc-offset', type=float, default=0,
+                        help='Hours added to model time (UTC) to define days for the diagnostics')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='Only extract grid cells inside this latitude/longitude box')
+    parser.add_argument('--window', nargs=4, type=int, metavar=('J0', 'J1', 'I0', 'I1'),
+                        help='Only extract the south_north range J0:J1 and west_east range I0:I1')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write JSON reports with stage timings, bytes moved and worker peak memory')
+    parser.add_argument('--concatenate', choices=list(CONCATENATE_MODES), default=None,
+                        help='Concatenate the time steps of all input files into one output per month or per run')
 
     args = parser.parse_args()
     
+    if args.bbox and args.window:
+        parser.error("Use either --bbox or --window, not both")
+    diagnostics = None
+    if args.diagnostics:
+        diagnostics = {'products': args.diagnostics, 'hourly': not args.diagnostics_only,
+                       'utc_offset': args.utc_offset}
+    
+    subdomain = None
+    if args.bbox:
+        subdomain = {'bbox': args.bbox}
+    elif args.window:
+        subdomain = {'window': args.window}
+    
+    # Output encoding from command line arguments (ignored when a config file is used)
+    encoding = {
+        'dtype': args.dtype,
+        'least_significant_digit': args.least_significant_digit,
+        'chunking': args.chunking,
+        'compression': args.compression,
+        'complevel': args.complevel
+    }
+    
     # Check if config file is provided
     if args.config:
         config = load_config(args.config)
@@ -818,22 +3429,33 @@ def main():
         print("======================")
         print(f"Input file:  {args.wrfout_file}")
         print(f"Variables:   {', '.join(args.vars)}")
-        print(f"Heights (m): {', '.join(map(str, args.heights))}")
+        print(f"Levels ({args.vertical_coordinate}): {', '.join(map(str, args.heights))}")
         print(f"Include surface: {not args.no_surface}")
+        if args.stations:
+            print(f"Stations:    {args.stations} ({args.point_method})")
+        elif subdomain:
+            print(f"Subdomain:   {subdomain}")
         print(f"Output file: {output_file}")
         print(f"Processes:   {args.processes or 'auto'}")
         print("======================\n")
         
         # Perform the extraction
-        extract_variables_at_heights(
+        success = extract_variables_at_heights(
             args.wrfout_file,
             args.vars,
             args.heights,
             output_file,
             args.processes,
-            include_surface=not args.no_surface
+            include_surface=not args.no_surface,
+            encoding=encoding,
+            stations=args.stations,
+            point_method=args.point_method,
+            subdomain=subdomain,
+            vertical_coordinate=args.vertical_coordinate,
+            diagnostics=diagnostics,
+            profile=args.profile
         )
-        return 0
+        return 0 if success else 1
         
     # Process multiple files based on command line arguments
     if args.input_folder:
@@ -848,15 +3470,24 @@ def main():
             },
             'output': {
                 'folder': args.output_folder,
-                'prefix': args.output_prefix or 'extracted_'
+                'prefix': args.output_prefix or 'extracted_',
+                'encoding': encoding,
+                'concatenate': args.concatenate
             },
             'variables': args.vars,
             'heights': args.heights,
+            'points': {'stations': args.stations, 'method': args.point_method} if args.stations else None,
+            'subdomain': subdomain,
+            'diagnostics': diagnostics,
             'options': {
                 'include_surface': not args.no_surface,
                 'processes': args.processes,
                 'process_files_parallel': args.parallel_files,
-                'max_parallel_files': args.max_parallel_files
+                'max_parallel_files': args.max_parallel_files,
+                'resume': args.resume,
+                'manifest': None,
+                'profile': args.profile,
+                'vertical_coordinate': args.vertical_coordinate
             }
         }
         